@@ -0,0 +1,104 @@
+# atomic_save.py
+# Crash-safe, streaming file saves.
+#
+# A save never rewrites the document in place. The text is streamed in
+# bounded chunks into a temp file in the same folder, which is fsynced and
+# then renamed over the original in one atomic step. A crash at any point
+# leaves either the old file or the new one on disk, never a mix, and no
+# second in-memory copy of the document is built along the way.
+
+import os
+import tempfile
+
+from piece_table import PieceTable
+
+# Rows joined into one write when streaming a list-of-lines buffer.
+ROWS_PER_WRITE = 4096
+
+
+def atomic_write(path, chunks, binary=False, before_replace=None):
+    """
+    Stream chunks into a temp file next to path, then atomically replace path.
+
+    binary:         chunks are bytes (else str, written in text mode)
+    before_replace: called after the data is safely on disk but before the
+                    rename, e.g. to release a mapping of the old file
+    """
+    path = os.path.abspath(path)
+    folder = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=".%s." % os.path.basename(path),
+                               suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if binary else "w") as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Keep the permissions of the file being replaced; a new file gets
+        # the usual 0o666 less the umask, like open() would give it.
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        try:
+            os.chmod(tmp, mode)
+        except OSError:
+            pass
+
+        if before_replace is not None:
+            before_replace()
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+    _sync_folder(folder)
+
+
+def _sync_folder(folder):
+    """Make the rename itself durable (POSIX only)."""
+    if os.name == "nt":
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def text_chunks(buffer):
+    """
+    Stream a list-of-lines buffer or PieceTable as text, each row
+    followed by '\\n', in chunks of bounded size.
+    """
+    if isinstance(buffer, PieceTable):
+        yield from buffer.chunks()
+        yield "\n"
+        return
+
+    batch = []
+    for line in buffer:
+        batch.append(line if isinstance(line, str) else "".join(line))
+        if len(batch) == ROWS_PER_WRITE:
+            batch.append("")
+            yield "\n".join(batch)
+            batch = []
+    if batch:
+        batch.append("")
+        yield "\n".join(batch)
+
+
+def save_buffer(buffer, path):
+    """Save any buffer engine to path atomically."""
+    if isinstance(buffer, (list, PieceTable)):
+        atomic_write(path, text_chunks(buffer))
+    else:
+        # File-backed engines (MappedLines) save themselves: they copy
+        # untouched byte ranges straight from the old file and re-map.
+        buffer.save(path)
@@ -0,0 +1,326 @@
+# bench.py
+# Benchmarks for the editor's hot paths.
+#
+# Each benchmark loads a synthetic corpus through buffer_op.load_file() and
+# times one operation: a burst of apply_op() edits, undo/redo of that burst,
+# search_all(), a replace-all op, load_file() itself, saving, and drawing
+# the viewport: buffer_rows()/search_rows() build the frames render() sends
+# to the terminal, and the print_* cases also print them into an in-memory
+# stdout. Every case runs once under tracemalloc for its peak memory and
+# then `repeat` times untraced; the best time is reported.
+#
+#   python bench.py                          # 1K and 100K lines
+#   python bench.py --sizes 1000,10000000    # up to 10M lines (slow)
+#   python bench.py --save-baseline          # record bench_baseline.json
+#   python bench.py --threshold 0.25         # fail if >25% slower than baseline
+#
+# Results are compared against the baseline file when it exists; the exit
+# status is 1 if any case got slower than the threshold allows.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import atomic_save
+import buffer_op
+import main
+
+BASELINE_FILE = "bench_baseline.json"
+
+# Allowed slowdown against the baseline before a case counts as a regression.
+THRESHOLD = 0.25
+
+# Edits applied by the apply_op and undo/redo cases.
+EDIT_OPS = 10000
+
+# Frames drawn by the rendering cases.
+FRAMES = 200
+
+
+# ---- corpora ----
+
+def plain_line(i):
+    return "line %d: the quick brown fox jumps over the lazy dog" % i
+
+
+def long_line(i):
+    return ("%d the quick brown fox jumps over the lazy dog " % i) * 180
+
+
+def match_line(i):
+    return "ab " * 25
+
+
+# name -> (rows for a given size, row generator, search pattern)
+CORPORA = {
+    "plain": (lambda size: size, plain_line, "fox"),
+    # ~8 KB lines; a hundredth of the rows keeps the file size comparable.
+    "long": (lambda size: max(size // 100, 1), long_line, "fox"),
+    # 25 matches on every row.
+    "matches": (lambda size: size, match_line, "ab"),
+}
+
+
+def write_corpus(folder, kind, size):
+    """Write the corpus file once and return its path."""
+    rows, make_line, _ = CORPORA[kind]
+    path = os.path.join(folder, "%s-%d.txt" % (kind, size))
+    if not os.path.exists(path):
+        with open(path, "w", encoding="utf-8") as f:
+            batch = []
+            for i in range(rows(size)):
+                batch.append(make_line(i))
+                if len(batch) == 4096:
+                    batch.append("")
+                    f.write("\n".join(batch))
+                    batch = []
+            if batch:
+                batch.append("")
+                f.write("\n".join(batch))
+    return path
+
+
+# ---- cases ----
+#
+# A case takes (path, pattern, engine), does its setup, and returns the
+# zero-argument function to time.
+
+def load(path, engine):
+    buffer_op.release_buffer()
+    buffer_op.load_file(path, engine)
+
+
+def edit_ops():
+    """EDIT_OPS single-char inserts spread over the buffer."""
+    step = max(len(buffer_op.buffer) // EDIT_OPS, 1)
+    ops = []
+    for i in range(EDIT_OPS):
+        row = (i * step) % len(buffer_op.buffer)
+        ops.append({"kind": "insert_char", "row": row, "col": 0, "ch": "x"})
+    return ops
+
+
+def case_load_file(path, pattern, engine):
+    buffer_op.release_buffer()
+    buffer_op.clear_buffer()
+    return lambda: buffer_op.load_file(path, engine)
+
+
+def case_apply_op(path, pattern, engine):
+    load(path, engine)
+    ops = edit_ops()
+
+    def run():
+        for op in ops:
+            buffer_op.apply_op(op, record_history=True)
+    return run
+
+
+def case_undo_redo(path, pattern, engine):
+    load(path, engine)
+    for op in edit_ops():
+        buffer_op.apply_op(op, record_history=True)
+
+    def run():
+        while buffer_op.undo_stack:
+            buffer_op.undo()
+        while buffer_op.redo_stack:
+            buffer_op.redo()
+    return run
+
+
+def case_search_all(path, pattern, engine):
+    load(path, engine)
+    return lambda: buffer_op.search_all(pattern)
+
+
+def case_replace_all(path, pattern, engine):
+    load(path, engine)
+    op = {"kind": "replace", "search": pattern, "replace": pattern.upper()}
+    return lambda: buffer_op.apply_op(op, record_history=True)
+
+
+def case_save(path, pattern, engine):
+    load(path, engine)
+    # Touch one row so a mapped buffer really has to write.
+    buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 0, "ch": "x"})
+    target = path + ".saved"
+    return lambda: atomic_save.save_buffer(buffer_op.buffer, target)
+
+
+def scroll_to_middle():
+    buffer_op.top_line = max(len(buffer_op.buffer) // 2 - buffer_op.MAX_LINE, 0)
+    buffer_op.row = buffer_op.top_line
+
+
+def case_print_buffer(path, pattern, engine):
+    load(path, engine)
+    scroll_to_middle()
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(FRAMES):
+                main.print_buffer()
+    return run
+
+
+def case_print_search_buffer(path, pattern, engine):
+    load(path, engine)
+    buffer_op.search_all(pattern)
+    scroll_to_middle()
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(FRAMES):
+                for line in main.search_rows():
+                    print(line)
+    return run
+
+
+def case_buffer_rows(path, pattern, engine):
+    load(path, engine)
+    scroll_to_middle()
+
+    def run():
+        for _ in range(FRAMES):
+            main.buffer_rows()
+    return run
+
+
+def case_search_rows(path, pattern, engine):
+    load(path, engine)
+    buffer_op.search_all(pattern)
+    scroll_to_middle()
+
+    def run():
+        for _ in range(FRAMES):
+            main.search_rows()
+    return run
+
+
+CASES = {
+    "load_file": case_load_file,
+    "apply_op": case_apply_op,
+    "undo_redo": case_undo_redo,
+    "search_all": case_search_all,
+    "replace_all": case_replace_all,
+    "save_file": case_save,
+    "print_buffer": case_print_buffer,
+    "print_search_buffer": case_print_search_buffer,
+    "buffer_rows": case_buffer_rows,
+    "search_rows": case_search_rows,
+}
+
+
+# ---- running ----
+
+def measure(case, path, pattern, engine, repeat):
+    """Return (best seconds, peak traced bytes) for one case."""
+    run = case(path, pattern, engine)
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = float("inf")
+    for _ in range(repeat):
+        run = case(path, pattern, engine)
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best, peak
+
+
+def run_all(sizes, corpora, cases, engine, repeat, folder):
+    """Yield (key, seconds, peak bytes) for every combination."""
+    for kind in corpora:
+        pattern = CORPORA[kind][2]
+        for size in sizes:
+            path = write_corpus(folder, kind, size)
+            for name in cases:
+                seconds, peak = measure(CASES[name], path, pattern, engine, repeat)
+                yield "%s/%s/%d" % (name, kind, size), seconds, peak
+    buffer_op.release_buffer()
+    buffer_op.clear_buffer()
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def compare(seconds, baseline, threshold):
+    """Verdict column for one result: '', 'ok', 'SLOWER' or 'faster'."""
+    if not baseline:
+        return ""
+    ratio = seconds / baseline
+    if ratio > 1 + threshold:
+        return "SLOWER x%.2f" % ratio
+    if ratio < 1 - threshold:
+        return "faster x%.2f" % ratio
+    return "ok x%.2f" % ratio
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the editor's hot paths.")
+    parser.add_argument("--sizes", default="1000,100000",
+                        help="comma separated corpus sizes in lines")
+    parser.add_argument("--corpora", default=",".join(CORPORA),
+                        help="comma separated subset of: %s" % ", ".join(CORPORA))
+    parser.add_argument("--cases", default=",".join(CASES),
+                        help="comma separated subset of: %s" % ", ".join(CASES))
+    parser.add_argument("--engine", default="auto",
+                        help="storage engine: auto, lines, piece_table or mmap")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def main_bench(argv=None):
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    corpora = args.corpora.split(",")
+    cases = args.cases.split(",")
+    baseline = load_baseline(args.baseline)
+
+    results = {}
+    regressions = 0
+    print("%-40s %12s %12s  %s" % ("case", "seconds", "peak KB", "vs baseline"))
+    with tempfile.TemporaryDirectory() as folder:
+        for key, seconds, peak in run_all(sizes, corpora, cases, args.engine,
+                                          args.repeat, folder):
+            results[key] = seconds
+            verdict = compare(seconds, baseline.get(key), args.threshold)
+            if verdict.startswith("SLOWER"):
+                regressions += 1
+            print("%-40s %12.6f %12d  %s" % (key, seconds, peak // 1024, verdict))
+            sys.stdout.flush()
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print("baseline written to %s" % args.baseline)
+
+    if regressions:
+        print("%d case(s) slower than the baseline allows" % regressions)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_bench())
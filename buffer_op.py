@@ -4,526 +4,1234 @@
 # like splitting lines, joining lines, and replacing text.
 #
 # main.py handles UI, while this file handles the "guts" of the editor.
-
+#
+# All per-document state (buffer, cursor, viewport, undo history, search
+# matches, lock) lives on a Document object, and the editing functions are
+# its methods, so several documents can be open side by side and worked on
+# from different threads. The module-level functions and the attributes
+# buffer_op.buffer, buffer_op.row, ... act on the `current` document.
+
+import functools
+import itertools
 import keyboard
 import os
 import sys
+import threading
+import types
+from bisect import bisect_right
+
+from atomic_save import text_chunks
+import bulk_replace
+import cell_width
+from cell_width import is_plain
+import latency
+import syntax
+from mapped_file import MappedLines
+from match_index import MatchIndex
+from op_log import (DELETE_CHAR, DELETE_TEXT, INSERT_CHAR, INSERT_TEXT, JOIN_LINE,
+                    REPLACE, SPLIT_LINE, ENTRY_BYTES, Op, OpLog, as_op)
+from piece_table import PieceTable
+from text_search import find_all, line_chunks, search_chunks
+from wrap_index import WrapIndex
 
 # Keys that insert text vs keys that move the cursor.
 functional_keys_text = {"space", "backspace", "enter"}
 functional_keys_cursor = {"up", "down", "left", "right"}
 
-# Keeps a simple log of raw key events (mostly for debugging).
-history = []
-
-# The text buffer. Represented as a list of lines, where each line is a list of chars.
-buffer = [[]]
-
-# Logical cursor position in the buffer.
-row = 0
-col = 0
+# Which storage engine load_file() builds:
+#   "lines"       - list of char lists, simplest and fastest for small files
+#   "piece_table" - PieceTable, memory stays close to the file size
+#   "mmap"        - MappedLines, the file is mapped and rows decoded on demand
+#   "auto"        - piece table from PIECE_TABLE_MIN_BYTES, mmap from MMAP_MIN_BYTES
+ENGINE = "auto"
+PIECE_TABLE_MIN_BYTES = 8 * 1024 * 1024
+MMAP_MIN_BYTES = 256 * 1024 * 1024
 
-# Viewport scrolling offsets.
-top_line = 0
+# Viewport size in rows and columns.
 MAX_LINE = 24
-
-left_col = 0
 MAX_COL = 120
 
-# Undo/redo stacks storing operations dictionaries.
-undo_stack = []
-redo_stack = []
-
-# List of (row, start, end) tuples marking search matches.
-matches = []
-
-
-# ---- Basic state getters used by main.py ----
-
-def get_top_line():
-    return top_line
-
-def get_max_line():
-    return MAX_LINE
-
-def get_left_col():
-    return left_col
-
-def get_max_col():
-    return MAX_COL
-
-
-def remove_char_from_buffer(row_, col_):
-    """
-    Safely remove a character from a specific position in the buffer.
-    This helper exists because many edits need the same logic,
-    and manually slicing lists everywhere gets messy.
-    """
-    size = len(buffer[row_])
-    if col_ < 0 or col_ >= size:
-        return
-
-    temp = []
-    for i in range(size):
-        if i != col_:
-            temp.append(buffer[row_][i])
-
-    buffer[row_] = temp
-
-
-def move_cursor():
-    """
-    Convert logical cursor coordinates (row, col) into terminal coordinates,
-    considering scroll offsets, and move the real terminal cursor there.
-    """
-    screen_row = row - top_line
-    screen_col = col - left_col
-
-    screen_row = max(0, min(screen_row, MAX_LINE - 1))
-    screen_col = max(0, min(screen_col, MAX_COL - 1))
-
-    sys.stdout.write("\033[%d;%dH" % (screen_row + 1, screen_col + 1))
-    sys.stdout.flush()
-
-
-def ensure_cursor_in_bounds():
-    """
-    After any edit, make sure row/col are still valid.
-    Prevents cursor from drifting outside its line length.
-    """
-    global row, col
-
-    row = max(0, min(row, len(buffer) - 1))
-    line_len = len(buffer[row])
-
-    if col < 0:
-        col = 0
-    if col > line_len:
-        col = line_len
-
-
-def adjust_top_line():
-    """
-    Scroll the viewport vertically so the cursor stays visible.
-    """
-    global top_line
-
-    if len(buffer) <= MAX_LINE:
-        top_line = 0
-        return
-
-    if row < top_line:
-        top_line = row
-    elif row > top_line + MAX_LINE - 1:
-        top_line = row - (MAX_LINE - 1)
-
-    top_line = max(0, min(top_line, len(buffer) - MAX_LINE))
+# Soft wrap: long rows continue on the next screen lines instead of
+# scrolling sideways (see wrap_index.py). Memory-mapped files never wrap.
+WRAP = False
 
+# Undo history budget. Once either limit is passed the oldest ops are
+# dropped. Consecutive typing/backspacing is merged into one op of at
+# most COALESCE_MAX characters.
+UNDO_LIMIT_OPS = 10000
+UNDO_LIMIT_BYTES = 16 * 1024 * 1024
+COALESCE_MAX = 256
 
-def adjust_left_col():
-    """
-    Horizontal scrolling. Ensures that long lines are viewable
-    and the cursor doesn't disappear off-screen horizontally.
-    """
-    global left_col
-
-    line_len = len(buffer[row])
-    if line_len <= MAX_COL:
-        left_col = 0
-        return
+# Cost of one undo log entry besides its text, see op_log.OpLog.
+OP_OVERHEAD = ENTRY_BYTES
 
-    if col < left_col:
-        left_col = col
-    elif col >= left_col + MAX_COL:
-        left_col = col - MAX_COL + 1
 
-    left_col = max(0, min(left_col, line_len - MAX_COL))
-
-
-def handle_arrow_keys(key):
-    """
-    Arrow key navigation with sensible behavior across line boundaries.
-    """
-    global col, row
-
-    if key.name == "up":
-        if row > 0:
-            row -= 1
-            col = min(col, len(buffer[row]))
-
-    elif key.name == "down":
-        if row < len(buffer) - 1:
-            row += 1
-            col = min(col, len(buffer[row]))
-
-    elif key.name == "left":
-        if col > 0:
-            col -= 1
-        elif row > 0:
-            row -= 1
-            col = len(buffer[row])
-
-    elif key.name == "right":
-        line_len = len(buffer[row])
-        if col < line_len:
-            col += 1
-        elif row < len(buffer) - 1:
-            row += 1
-            col = 0
-
-    ensure_cursor_in_bounds()
-    adjust_top_line()
-    adjust_left_col()
+def locked(method):
+    """Run a Document method while holding that document's lock."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 def clear_screen():
-    """Simple wrapper around system CLS/clear."""
-    os.system('cls' if os.name == 'nt' else 'clear')
-
-
-def append_key(key):
-    """Insert a raw character at the cursor position."""
-    buffer[row].insert(col, key.name)
-
-def clear_buffer():
-    """Clear buffer and reset cursor position."""
-    global row, col, top_line, left_col
-    buffer.clear()
-    row = 0
-    col = 0
-    top_line = 0
-    left_col = 0
-    redo_stack.clear()
-    undo_stack.clear()
-
-def record_key(key):
-    """
-    Main entry point for all edits.
-    This is where we translate a keyboard event into a mutation
-    of the underlying buffer (with undo history).
-    """
-    global row, col
-
-    if key.event_type == keyboard.KEY_UP:
-        return
-
-    if key.event_type == keyboard.KEY_DOWN:
-        history.append(key.name)
-
-    # Arrow keys and navigation
-    if key.name in functional_keys_cursor:
-        if keyboard.is_pressed('ctrl') and key.name == "left":
-            move_word_left()
-        elif keyboard.is_pressed('ctrl') and key.name == "right":
-            move_word_right()
-        elif key.name == "home":
-            go_line_home()
-        elif key.name == "end":
-            go_line_end()
-        elif key.name == "page up":
-            page_up()
-        elif key.name == "page down":
-            page_down()
-        else:
-            handle_arrow_keys(key)
-        return
+    """Clear the terminal with ANSI codes (no cls/clear subprocess)."""
+    sys.stdout.write("\033[2J\033[H")
+    sys.stdout.flush()
 
-    # Normal character input (anything not special)
-    if key.event_type == keyboard.KEY_DOWN and key.name not in functional_keys_text:
-        op = {"kind": "insert_char", "row": row, "col": col, "ch": key.name}
-        apply_op(op, record_history=True)
-        return
 
-    # Space
+def typed_char(key):
+    """The character a key-down event types as plain text, or None."""
+    if key.event_type != keyboard.KEY_DOWN:
+        return None
     if key.name == "space":
-        op = {"kind": "insert_char", "row": row, "col": col, "ch": " "}
-        apply_op(op, record_history=True)
-        return
-
-    # Backspace
-    if key.name == "backspace":
-        if len(buffer[row]) > 0 and col > 0:
-            ch = buffer[row][col - 1]
-            op = {"kind": "delete_char", "row": row, "col": col - 1, "ch": ch}
-            apply_op(op, record_history=True)
-
-        elif col == 0 and row > 0:
-            prev_len = len(buffer[row - 1])
-            curr_line = buffer[row][:]
-            op = {
-                "kind": "join_line",
-                "row": row - 1,
-                "col": prev_len,
-                "prev_len": prev_len,
-                "curr": curr_line,
-            }
-            apply_op(op, record_history=True)
-        return
-
-    # Enter key splits the line
-    if key.name == "enter":
-        right = buffer[row][col:][:]
-        op = {"kind": "split_line", "row": row, "col": col, "right": right}
-        apply_op(op, record_history=True)
-        return
-
-
-def load_file(path):
+        return " "
+    if key.name is not None and len(key.name) == 1:
+        return key.name
+    return None
+
+
+def op_size(op):
+    """Approximate bytes an op keeps alive in the undo history."""
+    size = OP_OVERHEAD
+    text = op.text
+    if len(text) > 1:
+        # One-character strings are shared, longer ones are not.
+        size += 49 + len(text)
+    if op.code == REPLACE:
+        rows = op.aux[1] or ()
+        size += 64 + len(op.aux[0]) + sum(64 + len(old) for _, old in rows)
+    return size
+
+
+def inverse_entry(op):
     """
-    Load disk file into buffer.
-    Resets viewport and cursor.
+    Journal entry that undoes op: the concrete edit, so replaying it does
+    not depend on the undo history of the session that wrote it.
     """
-    global buffer, row, col, top_line, left_col
-
-    buffer = []
-
-    with open(path, "r") as f:
-        for line in f:
-            buffer.append(list(line.rstrip("\n")))
-
-    if not buffer:
-        buffer = [[]]
-
-    row = 0
-    col = 0
-    top_line = 0
-    left_col = 0
-    redo_stack.clear()
-    undo_stack.clear()
-
-    return path
-
-
-def apply_op(op, record_history=True):
-    """
-    General operation dispatcher.
-    Every undoable action comes through here.
-    """
-    global row, col
-
-    kind = op["kind"]
-
-    if kind == "insert_char":
-        buffer[op["row"]].insert(op["col"], op["ch"])
-        row = op["row"]
-        col = op["col"] + 1
-
-    elif kind == "delete_char":
-        r, c = op["row"], op["col"]
-        if 0 <= r < len(buffer) and 0 <= c < len(buffer[r]):
-            del buffer[r][c]
-        row, col = r, c
-
-    elif kind == "split_line":
-        r, c = op["row"], op["col"]
-        left = buffer[r][:c]
-        right = op["right"][:]
-        buffer[r] = left
-        buffer.insert(r + 1, right)
-        row, col = r + 1, 0
-
-    elif kind == "join_line":
-        r = op["row"]
-        join_pos = op["col"]
-        if r + 1 < len(buffer):
-            buffer[r].extend(buffer[r + 1])
-            del buffer[r + 1]
-        row, col = r, join_pos
-
-    elif kind == "replace":
-        replace_all(op["search"], op["replace"])
-
-    ensure_cursor_in_bounds()
-    adjust_top_line()
-    adjust_left_col()
-
-    if record_history:
-        undo_stack.append(op)
-        redo_stack.clear()
-
-
-def undo():
-    """
-    Reverse the last edit.
-    Undo logic mirrors apply_op() but in reverse.
-    """
-    if not undo_stack:
-        return
-
-    op = undo_stack.pop()
-    kind = op["kind"]
-
-    if kind == "insert_char":
-        r, c = op["row"], op["col"]
-        del buffer[r][c]
-
-    elif kind == "delete_char":
-        buffer[op["row"]].insert(op["col"], op["ch"])
-
-    elif kind == "split_line":
-        r = op["row"]
-        buffer[r].extend(buffer[r + 1])
-        del buffer[r + 1]
-
-    elif kind == "join_line":
-        r = op["row"]
-        prev_len = op["prev_len"]
-        curr = op["curr"]
-        left = buffer[r][:prev_len]
-        buffer[r] = left
-        buffer.insert(r + 1, curr[:])
-
-    elif kind == "replace":
-        replace_all(op["replace"], op["search"])
-
-    ensure_cursor_in_bounds()
-    adjust_top_line()
-    adjust_left_col()
-
-    # Allow redo
-    redo_stack.append(op)
-
-
-def redo():
-    """
-    Reapply the last undone operation.
-    """
-    if not redo_stack:
-        return
-    op = redo_stack.pop()
-    apply_op(op, record_history=False)
-    undo_stack.append(op)
+    code, r, c = op.code, op.row, op.col
+    if code == INSERT_CHAR or code == INSERT_TEXT:
+        return {"kind": "delete_text", "row": r, "col": c, "text": op.text}
+    if code == DELETE_CHAR or code == DELETE_TEXT:
+        return {"kind": "insert_text", "row": r, "col": c, "text": op.text}
+    if code == SPLIT_LINE:
+        return {"kind": "join_line", "row": r, "col": c, "prev_len": c}
+    if code == JOIN_LINE:
+        return {"kind": "split_line", "row": r, "col": op.aux}
+    return {"kind": "set_rows", "rows": [list(entry) for entry in op.aux[1] or ()]}
 
 
 def find_all_in_line(line_str, pattern):
-    """Naive substring search used by search_all()."""
-    out = []
-    n, m = len(line_str), len(pattern)
-    for i in range(n - m + 1):
-        if line_str[i:i+m] == pattern:
-            out.append(i)
-    return out
-
-
-def search_all(pattern):
-    """
-    Populate matches[] with all occurrences of `pattern`.
-    main.py will use this to highlight search results.
-    """
-    global matches
-    matches = []
+    """All start indices of pattern in one line (str.find based)."""
     if not pattern:
-        return
+        return []
+    return list(find_all(line_str, pattern))
 
-    plen = len(pattern)
 
-    for row_, chars in enumerate(buffer):
-        line_str = "".join(chars)
-        for idx in find_all_in_line(line_str, pattern):
-            matches.append((row_, idx, idx + plen))
+class Document:
+    """One open document: its text, cursor, viewport and edit history."""
 
+    __slots__ = ("history", "buffer", "row", "col", "top_line", "top_wrap", "left_col",
+                 "undo_stack", "redo_stack", "undo_bytes", "matches",
+                 "search_job", "journal", "swap", "syntax", "widths", "wrap",
+                 "snapshots", "own_rows", "lock")
+
+    def __init__(self):
+        # Keeps a simple log of raw key events (mostly for debugging).
+        self.history = []
+
+        # The text buffer. Represented as a list of lines, where each line is
+        # a list of chars, or, for large files, as a PieceTable / MappedLines
+        # exposing the same rows as strings.
+        self.buffer = [[]]
+
+        # Logical cursor position in the buffer.
+        self.row = 0
+        self.col = 0
+
+        # Viewport scrolling offsets. left_col counts screen cells, not
+        # characters (see cell_width.py). With soft wrap on, the screen starts
+        # at visual line top_wrap of row top_line and left_col stays 0.
+        self.top_line = 0
+        self.top_wrap = 0
+        self.left_col = 0
+
+        # Undo/redo stacks of edit ops, packed into arrays (op_log.OpLog).
+        self.undo_stack = OpLog()
+        self.redo_stack = OpLog()
+
+        # Approximate memory held by undo_stack, see op_size().
+        self.undo_bytes = 0
+
+        # Sorted (row, start, end) tuples marking search matches.
+        # Kept up to date by apply_op()/undo() while a search is active.
+        self.matches = MatchIndex()
+
+        # Background search (search_job.BackgroundSearch) currently filling
+        # matches, told about rows that move so its pending row ranges stay
+        # correct.
+        self.search_job = None
+
+        # Crash journal (journal.Journal) receiving every recorded edit, or None.
+        self.journal = None
+
+        # Autosave swap file (swap_file.SwapFile) told about every edit, or None.
+        self.swap = None
+
+        # Syntax highlighter (syntax.Highlighter) for the file's language, or
+        # None. Told about every edit so its line state cache stays valid.
+        self.syntax = None
+
+        # Display width of the rows (cell_width.LineWidths), measured on
+        # first use and reset row by row by edits.
+        self.widths = cell_width.LineWidths()
+
+        # Soft-wrap layout (wrap_index.WrapIndex), built when first needed
+        # with WRAP on and then kept current by every edit.
+        self.wrap = None
+
+        # Snapshots of the text still being written out without the lock
+        # (see snapshot()). While there are any, a list buffer shares its
+        # row lists with them, so a row is copied before it is changed in
+        # place; own_rows holds the ids of the rows copied since.
+        self.snapshots = 0
+        self.own_rows = None
+
+        # Held while the buffer is mutated, so background workers (search)
+        # never read a half-applied edit. Re-entrant: apply_op() may call
+        # replace_all().
+        self.lock = threading.RLock()
+
+    def cancel_search(self):
+        """Stop the background search, if any; its matches so far are kept."""
+        if self.search_job is not None:
+            self.search_job.cancel()
+            self.search_job = None
+
+    # ---- Basic state getters used by main.py ----
+
+    def get_top_line(self):
+        return self.top_line
+
+    def get_max_line(self):
+        return MAX_LINE
+
+    def get_left_col(self):
+        return self.left_col
+
+    def get_max_col(self):
+        return MAX_COL
+
+    # ---- Storage primitives ----
+    # Every mutation of the buffer goes through these, so apply_op()/undo()
+    # work the same whether buffer is a list of char lists or a PieceTable.
+
+    def line_length(self, row_):
+        """Length of a row without materializing it."""
+        if isinstance(self.buffer, list):
+            return len(self.buffer[row_])
+        return self.buffer.line_length(row_)
+
+    def line_text(self, row_):
+        """A row as a plain string."""
+        if isinstance(self.buffer, list):
+            return "".join(self.buffer[row_])
+        return self.buffer[row_]
+
+    def row_cells(self, row_):
+        """Cached start cell of each character of a row, None if all take one."""
+        widths = self.widths
+        if widths.buffer is not self.buffer:
+            # The buffer was replaced wholesale; nothing cached applies.
+            widths.reset(self.buffer)
+        return widths.table(row_, self.line_text)
+
+    def line_width(self, row_):
+        """Screen cells a row takes (tabs expanded, wide characters doubled)."""
+        cells = self.row_cells(row_)
+        return self.line_length(row_) if cells is None else cells[-1]
+
+    def cell_of(self, row_, col_):
+        """Screen cell (from the start of the row) where column col_ is drawn."""
+        cells = self.row_cells(row_)
+        return col_ if cells is None else cells[min(col_, len(cells) - 1)]
+
+    def col_at(self, row_, cell):
+        """Column of the character drawn on a screen cell of the row."""
+        cells = self.row_cells(row_)
+        if cells is None:
+            return min(cell, self.line_length(row_))
+        col_ = bisect_right(cells, cell) - 1
+        # Zero-width characters share their cell with the one before.
+        while col_ > 0 and cells[col_ - 1] == cells[col_]:
+            col_ -= 1
+        return min(col_, len(cells) - 1)
+
+    def visible_text(self, row_, from_cell, to_cell):
+        """Screen cells [from_cell, to_cell) of a row, see LineWidths.visible()."""
+        self.row_cells(row_)
+        return self.widths.visible(row_, self.line_text, from_cell, to_cell)
+
+    def writable_row(self, row_):
+        """The char list of a row, copied first if a snapshot shares it."""
+        line = self.buffer[row_]
+        if self.own_rows is not None and id(line) not in self.own_rows:
+            line = self.buffer[row_] = line[:]
+            self.own_rows.add(id(line))
+        return line
+
+    def insert_text(self, row_, col_, text):
+        """Insert text (no newlines) into a row."""
+        if isinstance(self.buffer, list):
+            self.writable_row(row_)[col_:col_] = text
+        else:
+            self.buffer.insert(row_, col_, text)
 
-def replace_all(pattern, replacement):
-    """
-    Simple (non-regex) global replace operation applied line-by-line.
-    """
-    if not pattern:
-        return
+    def delete_text(self, row_, col_, count=1):
+        """Delete count characters of a row starting at col_."""
+        if isinstance(self.buffer, list):
+            del self.writable_row(row_)[col_:col_ + count]
+        else:
+            self.buffer.delete(row_, col_, count)
+
+    def split_row(self, row_, col_):
+        """Move everything right of col_ onto a new row below."""
+        if isinstance(self.buffer, list):
+            line = self.writable_row(row_)
+            self.buffer.insert(row_ + 1, line[col_:])
+            del line[col_:]
+        else:
+            self.buffer.split_line(row_, col_)
 
-    for i, line_chars in enumerate(buffer):
-        line_str = "".join(line_chars)
-        if pattern in line_str:
-            buffer[i] = list(line_str.replace(pattern, replacement))
+    def join_rows(self, row_):
+        """Append the row below to row_ and remove it."""
+        if isinstance(self.buffer, list):
+            self.writable_row(row_).extend(self.buffer[row_ + 1])
+            del self.buffer[row_ + 1]
+        else:
+            self.buffer.join_line(row_)
 
+    def set_row(self, row_, text):
+        """Replace the whole content of a row."""
+        if isinstance(self.buffer, list):
+            self.buffer[row_] = list(text)
+        else:
+            self.buffer.set_line(row_, text)
+
+    def remove_char_from_buffer(self, row_, col_):
+        """
+        Safely remove a character from a specific position in the buffer.
+        This helper exists because many edits need the same logic,
+        and manually slicing lists everywhere gets messy.
+        """
+        size = self.line_length(row_)
+        if col_ < 0 or col_ >= size:
+            return
+
+        self.delete_text(row_, col_)
+
+    def cursor_screen_pos(self):
+        """
+        Convert logical cursor coordinates (row, col) into 1-based terminal
+        coordinates, considering scroll offsets.
+        """
+        wrap = self.wrap_index()
+        if wrap is not None:
+            visual, screen_col = self.visual_pos(wrap, self.row, self.col)
+            screen_row = visual - self.top_visual(wrap)
+        else:
+            screen_row = self.row - self.top_line
+            screen_col = self.cell_of(self.row, self.col) - self.left_col
+
+        screen_row = max(0, min(screen_row, MAX_LINE - 1))
+        screen_col = max(0, min(screen_col, MAX_COL - 1))
+
+        return screen_row + 1, screen_col + 1
+
+    def move_cursor(self):
+        """Move the real terminal cursor to the logical cursor position."""
+        sys.stdout.write("\033[%d;%dH" % self.cursor_screen_pos())
+        sys.stdout.flush()
+
+    def ensure_cursor_in_bounds(self):
+        """
+        After any edit, make sure row/col are still valid.
+        Prevents cursor from drifting outside its line length.
+        """
+        self.row = max(0, min(self.row, len(self.buffer) - 1))
+        line_len = self.line_length(self.row)
+
+        if self.col < 0:
+            self.col = 0
+        if self.col > line_len:
+            self.col = line_len
+
+    @latency.timed("scroll")
+    def adjust_top_line(self):
+        """
+        Scroll the viewport vertically so the cursor stays visible.
+        """
+        wrap = self.wrap_index()
+        if wrap is not None:
+            visual = self.visual_pos(wrap, self.row, self.col)[0]
+            top = self.top_visual(wrap)
+            if visual < top:
+                top = visual
+            elif visual > top + MAX_LINE - 1:
+                top = visual - (MAX_LINE - 1)
+            top = max(0, min(top, wrap.total - MAX_LINE))
+            self.top_line, self.top_wrap = wrap.row_at(top)
+            return
+
+        self.top_wrap = 0
+        if len(self.buffer) <= MAX_LINE:
+            self.top_line = 0
+            return
+
+        if self.row < self.top_line:
+            self.top_line = self.row
+        elif self.row > self.top_line + MAX_LINE - 1:
+            self.top_line = self.row - (MAX_LINE - 1)
+
+        self.top_line = max(0, min(self.top_line, len(self.buffer) - MAX_LINE))
+
+    @latency.timed("scroll")
+    def adjust_left_col(self):
+        """
+        Horizontal scrolling. Ensures that long lines are viewable
+        and the cursor doesn't disappear off-screen horizontally.
+        """
+        if self.wrap_index() is not None:
+            self.left_col = 0
+            return
+
+        # Short rows fit however wide their characters are; skip measuring.
+        if self.line_length(self.row) * max(2, cell_width.TAB_SIZE) <= MAX_COL:
+            self.left_col = 0
+            return
+
+        line_width = self.line_width(self.row)
+        if line_width <= MAX_COL:
+            self.left_col = 0
+            return
+
+        # The cursor's character must fit whole, even when it is two cells wide.
+        cell = self.cell_of(self.row, self.col)
+        if self.col < self.line_length(self.row):
+            end = self.cell_of(self.row, self.col + 1)
+        else:
+            end = cell + 1
+        if cell < self.left_col:
+            self.left_col = cell
+        elif end > self.left_col + MAX_COL:
+            self.left_col = end - MAX_COL
+
+        self.left_col = max(0, min(self.left_col, line_width - MAX_COL))
+
+    # ---- Soft wrap ----
+
+    def wrap_index(self):
+        """
+        The soft-wrap layout of the buffer, built on first use, or None
+        when WRAP is off (or the buffer is a memory-mapped file).
+        """
+        if not WRAP or not self.buffer or isinstance(self.buffer, MappedLines):
+            return None
+        wrap = self.wrap
+        if wrap is None or wrap.width != MAX_COL:
+            widths = map(self.line_width, range(len(self.buffer)))
+            wrap = self.wrap = WrapIndex(MAX_COL, widths)
+        return wrap
+
+    def visual_pos(self, wrap, row_, col_):
+        """(visual line, screen column) of a buffer position when wrapping."""
+        cell = self.cell_of(row_, col_)
+        part = min(cell // MAX_COL, wrap.row_height(row_) - 1)
+        return wrap.visual_of(row_) + part, cell - part * MAX_COL
+
+    def top_visual(self, wrap):
+        """Visual line at the top of the screen."""
+        top_line = min(self.top_line, len(self.buffer) - 1)
+        return wrap.visual_of(top_line) + min(self.top_wrap, wrap.row_height(top_line) - 1)
+
+    def move_visual(self, wrap, n):
+        """Move the cursor n screen lines down (up if n < 0), keeping its column."""
+        visual, x = self.visual_pos(wrap, self.row, self.col)
+        self.row, part = wrap.row_at(visual + n)
+        self.col = self.col_at(self.row, part * MAX_COL + min(x, MAX_COL - 1))
+
+    def visible_segments(self):
+        """
+        What the viewport shows, as (row, from_cell, to_cell) for each
+        screen row from the top, at most MAX_LINE of them. Cells count
+        from the start of the row; visible_text() turns them into text.
+        """
+        wrap = self.wrap_index()
+        if wrap is None:
+            start = self.top_line
+            end = min(start + MAX_LINE, len(self.buffer))
+            from_cell = self.left_col
+            return [(r, from_cell, from_cell + MAX_COL) for r in range(start, end)]
+
+        segments = []
+        row_ = self.top_line
+        part = self.top_wrap
+        while len(segments) < MAX_LINE and row_ < len(self.buffer):
+            height = wrap.row_height(row_)
+            while part < height and len(segments) < MAX_LINE:
+                segments.append((row_, part * MAX_COL, (part + 1) * MAX_COL))
+                part += 1
+            row_ += 1
+            part = 0
+        return segments
+
+    def handle_arrow_keys(self, key):
+        """
+        Arrow key navigation with sensible behavior across line boundaries.
+        With soft wrap on, up/down move by screen lines.
+        """
+        wrap = self.wrap_index()
+        if wrap is not None and key.name in ("up", "down"):
+            self.move_visual(wrap, -1 if key.name == "up" else 1)
+
+        elif key.name == "up":
+            if self.row > 0:
+                # Stay in the same screen column, whatever the tabs and
+                # wide characters on either row.
+                cell = self.cell_of(self.row, self.col)
+                self.row -= 1
+                self.col = self.col_at(self.row, cell)
+
+        elif key.name == "down":
+            if self.row < len(self.buffer) - 1:
+                cell = self.cell_of(self.row, self.col)
+                self.row += 1
+                self.col = self.col_at(self.row, cell)
+
+        elif key.name == "left":
+            if self.col > 0:
+                self.col -= 1
+            elif self.row > 0:
+                self.row -= 1
+                self.col = self.line_length(self.row)
+
+        elif key.name == "right":
+            line_len = self.line_length(self.row)
+            if self.col < line_len:
+                self.col += 1
+            elif self.row < len(self.buffer) - 1:
+                self.row += 1
+                self.col = 0
+
+        self.ensure_cursor_in_bounds()
+        self.adjust_top_line()
+        self.adjust_left_col()
+
+    def append_key(self, key):
+        """Insert a raw character at the cursor position."""
+        self.insert_text(self.row, self.col, key.name)
+
+    def release_buffer(self):
+        """Free resources (file mappings) held by an engine-backed buffer."""
+        close = getattr(self.buffer, "close", None)
+        if close is not None:
+            close()
+
+    @locked
+    def clear_buffer(self):
+        """Clear buffer and reset cursor position."""
+        if isinstance(self.buffer, list):
+            self.buffer.clear()
+        else:
+            self.release_buffer()
+            self.buffer = []
+        self.row = 0
+        self.col = 0
+        self.top_line = 0
+        self.top_wrap = 0
+        self.left_col = 0
+        self.redo_stack.clear()
+        self.undo_stack.clear()
+        self.undo_bytes = 0
+        self.cancel_search()
+        self.matches.clear()
+        self.widths.reset(self.buffer)
+        self.wrap = None
+        if self.syntax is not None:
+            self.syntax.reset()
+
+    def record_key(self, key):
+        """
+        Main entry point for all edits.
+        This is where we translate a keyboard event into a mutation
+        of the underlying buffer (with undo history).
+        """
+        if key.event_type == keyboard.KEY_UP:
+            return
+
+        if key.event_type == keyboard.KEY_DOWN:
+            self.history.append(key.name)
+
+        # Arrow keys and navigation
+        if key.name in functional_keys_cursor:
+            if keyboard.is_pressed('ctrl') and key.name == "left":
+                self.move_word_left()
+            elif keyboard.is_pressed('ctrl') and key.name == "right":
+                self.move_word_right()
+            elif key.name == "home":
+                self.go_line_home()
+            elif key.name == "end":
+                self.go_line_end()
+            elif key.name == "page up":
+                self.page_up()
+            elif key.name == "page down":
+                self.page_down()
+            else:
+                self.handle_arrow_keys(key)
+            return
+
+        # Normal character input (anything not special)
+        if key.event_type == keyboard.KEY_DOWN and key.name not in functional_keys_text:
+            self.apply_op(Op(INSERT_CHAR, self.row, self.col, key.name), record_history=True)
+            return
+
+        # Space
+        if key.name == "space":
+            self.apply_op(Op(INSERT_CHAR, self.row, self.col, " "), record_history=True)
+            return
+
+        # Backspace
+        if key.name == "backspace":
+            if self.line_length(self.row) > 0 and self.col > 0:
+                ch = self.buffer[self.row][self.col - 1]
+                self.apply_op(Op(DELETE_CHAR, self.row, self.col - 1, ch), record_history=True)
+
+            elif self.col == 0 and self.row > 0:
+                prev_len = self.line_length(self.row - 1)
+                self.apply_op(Op(JOIN_LINE, self.row - 1, prev_len, aux=prev_len),
+                              record_history=True)
+            return
+
+        # Enter key splits the line
+        if key.name == "enter":
+            self.apply_op(Op(SPLIT_LINE, self.row, self.col), record_history=True)
+            return
+
+    def type_text(self, text):
+        """Insert text typed at the cursor as one op."""
+        if not text:
+            return
+        # A single char is plain typing, coalesced into words by record_undo().
+        code = INSERT_CHAR if len(text) == 1 else INSERT_TEXT
+        self.apply_op(Op(code, self.row, self.col, text), record_history=True)
+
+    def record_keys(self, keys):
+        """
+        Apply a batch of key events, e.g. everything queued up during a paste.
+        Runs of typed characters become a single insert_text op (one undo
+        step, one match refresh); other keys go through record_key().
+        """
+        run = []
+        for key in keys:
+            ch = typed_char(key)
+            if ch is not None:
+                self.history.append(key.name)
+                run.append(ch)
+                continue
+            self.type_text("".join(run))
+            run = []
+            self.record_key(key)
+        self.type_text("".join(run))
+
+    @locked
+    def load_file(self, path, engine=None):
+        """
+        Load disk file into buffer.
+        Resets viewport and cursor.
+        engine overrides ENGINE for this load (see ENGINE above).
+        """
+        engine = engine or ENGINE
+        if engine == "auto":
+            size = os.path.getsize(path)
+            if size >= MMAP_MIN_BYTES:
+                engine = "mmap"
+            elif size >= PIECE_TABLE_MIN_BYTES:
+                engine = "piece_table"
+            else:
+                engine = "lines"
+
+        self.release_buffer()
+
+        if engine == "mmap":
+            # Returns as soon as the file is mapped; the line index is
+            # built in the background and rows are decoded when drawn.
+            self.buffer = MappedLines(path)
+            self.buffer.wait_for_rows(MAX_LINE)
+        elif engine == "piece_table":
+            with open(path, "r") as f:
+                text = f.read()
+            # Same rows as the line reader: a trailing newline ends the last
+            # line rather than starting a new one.
+            if text.endswith("\n"):
+                text = text[:-1]
+            self.buffer = PieceTable(text)
+        else:
+            self.buffer = []
+
+            with open(path, "r") as f:
+                for line in f:
+                    self.buffer.append(list(line.rstrip("\n")))
+
+            if not self.buffer:
+                self.buffer = [[]]
+
+        self.reset_view()
+        self.syntax = syntax.for_path(path)
+        return path
+
+    @locked
+    def load_text(self, text):
+        """
+        Replace the buffer with text (rows separated by '\n'), e.g. text
+        recovered from a swap file. Resets viewport, cursor and history.
+        """
+        self.release_buffer()
+        if len(text) >= PIECE_TABLE_MIN_BYTES:
+            self.buffer = PieceTable(text)
+        else:
+            self.buffer = [list(line) for line in text.split("\n")]
+        self.reset_view()
+
+    def reset_view(self):
+        """Forget cursor, viewport, history and caches after a new buffer."""
+        self.row = 0
+        self.col = 0
+        self.top_line = 0
+        self.top_wrap = 0
+        self.left_col = 0
+        self.redo_stack.clear()
+        self.undo_stack.clear()
+        self.undo_bytes = 0
+        self.cancel_search()
+        self.matches.clear()
+        self.widths.reset(self.buffer)
+        self.wrap = None
+        if self.syntax is not None:
+            self.syntax.reset()
+
+    @latency.timed("apply")
+    @locked
+    def apply_op(self, op, record_history=True):
+        """
+        General operation dispatcher.
+        Every undoable action comes through here.
+        op is an op_log.Op or a dict in the journal's schema.
+        """
+        given = op
+        op = as_op(op)
+
+        if record_history and self.journal is not None:
+            self.journal.record(op.as_dict())
+        if self.swap is not None:
+            self.swap.ops += 1
+
+        code = op.code
+        r = op.row
+        c = op.col
+
+        if code == INSERT_CHAR or code == INSERT_TEXT:
+            self.insert_text(r, c, op.text)
+            self.refresh_matches(r, r, plain=is_plain(op.text))
+            self.row, self.col = r, c + len(op.text)
+
+        elif code == DELETE_TEXT:
+            self.delete_text(r, c, len(op.text))
+            self.refresh_matches(r, r, plain=True)
+            self.row, self.col = r, c
+
+        elif code == DELETE_CHAR:
+            if 0 <= r < len(self.buffer) and 0 <= c < self.line_length(r):
+                self.delete_text(r, c)
+                self.refresh_matches(r, r, plain=True)
+            self.row, self.col = r, c
+
+        elif code == SPLIT_LINE:
+            self.split_row(r, c)
+            self.refresh_matches(r, r, 1, plain=True)
+            self.row, self.col = r + 1, 0
+
+        elif code == JOIN_LINE:
+            if r + 1 < len(self.buffer):
+                self.join_rows(r)
+                self.refresh_matches(r, r + 1, -1, plain=True)
+            self.row, self.col = r, c
+
+        elif code == REPLACE:
+            search, (replacement, rows) = op.text, op.aux
+            if rows is None:
+                # First run: remember exactly which rows changed and how they
+                # looked, so undo/redo only ever touch those rows.
+                rows, count = self.replace_all(search, replacement)
+                op.aux[1] = rows
+                if type(given) is dict:
+                    given["rows"] = rows
+                    given["count"] = count
+            else:
+                for row_, old in rows:
+                    self.set_row(row_, old.replace(search, replacement))
+            self.refresh_rows(row_ for row_, _ in rows)
+
+        self.ensure_cursor_in_bounds()
+        self.adjust_top_line()
+        self.adjust_left_col()
+
+        if record_history:
+            self.record_undo(op)
+            self.redo_stack.clear()
+
+    @latency.timed("apply")
+    @locked
+    def undo(self):
+        """
+        Reverse the last edit.
+        Undo logic mirrors apply_op() but in reverse.
+        """
+        if not self.undo_stack:
+            return
+
+        op = self.undo_stack.pop()
+        if self.swap is not None:
+            self.swap.ops += 1
+        if self.journal is not None:
+            self.journal.record(inverse_entry(op))
+        self.undo_bytes = max(0, self.undo_bytes - op_size(op))
+        code = op.code
+        r = op.row
+        c = op.col
+
+        if code == INSERT_CHAR or code == INSERT_TEXT:
+            self.delete_text(r, c, len(op.text))
+            self.refresh_matches(r, r, plain=True)
+            self.row, self.col = r, c
+
+        elif code == DELETE_TEXT:
+            self.insert_text(r, c, op.text)
+            self.refresh_matches(r, r, plain=is_plain(op.text))
+            self.row, self.col = r, c + len(op.text)
+
+        elif code == DELETE_CHAR:
+            self.insert_text(r, c, op.text)
+            self.refresh_matches(r, r, plain=is_plain(op.text))
+            self.row, self.col = r, c
+
+        elif code == SPLIT_LINE:
+            self.join_rows(r)
+            self.refresh_matches(r, r + 1, -1, plain=True)
+            self.row, self.col = r, c
+
+        elif code == JOIN_LINE:
+            prev_len = op.aux
+            self.split_row(r, prev_len)
+            self.refresh_matches(r, r, 1, plain=True)
+            self.row, self.col = r, prev_len
+
+        elif code == REPLACE:
+            rows = op.aux[1] or ()
+            for row_, old in rows:
+                self.set_row(row_, old)
+            self.refresh_rows(row_ for row_, _ in rows)
+
+        self.ensure_cursor_in_bounds()
+        self.adjust_top_line()
+        self.adjust_left_col()
+
+        # Allow redo
+        self.redo_stack.append(op)
+
+    @locked
+    def redo(self):
+        """
+        Reapply the last undone operation.
+        """
+        if not self.redo_stack:
+            return
+        op = self.redo_stack.pop()
+        if self.journal is not None:
+            self.journal.record(op.as_dict())
+        self.apply_op(op, record_history=False)
+        self.push_undo(op)
+
+    @locked
+    def set_rows(self, rows):
+        """Overwrite whole rows from (row, text) pairs in ascending row order."""
+        for row_, text in rows:
+            self.set_row(row_, text)
+        self.refresh_rows(row_ for row_, _ in rows)
+        self.ensure_cursor_in_bounds()
+
+    # ---- Undo history bookkeeping ----
+
+    def push_undo(self, op):
+        """Append op to the undo history, evicting the oldest ops if over budget."""
+        if not self.undo_stack:
+            # The stack may have been cleared directly; start counting afresh.
+            self.undo_bytes = 0
+        op = as_op(op)
+        undo_stack = self.undo_stack
+        undo_stack.append(op)
+        self.undo_bytes += op_size(op)
+        if len(undo_stack) > UNDO_LIMIT_OPS or self.undo_bytes > UNDO_LIMIT_BYTES:
+            self.evict_history()
+
+    def evict_history(self):
+        """
+        Drop the oldest undo ops while over UNDO_LIMIT_OPS / UNDO_LIMIT_BYTES.
+        Evicts down to 90% of the budget so the array shift is amortized.
+        """
+        undo_stack = self.undo_stack
+        if len(undo_stack) <= UNDO_LIMIT_OPS and self.undo_bytes <= UNDO_LIMIT_BYTES:
+            return
+
+        max_ops = UNDO_LIMIT_OPS * 9 // 10
+        max_bytes = UNDO_LIMIT_BYTES * 9 // 10
+        n = 0
+        freed = 0
+        while n < len(undo_stack) and (len(undo_stack) - n > max_ops
+                                       or self.undo_bytes - freed > max_bytes):
+            freed += op_size(undo_stack[n])
+            n += 1
+
+        undo_stack.drop_oldest(n)
+        self.undo_bytes = self.undo_bytes - freed if undo_stack else 0
+
+    def coalesce(self, op):
+        """
+        Try to fold a new single-char edit into the last undo op, so a
+        typed word or a run of backspaces undoes in one step.
+        Returns True if op was merged.
+        """
+        code = op.code
+        if code != INSERT_CHAR and code != DELETE_CHAR:
+            return False
+        undo_stack = self.undo_stack
+        # Peek at the packed arrays before building the last Op.
+        if undo_stack.rows[-1] != op.row:
+            return False
+        last = undo_stack[-1]
+
+        text = last.text
+        if code == INSERT_CHAR and (last.code == INSERT_CHAR or last.code == INSERT_TEXT):
+            ch = op.text
+            if last.col + len(text) != op.col or len(text) >= COALESCE_MAX:
+                return False
+            # A space after a word starts a new undo step.
+            if ch.isspace() and not text[-1].isspace():
+                return False
+            merged = Op(INSERT_TEXT, op.row, last.col, text + ch)
+
+        elif code == DELETE_CHAR and (last.code == DELETE_CHAR or last.code == DELETE_TEXT):
+            if len(text) >= COALESCE_MAX:
+                return False
+            if op.col + 1 == last.col:
+                # Backspace: the run grows to the left.
+                merged = Op(DELETE_TEXT, op.row, op.col, op.text + text)
+            elif op.col == last.col:
+                merged = Op(DELETE_TEXT, op.row, last.col, text + op.text)
+            else:
+                return False
 
-def go_line_home():
-    global col
-    col = 0
-    ensure_cursor_in_bounds()
-    adjust_left_col()
+        else:
+            return False
+
+        undo_stack[-1] = merged
+        self.undo_bytes += op_size(merged) - op_size(last)
+        return True
+
+    def record_undo(self, op):
+        """Record a fresh user edit, merging it into the previous op when possible."""
+        if self.undo_stack and self.coalesce(op):
+            return
+        self.push_undo(op)
+
+    def history_usage(self):
+        """(number of undo ops, approximate bytes) for the status bar."""
+        return len(self.undo_stack), self.undo_bytes
+
+    def buffer_chunks(self):
+        """Stream the whole buffer as text chunks, rows separated by '\n'."""
+        if isinstance(self.buffer, PieceTable):
+            return self.buffer.chunks()
+        return line_chunks(self.buffer)
+
+    @locked
+    def snapshot(self):
+        """
+        The text as it is now, as chunks that can be written out without
+        the lock while editing goes on: rows are copied on write and a
+        PieceTable copies only its piece list, so the document is never
+        copied whole. None for a memory-mapped buffer, which has to save
+        under the lock. Call release_snapshot() when done with the chunks.
+        """
+        if isinstance(self.buffer, list):
+            chunks = text_chunks(list(self.buffer))
+        elif isinstance(self.buffer, PieceTable):
+            chunks = itertools.chain(self.buffer.snapshot(self.lock), ("\n",))
+        else:
+            return None
+        self.snapshots += 1
+        self.own_rows = set()
+        return chunks
+
+    @locked
+    def release_snapshot(self):
+        """The chunks of a snapshot() were written out, or given up on."""
+        self.snapshots -= 1
+        if not self.snapshots:
+            self.own_rows = None
+
+    @locked
+    def search_all(self, pattern):
+        """
+        Populate matches[] with all occurrences of `pattern`.
+        main.py will use this to highlight search results.
+        Patterns containing '\n' match across line breaks and add
+        one (row, start, end) entry per row they cover.
+        """
+        self.cancel_search()
+        if not pattern:
+            self.matches.clear()
+            return
+
+        self.matches.reset(pattern, list(search_chunks(self.buffer_chunks(), pattern)))
+
+    def refresh_matches(self, first, last, delta=0, plain=False):
+        """
+        Keep matches[] current after an edit rewrote rows [first, last]
+        and moved every later row by delta.
+        Only the rewritten rows are searched again. The syntax highlighter,
+        the width cache and the soft-wrap layout are told too; plain=True
+        tells the width cache the edit added no wide characters or tabs.
+        """
+        if self.search_job is not None:
+            self.search_job.rows_moved(first, last, delta)
+        if self.syntax is not None:
+            self.syntax.rows_changed(first, last, delta)
+        self.widths.rows_changed(first, last, delta, plain)
+        if self.wrap is not None:
+            self.wrap.rows_changed(first, last, delta, self.line_width)
+        if self.swap is not None:
+            self.swap.rows_changed(first, last, delta)
+
+        pattern = self.matches.pattern
+        if not pattern:
+            return
+
+        # A match spanning k line breaks can start up to k rows above the edit
+        # and end k rows below it, so widen the rescanned window by k.
+        k = pattern.count("\n")
+        lo = max(first - k, 0)
+        found = self.scan_rows(lo, last + delta + k + 1, pattern)
+        self.matches.replace_rows(lo, last + k, found, delta)
+
+    def refresh_rows(self, rows):
+        """refresh_matches() for rewritten rows, given in ascending order."""
+        for first, last in bulk_replace.runs(rows):
+            self.refresh_matches(first, last)
+
+    def scan_rows(self, lo, hi, pattern):
+        """
+        All match segments of pattern on rows lo <= row < hi.
+        Rows just outside the range are read too, so multi-line matches
+        reaching into it are found complete.
+        """
+        k = pattern.count("\n")
+        start = max(lo - k, 0)
+        stop = min(hi + k, len(self.buffer))
+        if start >= stop:
+            return []
+
+        if not k and stop - start == 1:
+            plen = len(pattern)
+            return [(start, i, i + plen) for i in find_all(self.line_text(start), pattern)]
+
+        text = "\n".join(self.line_text(r) for r in range(start, stop))
+        return [(r + start, s, e) for r, s, e in search_chunks((text,), pattern)
+                if lo <= r + start < hi]
+
+    def goto_match(self, match):
+        """Put the cursor on the start of a (row, start, end) match."""
+        if match is None:
+            return
+        self.row, self.col = match[0], match[1]
+        self.ensure_cursor_in_bounds()
+        self.adjust_top_line()
+        self.adjust_left_col()
+
+    def next_match(self):
+        """Jump to the next search match after the cursor (F3)."""
+        self.goto_match(self.matches.next_after(self.row, self.col))
+
+    def prev_match(self):
+        """Jump to the previous search match before the cursor (Shift+F3)."""
+        self.goto_match(self.matches.prev_before(self.row, self.col))
+
+    @locked
+    def replace_all(self, pattern, replacement):
+        """
+        Simple (non-regex) global replace, one row at a time.
+        The rows are searched in chunks (in parallel on large buffers, see
+        bulk_replace.py) and the changed ones written back in one pass.
+        Returns (rows, count): (row, old_text) for every row that changed,
+        which is all undo needs to restore them, and the number of
+        replacements made.
+        """
+        changes, count = bulk_replace.replace_lines(
+            self.buffer, pattern, replacement, len(self.buffer))
+
+        # Rows are rewritten after the scan so a PieceTable is never
+        # modified while it is being iterated.
+        for i, _, new in changes:
+            self.set_row(i, new)
+
+        return [(i, old) for i, old, _ in changes], count
+
+    def go_line_home(self):
+        self.col = 0
+        self.ensure_cursor_in_bounds()
+        # With soft wrap on, the row's start or end may be off screen.
+        self.adjust_top_line()
+        self.adjust_left_col()
+
+    def go_line_end(self):
+        self.col = self.line_length(self.row)
+        self.ensure_cursor_in_bounds()
+        # With soft wrap on, the row's start or end may be off screen.
+        self.adjust_top_line()
+        self.adjust_left_col()
+
+    def move_word_left(self):
+        """
+        Jump left by a whole word (Ctrl+Left).
+        """
+        if self.col == 0 and self.row > 0:
+            self.row -= 1
+            self.col = self.line_length(self.row)
+            self.ensure_cursor_in_bounds()
+            self.adjust_top_line()
+            self.adjust_left_col()
+            return
+
+        line = self.buffer[self.row]
+        if not line or self.col == 0:
+            return
+
+        i = self.col - 1
+        while i >= 0 and line[i].isspace():
+            i -= 1
+        while i >= 0 and not line[i].isspace():
+            i -= 1
+
+        self.col = i + 1
+        self.ensure_cursor_in_bounds()
+        self.adjust_top_line()
+        self.adjust_left_col()
+
+    def move_word_right(self):
+        """
+        Jump right by a whole word (Ctrl+Right).
+        """
+        line = self.buffer[self.row]
+        n = len(line)
 
+        if self.col >= n and self.row < len(self.buffer) - 1:
+            self.row += 1
+            self.col = 0
+            line = self.buffer[self.row]
+            n = len(line)
+
+        i = self.col
+        while i < n and line[i].isspace():
+            i += 1
+        while i < n and not line[i].isspace():
+            i += 1
+
+        self.col = i
+        self.ensure_cursor_in_bounds()
+        self.adjust_top_line()
+        self.adjust_left_col()
+
+    def page_up(self):
+        """
+        Moves up by an entire page (viewport height).
+        """
+        wrap = self.wrap_index()
+        if wrap is not None:
+            self.move_visual(wrap, -MAX_LINE)
+        else:
+            self.row = max(0, self.row - MAX_LINE)
+        self.ensure_cursor_in_bounds()
+        self.adjust_top_line()
+        self.adjust_left_col()
+
+    def page_down(self):
+        """
+        Moves down by an entire page (viewport height).
+        """
+        wrap = self.wrap_index()
+        if wrap is not None:
+            self.move_visual(wrap, MAX_LINE)
+        else:
+            self.row = min(len(self.buffer) - 1, self.row + MAX_LINE)
+        self.ensure_cursor_in_bounds()
+        self.adjust_top_line()
+        self.adjust_left_col()
 
-def go_line_end():
-    global col
-    col = len(buffer[row])
-    ensure_cursor_in_bounds()
-    adjust_left_col()
 
+# ---- The current document ----
+# main.py, the journal and the tests work on one document at a time through
+# the module itself: buffer_op.apply_op(op) is current.apply_op(op) and
+# buffer_op.row reads (or assigns) current.row. The module functions are
+# the bound methods of `current`, re-bound whenever it is replaced, so a
+# call through the module costs no extra frame.
 
-def move_word_left():
-    """
-    Jump left by a whole word (Ctrl+Left).
-    """
-    global row, col
+_METHODS = [name for name, value in vars(Document).items()
+            if callable(value) and not name.startswith("_")]
 
-    if col == 0 and row > 0:
-        row -= 1
-        col = len(buffer[row])
-        ensure_cursor_in_bounds()
-        adjust_top_line()
-        adjust_left_col()
-        return
 
-    line = buffer[row]
-    if not line or col == 0:
-        return
+def use(doc):
+    """Make doc the current document (same as assigning buffer_op.current)."""
+    g = globals()
+    g["current"] = doc
+    for name in _METHODS:
+        g[name] = getattr(doc, name)
 
-    i = col - 1
-    while i >= 0 and line[i].isspace():
-        i -= 1
-    while i >= 0 and not line[i].isspace():
-        i -= 1
 
-    col = i + 1
-    ensure_cursor_in_bounds()
-    adjust_top_line()
-    adjust_left_col()
+current = None
+use(Document())
 
 
-def move_word_right():
-    """
-    Jump right by a whole word (Ctrl+Right).
-    """
-    global row, col
+def set_wrap(on):
+    """Turn soft wrap on or off and bring the current viewport in line."""
+    global WRAP
+    WRAP = on
+    current.top_wrap = 0
+    current.adjust_top_line()
+    current.adjust_left_col()
 
-    line = buffer[row]
-    n = len(line)
 
-    if col >= n and row < len(buffer) - 1:
-        row += 1
-        col = 0
-        line = buffer[row]
-        n = len(line)
+def _state(name):
+    return property(lambda module: getattr(current, name),
+                    lambda module, value: setattr(current, name, value))
 
-    i = col
-    while i < n and line[i].isspace():
-        i += 1
-    while i < n and not line[i].isspace():
-        i += 1
 
-    col = i
-    ensure_cursor_in_bounds()
-    adjust_top_line()
-    adjust_left_col()
+class _Module(types.ModuleType):
+    """buffer_op itself, with the Document fields forwarded to `current`."""
 
+    current = property(lambda module: current, lambda module, doc: use(doc))
 
-def page_up():
-    """
-    Moves up by an entire page (viewport height).
-    """
-    global row
-    row = max(0, row - MAX_LINE)
-    ensure_cursor_in_bounds()
-    adjust_top_line()
-    adjust_left_col()
 
+for _name in Document.__slots__:
+    setattr(_Module, _name, _state(_name))
 
-def page_down():
-    """
-    Moves down by an entire page (viewport height).
-    """
-    global row
-    row = min(len(buffer) - 1, row + MAX_LINE)
-    ensure_cursor_in_bounds()
-    adjust_top_line()
-    adjust_left_col()
+sys.modules[__name__].__class__ = _Module
@@ -0,0 +1,140 @@
+# bulk_replace.py
+# Replace-all over the whole buffer, in row chunks, on several cores.
+#
+# The buffer is cut into chunks of CHUNK_ROWS rows. Each chunk is joined
+# with '\n' and scanned with str.find (see text_search.py), so rows without
+# the pattern are skipped at C speed instead of being tested one by one;
+# only the rows that contain it are rewritten. Buffers of PARALLEL_MIN_ROWS
+# rows or more hand the chunks to a process pool, one worker per core, with
+# a bounded number of chunks in flight so memory stays flat however big
+# the file is. Smaller buffers run the same code inline, where starting
+# the pool would cost more than it saves.
+#
+# Workers send back only the new text of the rows they changed. The
+# caller still holds each chunk, so it pairs them with the old text
+# (which is all undo needs) and writes everything back in one step.
+#
+# This module is imported by the worker processes, so it deliberately
+# does not import the editor (buffer_op, keyboard, ...).
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# Rows per chunk handed to a worker.
+CHUNK_ROWS = 65536
+
+# Buffers with fewer rows are replaced on the calling thread.
+PARALLEL_MIN_ROWS = 500_000
+
+# Chunks in flight per worker at most.
+PENDING_PER_WORKER = 2
+
+
+def replace_chunk(lines, pattern, replacement):
+    """
+    Worker task: replace pattern in a list of row strings.
+    Returns ([(index, new_text), ...] for the rows that changed, count).
+    """
+    text = "\n".join(lines)
+    i = text.find(pattern)
+    if i == -1:
+        return [], 0
+
+    changed = []
+    count = 0
+    row = 0
+    row_start = 0   # offset in text where `row` begins
+    while i != -1:
+        nl = text.count("\n", row_start, i)
+        if nl:
+            row += nl
+            row_start = text.rfind("\n", row_start, i) + 1
+        line = lines[row]
+        count += line.count(pattern)
+        changed.append((row, line.replace(pattern, replacement)))
+        # Carry on after this row; its other matches were counted above.
+        row_start += len(line) + 1
+        row += 1
+        i = text.find(pattern, row_start)
+    return changed, count
+
+
+def chunks(lines, size=None):
+    """Cut an iterable of rows (strings or char lists) into lists of strings."""
+    size = size or CHUNK_ROWS
+    it = iter(lines)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        # A buffer holds rows of one kind, so checking one row is enough.
+        yield chunk if isinstance(chunk[0], str) else list(map("".join, chunk))
+
+
+def runs(rows):
+    """Group sorted row numbers into (first, last) runs of consecutive rows."""
+    first = last = None
+    for row in rows:
+        if last is not None and row == last + 1:
+            last = row
+            continue
+        if first is not None:
+            yield first, last
+        first = last = row
+    if first is not None:
+        yield first, last
+
+
+def replace_lines(lines, pattern, replacement, row_count=0, workers=None):
+    """
+    Replace pattern with replacement in every row of lines.
+
+    Rows never span a line break, so a pattern containing '\\n' matches
+    nothing. Returns (changes, count): changes is a list of (row, old_text,
+    new_text) in row order and count the number of replacements made.
+    row_count (the number of rows, when known) decides whether the work
+    goes to a process pool.
+    """
+    if not pattern or "\n" in pattern:
+        return [], 0
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or row_count < PARALLEL_MIN_ROWS:
+        changes = []
+        count = 0
+        first = 0
+        for chunk in chunks(lines):
+            found, n = replace_chunk(chunk, pattern, replacement)
+            changes.extend((first + k, chunk[k], new) for k, new in found)
+            count += n
+            first += len(chunk)
+        return changes, count
+
+    return _replace_parallel(lines, pattern, replacement, workers)
+
+
+def _replace_parallel(lines, pattern, replacement, workers):
+    changes = []
+    count = 0
+    pending = []   # (first row, chunk, future), in submission order
+    limit = workers * PENDING_PER_WORKER
+
+    def collect():
+        nonlocal count
+        first, chunk, future = pending.pop(0)
+        found, n = future.result()
+        changes.extend((first + k, chunk[k], new) for k, new in found)
+        count += n
+
+    with ProcessPoolExecutor(workers) as pool:
+        first = 0
+        for chunk in chunks(lines):
+            pending.append((first, chunk, pool.submit(replace_chunk, chunk, pattern, replacement)))
+            first += len(chunk)
+            # Results are taken in order, so changes stays sorted by row.
+            if len(pending) >= limit:
+                collect()
+        while pending:
+            collect()
+    return changes, count
@@ -0,0 +1,126 @@
+# cell_width.py
+# Display widths: how many terminal cells each character of a row takes.
+#
+# Buffer columns count characters, the screen counts cells. A tab runs to
+# the next multiple of TAB_SIZE, East Asian wide and fullwidth characters
+# (CJK, most emoji) take two cells, and combining marks take none.
+#
+# LineWidths caches, per row, the cell each character starts at, so
+# mapping the cursor to the screen (and a screen cell back to a column) is
+# a list lookup or a bisect instead of a rescan of the line every frame.
+# Rows of plain ASCII without tabs, by far the most common, store nothing:
+# their cell is their column. Edits reset the cache entries of the rows
+# they rewrote (through Document.refresh_matches); other rows keep theirs.
+# An edit that only adds plain text (or removes text, splits or joins rows)
+# leaves a plain row plain, so typing into one never measures it again.
+
+import functools
+import unicodedata
+from bisect import bisect_right
+
+TAB_SIZE = 4
+
+# Cache entry of a row that was not measured yet.
+_UNKNOWN = object()
+
+
+@functools.lru_cache(maxsize=4096)
+def char_width(ch):
+    """Cells taken by one (non-tab) character."""
+    if unicodedata.combining(ch) or ch in "\u200b\u200c\u200d\ufeff":
+        return 0
+    if unicodedata.east_asian_width(ch) in ("W", "F"):
+        return 2
+    return 1
+
+
+def is_plain(text):
+    """True when every character of text takes exactly one cell."""
+    return text.isascii() and "\t" not in text
+
+
+def measure(text):
+    """
+    Start cell of every character of text, followed by the total width;
+    None when every character takes exactly one cell.
+    """
+    if is_plain(text):
+        return None
+    cells = [0] * (len(text) + 1)
+    x = 0
+    for i, ch in enumerate(text):
+        cells[i] = x
+        if ch == "\t":
+            x += TAB_SIZE - x % TAB_SIZE
+        elif ch < "\x7f":
+            x += 1
+        else:
+            x += char_width(ch)
+    cells[-1] = x
+    return cells
+
+
+class LineWidths:
+    """Per-row cell tables of one document, measured on first use."""
+
+    __slots__ = ("tables", "buffer")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, buffer=None):
+        """Forget every row; the tables now describe buffer."""
+        self.tables = []
+        self.buffer = buffer
+
+    def rows_changed(self, first, last, delta=0, plain=False):
+        """
+        Rows [first, last] were rewritten and every later row moved by
+        delta (the same contract as Document.refresh_matches). plain: the
+        edit added no tab or non-ASCII character, so if the rows were all
+        plain, the rows that replace them are too.
+        """
+        tables = self.tables
+        if first < len(tables):
+            old = tables[first:last + 1]
+            fill = None if plain and len(old) == last - first + 1 and old.count(None) == len(old) \
+                else _UNKNOWN
+            tables[first:last + 1] = [fill] * (last - first + 1 + delta)
+
+    def table(self, row, line_text):
+        """Cell table of a row (None for plain rows), measuring it if needed."""
+        tables = self.tables
+        if row >= len(tables):
+            tables.extend([_UNKNOWN] * (row + 1 - len(tables)))
+        cells = tables[row]
+        if cells is _UNKNOWN:
+            cells = tables[row] = measure(line_text(row))
+        return cells
+
+    def visible(self, row, line_text, from_cell, to_cell):
+        """
+        What a row shows in the screen cells [from_cell, to_cell).
+
+        Returns (chars, from_col): one display string per character from
+        buffer column from_col on, so character columns still index into
+        it (for highlighting). Tabs become spaces, and a wide character
+        cut by either edge is drawn as spaces.
+        """
+        cells = self.table(row, line_text)
+        text = line_text(row)
+        if cells is None:
+            return text[from_cell:to_cell], from_cell
+
+        n = len(text)
+        first = bisect_right(cells, from_cell, 0, n) - 1 if from_cell > 0 else 0
+        chars = []
+        for i in range(max(first, 0), n):
+            start = cells[i]
+            if start >= to_cell:
+                break
+            end = cells[i + 1]
+            ch = text[i]
+            if ch == "\t" or start < from_cell or end > to_cell:
+                ch = " " * (min(end, to_cell) - max(start, from_cell))
+            chars.append(ch)
+        return chars, max(first, 0)
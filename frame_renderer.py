@@ -0,0 +1,73 @@
+# frame_renderer.py
+# Differential terminal output for the editor.
+#
+# The renderer remembers the last frame it put on screen (one string per
+# terminal row, status bar included). Drawing a new frame compares it row by
+# row with the old one and only rewrites the rows that changed, using ANSI
+# cursor positioning. Everything for one frame goes out in a single
+# sys.stdout.write, so a keystroke usually costs one short write instead of
+# a full clear-and-redraw.
+
+import sys
+
+CLEAR_SCREEN = "\033[2J"
+CLEAR_TO_EOL = "\033[K"
+HIDE_CURSOR = "\033[?25l"
+SHOW_CURSOR = "\033[?25h"
+
+
+def goto(screen_row, screen_col):
+    """ANSI sequence moving the cursor to a 1-based terminal cell."""
+    return "\033[%d;%dH" % (screen_row, screen_col)
+
+
+class FrameRenderer:
+    """Keeps the previous frame and writes only the damaged rows."""
+
+    def __init__(self, out=None):
+        self.out = out
+        self.previous = None
+
+    def invalidate(self):
+        """Forget the previous frame; the next draw repaints everything."""
+        self.previous = None
+
+    def draw(self, rows, cursor):
+        """
+        Bring the terminal up to date with rows.
+
+        rows:   list of strings, one per terminal row (top to bottom)
+        cursor: (row, col) 1-based terminal cell to leave the cursor on
+        Returns the number of rows that were rewritten.
+        """
+        out = self.out or sys.stdout
+        previous = self.previous
+
+        parts = [HIDE_CURSOR]
+        if previous is None:
+            parts.append(CLEAR_SCREEN)
+            previous = []
+
+        changed = 0
+        for i, line in enumerate(rows):
+            if i < len(previous) and previous[i] == line:
+                continue
+            parts.append(goto(i + 1, 1))
+            parts.append(line)
+            parts.append(CLEAR_TO_EOL)
+            changed += 1
+
+        # Rows that existed last frame but not in this one.
+        for i in range(len(rows), len(previous)):
+            parts.append(goto(i + 1, 1))
+            parts.append(CLEAR_TO_EOL)
+            changed += 1
+
+        parts.append(goto(*cursor))
+        parts.append(SHOW_CURSOR)
+
+        out.write("".join(parts))
+        out.flush()
+
+        self.previous = list(rows)
+        return changed
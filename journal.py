@@ -0,0 +1,215 @@
+# journal.py
+# Append-only crash journal for unsaved edits.
+#
+# Every op that goes through buffer_op.apply_op() is written as one
+# compact JSON line to a journal file next to the document. Undo and redo
+# are written as the concrete edit they made (the inverse op, the redone
+# op), since the undo history they ran against is gone after a crash and
+# a save. Each line is flushed to the OS right away, so it survives the
+# editor crashing or being killed; fsync (surviving power loss) is batched.
+#
+# The first line records the size and mtime of the document the ops apply
+# to. Saving the document starts a fresh journal. On startup, a journal
+# whose header still matches the document is replayed onto it, which
+# restores the unsaved session without re-editing anything.
+
+import json
+import os
+import time
+
+import buffer_op
+
+# fsync after this many entries, or this many seconds since the last one.
+SYNC_EVERY_OPS = 64
+SYNC_EVERY_SECONDS = 1.0
+
+
+def journal_path(doc_path):
+    """Journal file for a document: a hidden sibling file."""
+    folder, name = os.path.split(os.path.abspath(doc_path))
+    return os.path.join(folder, ".%s.journal" % name)
+
+
+def _base(doc_path):
+    st = os.stat(doc_path)
+    return {"kind": "base", "size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+class Journal:
+    """Open journal for one document."""
+
+    def __init__(self, doc_path):
+        self.doc_path = doc_path
+        self.path = journal_path(doc_path)
+        self._file = None
+        self.entries = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def open(self, fresh):
+        """Start appending; fresh=True discards old entries first."""
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        if exists and not fresh:
+            self.entries = len(read_entries(self.path)[0])
+        self._file = open(self.path, "w" if fresh or not exists else "a", encoding="utf-8")
+        if fresh or not exists:
+            self.record(_base(self.doc_path))
+            self.sync()
+        return self
+
+    def record(self, entry):
+        """Append one op (a dict in apply_op's schema) to the journal."""
+        self._file.write(json.dumps(entry, separators=(",", ":")))
+        self._file.write("\n")
+        self._file.flush()
+        self.entries += 1
+        self._unsynced += 1
+        if (self._unsynced >= SYNC_EVERY_OPS
+                or time.monotonic() - self._last_sync >= SYNC_EVERY_SECONDS):
+            self.sync()
+
+    def sync(self):
+        """Force everything written so far onto the disk."""
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def reset(self):
+        """The document was just saved: start over with an empty journal."""
+        self.close()
+        self.open(fresh=True)
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Close and delete the journal (clean exit)."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def read_entries(path):
+    """
+    Load journal entries, ignoring a torn last line from a crash mid-write.
+    Returns (entries, number of bytes holding complete entries).
+    """
+    entries = []
+    good = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+            good += len(line)
+    return entries, good
+
+
+def apply_entry(entry, record_history=True):
+    """
+    Apply one entry: an op in apply_op's schema, rows restored by an undone
+    replace, or an undo/redo marker (op scripts only; the journal itself
+    records the concrete edit an undo or redo made).
+    """
+    kind = entry["kind"]
+    if kind == "undo":
+        buffer_op.undo()
+    elif kind == "redo":
+        buffer_op.redo()
+    elif kind == "set_rows":
+        buffer_op.set_rows(entry["rows"])
+    else:
+        buffer_op.apply_op(entry, record_history=record_history)
+
+
+def replay(doc_path):
+    """
+    Re-apply the journal of doc_path onto the freshly loaded buffer.
+    Returns the number of entries replayed (0 if there was nothing to
+    recover, or the journal belongs to a different version of the file).
+    """
+    path = journal_path(doc_path)
+    if not os.path.exists(path):
+        return 0
+
+    entries, good = read_entries(path)
+    if good < os.path.getsize(path):
+        # Drop the torn tail so new entries start on a fresh line.
+        os.truncate(path, good)
+    if len(entries) <= 1:
+        os.remove(path)
+        return 0
+    if entries[0] != _base(doc_path):
+        # Written against another version of the document; keep it aside.
+        os.replace(path, path + ".stale")
+        return 0
+
+    previous, buffer_op.journal = buffer_op.journal, None
+    try:
+        for entry in entries[1:]:
+            apply_entry(entry)
+    finally:
+        buffer_op.journal = previous
+
+    return len(entries) - 1
+
+
+def start(doc_path):
+    """
+    Replay any journal left behind for doc_path, then keep journaling.
+    Returns the number of recovered entries.
+    """
+    stop()
+    recovered = replay(doc_path)
+    buffer_op.journal = Journal(doc_path).open(fresh=not recovered)
+    return recovered
+
+
+def mark():
+    """
+    Number of entries journaled so far, or None when not journaling.
+    Taken together with a snapshot of the buffer that is saved later.
+    """
+    current = buffer_op.journal
+    return current.entries if current is not None else None
+
+
+def restart(doc_path, keep_after=None):
+    """
+    Begin a fresh journal for doc_path (after saving it).
+
+    keep_after is a mark() taken when the saved text was snapshotted:
+    entries recorded since then are edits the file does not have yet, so
+    they are carried over into the new journal. Call with the buffer lock
+    held so nothing is recorded in between.
+    """
+    carried = []
+    current = buffer_op.journal
+    if keep_after is not None and current is not None:
+        current.sync()
+        carried = read_entries(current.path)[0][keep_after:]
+    stop()
+    buffer_op.journal = Journal(doc_path).open(fresh=True)
+    for entry in carried:
+        buffer_op.journal.record(entry)
+
+
+def stop(discard=False):
+    """Stop journaling; discard=True also deletes the journal file."""
+    current, buffer_op.journal = buffer_op.journal, None
+    if current is not None:
+        if discard:
+            current.discard()
+        else:
+            current.close()
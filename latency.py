@@ -0,0 +1,141 @@
+# latency.py
+# Opt-in timing of the editor's hot paths.
+#
+# When ENABLED, every handled key batch and every frame records how long
+# each stage took:
+#
+#   input   - from the key event to the editor starting to handle it
+#   apply   - buffer_op.apply_op() / undo() (redo goes through apply_op)
+#   scroll  - buffer_op.adjust_top_line() / adjust_left_col()
+#   render  - building the screen rows (highlight: the same in search mode)
+#   write   - diffing the frame and writing it to the terminal
+#
+# Samples go into log-scale histograms (four buckets per doubling, so a
+# percentile is off by at most ~19%) that never grow with the number of
+# samples. main.py shows p50/p99 per stage in an overlay row and can
+# export everything to a JSON file. While disabled, a timed call costs one
+# extra function call and a flag check.
+
+import functools
+import json
+import math
+from time import perf_counter
+
+# Set from editor.ini ([editor] latency = on).
+ENABLED = False
+
+# Buckets per doubling of the sample time.
+STEPS = 4
+
+# Sample times are bucketed in microseconds; 128 buckets cover 2**32 us.
+BUCKETS = 128
+
+# Stages in the order they happen, for the overlay and the export.
+STAGES = ("input", "apply", "scroll", "render", "highlight", "write")
+
+
+class Histogram:
+    """Fixed-size log-scale histogram of durations in seconds."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        i = int(math.log2(us) * STEPS) + 1 if us >= 1 else 0
+        self.counts[min(i, BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile, in seconds."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(2 ** (i / STEPS) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+histograms = {stage: Histogram() for stage in STAGES}
+
+
+def now():
+    """Start time for add(); 0.0 while disabled."""
+    return perf_counter() if ENABLED else 0.0
+
+
+def add(stage, start):
+    """Record the time since start (from now()) for stage."""
+    if ENABLED:
+        histograms[stage].add(perf_counter() - start)
+
+
+def sample(stage, seconds):
+    """Record an already measured duration for stage."""
+    if ENABLED:
+        histograms[stage].add(seconds)
+
+
+def timed(stage):
+    """Decorator recording every call of the function under stage."""
+    def wrap(func):
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histograms[stage].add(perf_counter() - start)
+        return timed_func
+    return wrap
+
+
+def reset():
+    for stage in STAGES:
+        histograms[stage] = Histogram()
+
+
+def overlay():
+    """One status row: p50/p99 in milliseconds for every stage seen so far."""
+    parts = []
+    for stage in STAGES:
+        h = histograms[stage]
+        if h.count:
+            parts.append("%s %.2f/%.2f" % (stage, h.percentile(50) * 1e3,
+                                            h.percentile(99) * 1e3))
+    return "-- LATENCY p50/p99 ms: " + (" | ".join(parts) if parts else "no samples")
+
+
+def export(path):
+    """Write per-stage summaries and raw bucket counts to path as JSON."""
+    data = {
+        "bucket_steps_per_doubling": STEPS,
+        "stages": {stage: dict(histograms[stage].summary(),
+                               buckets=histograms[stage].counts)
+                   for stage in STAGES},
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=1)
@@ -1,14 +1,33 @@
 # This file contains the high-level control flow of the editor.
 # It manages rendering, hotkeys, file I/O, and interaction with buffer_op,
 # which handles the actual text buffer and cursor state.
+#
+# The editor runs on an asyncio loop with separate tasks: one reads key
+# events and applies them through buffer_op, one draws frames (at most
+# FRAME_RATE per second), and slow work such as saving or the blocking
+# input() dialogs runs on worker threads, so none of it stalls typing.
 
+import asyncio
 import configparser
+import os
+import threading
 import time
 
 import keyboard
 
 import buffer_op
-from buffer_op import clear_screen, move_cursor
+import cell_width
+import journal
+import latency
+import swap_file
+import syntax
+import workspace
+from atomic_save import atomic_write, save_buffer
+from buffer_op import clear_screen
+from frame_renderer import FrameRenderer
+from project_search import start_project_search
+from search_job import start_search
+from text_search import decode_pattern
 
 # Keys that produce characters vs keys that move the cursor.
 # These sets help the editor decide whether a key inserts text or navigates.
@@ -19,6 +38,9 @@ functional_keys_cursor = {"up", "down", "left", "right", "home", "end", "page up
 file_name = None
 status = None
 
+# Status of the documents in the background, by path.
+statuses = {}
+
 # Editor reads/writes the most recently opened file to editor.ini.
 config_parser = configparser.ConfigParser()
 
@@ -29,6 +51,83 @@ HIGHLIGHT_END   = "\033[0m"
 # When True, render() shows highlighted search results.
 search_mode = False
 
+# Remembers what is on screen so render() only rewrites changed rows.
+frame = FrameRenderer()
+
+# render() must never run twice at once.
+render_lock = threading.Lock()
+
+# Frames drawn per second at most; further requests are merged.
+FRAME_RATE = 60
+
+# The asyncio loop running the editor, and the render task's wake-up flag.
+loop = None
+frame_wanted = None
+
+# Pending background jobs (saves), see background().
+jobs = set()
+
+# Seconds between two checks for documents due for an autosave.
+AUTOSAVE_POLL = 1.0
+
+# Error of the last failed autosave, shown until one succeeds.
+autosave_error = None
+
+# Held while a save is writing; switching documents waits for it.
+save_lock = None
+
+# Bumped on every edit, so a save can tell whether it is still current.
+edits = 0
+
+# The running (or last) background search, see search_job.py.
+search = None
+
+# The running (or last) search across a folder (Ctrl+G), see project_search.py.
+grep = None
+
+# Key events are queued by a keyboard hook instead of read one at a time,
+# so a burst (a paste, key repeat) piles up here and is handled as one
+# batch: typed runs become a single insert op and the frame is drawn once.
+key_events = None
+
+# Cleared while a dialog owns the terminal, so keys typed into input()
+# (and the ESC sent by fix_ui) never reach the buffer.
+capture_keys = threading.Event()
+
+# Upper bound on the events handled between two frames.
+MAX_BATCH = 65536
+
+
+def syntax_spans(doc, segments):
+    """Syntax token spans of the rows on screen, by row (empty if not highlighting)."""
+    if doc.syntax is None or not segments:
+        return {}
+    start = segments[0][0]
+    end = segments[-1][0] + 1
+    return dict(zip(range(start, end), doc.syntax.spans(doc.line_text, start, end)))
+
+
+def buffer_rows():
+    """
+    The portion of the buffer currently visible in the viewport,
+    one string per screen row, padded with blanks to a full page.
+    With soft wrap on, a long row fills several screen rows.
+    """
+    doc = buffer_op.current
+    segments = doc.visible_segments()
+    spans_by_row = syntax_spans(doc, segments)
+
+    # Each visible line (or wrapped part of one), cropped to the screen cells
+    rows = []
+    for row, from_cell, to_cell in segments:
+        visible, from_col = doc.visible_text(row, from_cell, to_cell)
+        spans = spans_by_row.get(row)
+        rows.append(syntax.paint(visible, from_col, spans) if spans else "".join(visible))
+
+    # Blank lines fill the screen if buffer is shorter
+    rows.extend("" for _ in range(len(segments), buffer_op.get_max_line()))
+    return rows
+
 
 def print_buffer():
     """
@@ -36,69 +135,226 @@ def print_buffer():
     This editor only renders what fits on screen to keep things fast
     and avoid flickering.
     """
-    start = buffer_op.get_top_line()
-    end = min(start + buffer_op.get_max_line(), len(buffer_op.buffer))
+    for line in buffer_rows():
+        print(line)
 
-    from_col = buffer_op.get_left_col()
-    to_col = from_col + buffer_op.get_max_col()
 
-    # Render each visible line, cropped horizontally
-    for i in range(start, end):
-        full_line = "".join(buffer_op.buffer[i])
-        visible = full_line[from_col:to_col]
-        print(visible)
+def search_status():
+    """Match counter shown in the status bar while in search mode."""
+    if not search_mode:
+        return ""
+    count = len(buffer_op.matches)
+    if search is not None and search.running:
+        return "-- %d matches so far (Esc cancels) " % count
+    return "-- %d matches " % count
 
-    # Print blank lines to fill the screen if buffer is shorter
-    for _ in range(end, start + buffer_op.get_max_line()):
-        print("")
+
+def grep_status():
+    """Result counter of the project search, with F4 to walk it."""
+    if grep is None:
+        return ""
+    if grep.running:
+        return "-- grep: %d results in %d files so far (F4) " % (len(grep.results), grep.files)
+    return "-- grep: %d results in %d files (F4) " % (len(grep.results), grep.files)
+
+
+def autosave_status():
+    """Time of the current document's last autosave."""
+    if autosave_error is not None:
+        return "-- AUTOSAVE FAILED: %s " % autosave_error
+    swap = buffer_op.swap
+    if swap is None or swap.saved_at is None:
+        return ""
+    return "-- autosaved %s " % time.strftime("%H:%M:%S", time.localtime(swap.saved_at))
+
+
+def status_line():
+    display_name = file_name if file_name else "No Name"
+    undo_ops, undo_bytes = buffer_op.history_usage()
+    return (
+        "-- FILE EDITOR -- STATUS:[%s] -- [%s] Ln %d, Col %d %s%s%s"
+        "-- Undo %d (%d KB) Ctrl+O Open Ctrl+B Buffers Ctrl+W Wrap Ctrl+S Save Ctrl+Q Quit" %
+        (status, display_name, buffer_op.row, buffer_op.col, search_status(),
+         grep_status(), autosave_status(), undo_ops, undo_bytes // 1024)
+    )
 
 
 def render():
     """
-    Clear the screen and redraw the entire editor UI.
-    This includes the text viewport, status bar, and moving
-    the cursor to its correct terminal position.
+    Redraw the editor UI: text viewport, status bar, and the
+    terminal cursor at its correct position. Only screen rows
+    that differ from the previous frame are sent to the terminal.
+
+    Runs on the event loop, so it never waits for the buffer lock: while
+    a worker thread holds it (a replace-all, a memory-mapped save) the
+    frame is skipped and False returned.
     """
-    global file_name, status, search_mode
-    clear_screen()
+    with render_lock:
+        lock = buffer_op.lock
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            start = latency.now()
+            rows = search_rows() if search_mode else buffer_rows()
+            rows.append(status_line())
+            if latency.ENABLED:
+                rows.append(latency.overlay())
+            latency.add("highlight" if search_mode else "render", start)
 
-    if search_mode:
-        print_search_buffer()
+            start = latency.now()
+            frame.draw(rows, buffer_op.cursor_screen_pos())
+            latency.add("write", start)
+        finally:
+            lock.release()
+    return True
+
+
+def request_render():
+    """Ask the render task for a frame. Safe to call from any thread."""
+    if loop is not None:
+        loop.call_soon_threadsafe(frame_wanted.set)
+
+
+async def render_frames():
+    """Render task: draw when asked, at most FRAME_RATE times a second."""
+    while True:
+        await frame_wanted.wait()
+        frame_wanted.clear()
+        # While a dialog owns the terminal it is left alone.
+        if capture_keys.is_set() and not render():
+            # The buffer is busy on a worker thread: try the next frame.
+            frame_wanted.set()
+        await asyncio.sleep(1 / FRAME_RATE)
+
+
+def background(coro):
+    """Run coro as a task of its own, keeping a reference until it ends."""
+    task = asyncio.ensure_future(coro)
+    jobs.add(task)
+    task.add_done_callback(jobs.discard)
+    return task
+
+
+async def autosave_documents():
+    """
+    Autosave task: every AUTOSAVE_POLL seconds, write the documents that
+    are due (see swap_file.py) on a worker thread, one at a time.
+    """
+    global autosave_error
+    while True:
+        await asyncio.sleep(AUTOSAVE_POLL)
+        for doc in workspace.documents():
+            if doc.swap is None or not doc.swap.due():
+                continue
+            try:
+                written = await asyncio.to_thread(swap_file.autosave, doc)
+            except OSError as e:
+                autosave_error = e.strerror
+                request_render()
+                continue
+            if written:
+                autosave_error = None
+                request_render()
+
+
+async def edit(apply, *args):
+    """
+    Run a buffer_op edit from the event loop. If a worker thread holds the
+    buffer lock (a memory-mapped save), wait for it on a thread instead,
+    so the loop keeps serving frames and autosaves meanwhile.
+    """
+    lock = buffer_op.lock
+    if lock.acquire(blocking=False):
+        try:
+            apply(*args)
+        finally:
+            lock.release()
     else:
-        print_buffer()
+        await asyncio.to_thread(apply, *args)
 
-    display_name = file_name if file_name else "No Name"
 
-    print(
-        "-- FILE EDITOR -- STATUS:[%s] -- [%s] Ln %d, Col %d "
-        "Ctrl+O Open Ctrl+S Save Ctrl+Q Quit" %
-        (status, display_name, buffer_op.row, buffer_op.col)
-    )
+def mark_unsaved():
+    global status, edits
+    status = "UNSAVED"
+    edits += 1
+
+
+def search_progress(job):
+    """Called from the search thread as results stream in."""
+    if search_mode:
+        request_render()
+
+
+def grep_progress(job):
+    """Called from the project search thread as results stream in."""
+    request_render()
+
+
+def prompt_screen():
+    """
+    Clear the terminal before a dialog takes it over with print()/input().
+    The next render() then repaints the whole frame.
+    """
+    capture_keys.clear()
+    clear_screen()
+    frame.invalidate()
+
+
+async def ask(prompt):
+    """Show a blocking input() prompt on a worker thread and return the answer."""
+    prompt_screen()
+    return await asyncio.to_thread(input, prompt)
+
+
+def queue_key(event):
+    """keyboard hook (listener thread): hand events to the input task."""
+    if capture_keys.is_set():
+        loop.call_soon_threadsafe(key_events.put_nowait, event)
 
-    # Restore terminal cursor to logical editor cursor.
-    move_cursor()
 
+def resume_keys():
+    """Drop whatever was typed into a dialog and start capturing again."""
+    while not key_events.empty():
+        key_events.get_nowait()
+    capture_keys.set()
+    request_render()
 
-def render_line(row_index, chars, from_col):
+
+async def read_batch():
+    """Wait for the next key event, then take everything queued behind it."""
+    if not capture_keys.is_set():
+        resume_keys()
+    batch = [await key_events.get()]
+    while len(batch) < MAX_BATCH and not key_events.empty():
+        batch.append(key_events.get_nowait())
+    return batch
+
+
+def highlight_line(row_index, chars, from_col, line_matches=None, spans=None):
     """
-    Helper used only when the editor is in search mode.
-    Draws a single line with highlighted matches.
+    Build a single line with highlighted matches (search mode).
 
     row_index: index in the real buffer
     chars: visible portion of that row
     from_col: starting column of the viewport (to adjust highlighting)
+    line_matches: (start, end) spans on this row, looked up if not given
+    spans: syntax token spans of the row, drawn under the matches
     """
-    line_matches = [(s, e) for (row, s, e) in buffer_op.matches if row == row_index]
+    if line_matches is None:
+        line_matches = [(s, e) for (_, s, e)
+                        in buffer_op.matches.in_rows(row_index, row_index + 1)]
+
+    if spans:
+        return syntax.paint(chars, from_col, spans, line_matches, HIGHLIGHT_START)
 
     if not line_matches:
-        print("".join(chars))
-        return
+        return "".join(chars)
 
     line = ""
     i = 0
 
-    # Apply highlighting around matched segments
-    for (start, end) in sorted(line_matches):
+    # Apply highlighting around matched segments (already sorted)
+    for (start, end) in line_matches:
         local_start = start - from_col
         local_end   = end   - from_col
 
@@ -113,23 +369,31 @@ def render_line(row_index, chars, from_col):
         i = local_end
 
     line += "".join(chars[i:])
-    print(line)
+    return line
 
 
-def print_search_buffer():
+def search_rows():
     """
-    Like print_buffer(), but uses render_line() so that
+    Like buffer_rows(), but uses highlight_line() so that
     matched search results appear highlighted.
     """
-    start = buffer_op.get_top_line()
-    end = min(start + buffer_op.get_max_line(), len(buffer_op.buffer))
+    doc = buffer_op.current
+    segments = doc.visible_segments()
+    spans_by_row = syntax_spans(doc, segments)
 
-    from_col = buffer_op.get_left_col()
-    to_col = from_col + buffer_op.get_max_col()
+    # One index query for the whole viewport instead of one scan per row.
+    visible_matches = {}
+    if segments:
+        visible_matches = doc.matches.by_row(segments[0][0], segments[-1][0] + 1)
 
-    for row in range(start, end):
-        visible = buffer_op.buffer[row][from_col:to_col]
-        render_line(row, visible, from_col)
+    rows = []
+    for row, from_cell, to_cell in segments:
+        visible, from_col = doc.visible_text(row, from_cell, to_cell)
+        rows.append(highlight_line(row, visible, from_col,
+                                   visible_matches.get(row, ()), spans_by_row.get(row)))
+
+    rows.extend("" for _ in range(len(segments), buffer_op.get_max_line()))
+    return rows
 
 
 def render_search():
@@ -137,25 +401,24 @@ def render_search():
     Separate rendering path specifically used during replace-all
     operations or search mode. Keeps UI consistent.
     """
-    global file_name, status
-    clear_screen()
-    print_search_buffer()
-
+    rows = search_rows()
     display_name = file_name if file_name else "No Name"
 
-    print(
-        """-- FILE EDITOR -- STATUS:[%s] -- [%s] Ln %d, Col %d 
-        Ctrl+O Open Ctrl+S Save Ctrl+Q Quit
-        Ctrl+Z Undo Ctrl+Y Redo Ctrl+/ Search Ctrl+R Replace Ctrl+Left/Right word jump""" %
-        (status, display_name, buffer_op.row, buffer_op.col)
-    )
-    move_cursor()
+    rows.append("-- FILE EDITOR -- STATUS:[%s] -- [%s] Ln %d, Col %d" %
+                (status, display_name, buffer_op.row, buffer_op.col))
+    rows.append("Ctrl+O Open Ctrl+S Save Ctrl+Q Quit")
+    rows.append("Ctrl+Z Undo Ctrl+Y Redo Ctrl+/ Search Ctrl+R Replace "
+                "Ctrl+Left/Right word jump")
+
+    frame.draw(rows, buffer_op.cursor_screen_pos())
 
 
 def load_config():
     """
     On startup, try to restore the last opened file.
     If the ini file doesn’t exist or is corrupt, just start empty.
+    Edits left unsaved by a crash are replayed from the file's journal;
+    without one, recovery from a newer swap file is offered.
     """
     global file_name, config_parser, status
     try:
@@ -164,12 +427,57 @@ def load_config():
     except Exception:
         path = None
 
+    # Optional storage engine override: lines, piece_table, mmap or auto.
+    buffer_op.ENGINE = config_parser.get("editor", "engine", fallback=buffer_op.ENGINE)
+
+    # Optional undo history budget.
+    buffer_op.UNDO_LIMIT_OPS = config_parser.getint(
+        "editor", "undo_ops", fallback=buffer_op.UNDO_LIMIT_OPS)
+    buffer_op.UNDO_LIMIT_BYTES = config_parser.getint(
+        "editor", "undo_bytes", fallback=buffer_op.UNDO_LIMIT_BYTES)
+
+    # Optional latency instrumentation (overlay row, export on exit).
+    latency.ENABLED = config_parser.getboolean(
+        "editor", "latency", fallback=latency.ENABLED)
+
+    # Screen cells per tab stop.
+    cell_width.TAB_SIZE = config_parser.getint("editor", "tab_size", fallback=cell_width.TAB_SIZE)
+
+    # Soft wrap of long lines (toggled with Ctrl+W).
+    buffer_op.WRAP = config_parser.getboolean("editor", "wrap", fallback=buffer_op.WRAP)
+
+    # Syntax highlighting for .py, .ini and .json files.
+    syntax.ENABLED = config_parser.getboolean("editor", "syntax", fallback=syntax.ENABLED)
+
+    # Memory the background documents may use before being spilled to disk.
+    workspace.MEMORY_BUDGET = config_parser.getint(
+        "editor", "memory_budget", fallback=workspace.MEMORY_BUDGET)
+
+    # Autosave to the swap file after this many seconds or edits.
+    swap_file.AUTOSAVE_SECONDS = config_parser.getfloat(
+        "editor", "autosave_seconds", fallback=swap_file.AUTOSAVE_SECONDS)
+    swap_file.AUTOSAVE_OPS = config_parser.getint(
+        "editor", "autosave_ops", fallback=swap_file.AUTOSAVE_OPS)
+
     if path:
-        file_name = buffer_op.load_file(path)
-        status = "SAVED"
+        recovered = workspace.open_document(path)
+        file_name = workspace.current_path()
+        status = "RECOVERED %d EDITS" % recovered if recovered else "SAVED"
     else:
+        recovered = 0
+        swap_file.start(None)
         status = "UNSAVED"
 
+    if not recovered and swap_file.pending(file_name):
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(
+            os.path.getmtime(swap_file.swap_path(file_name))))
+        answer = input("Recover unsaved changes autosaved at %s? (y/n): " % when)
+        if answer.strip().lower().startswith("y"):
+            rows = swap_file.recover(file_name)
+            status = "RECOVERED %d ROWS FROM SWAP" % rows
+        else:
+            buffer_op.swap.discard()
+
 
 def save_config():
     """
@@ -180,20 +488,22 @@ def save_config():
     if file_name is None:
         return
 
-    config_parser["editor"] = {"path": file_name}
+    if not config_parser.has_section("editor"):
+        config_parser.add_section("editor")
+    config_parser["editor"]["path"] = file_name
 
     with open("editor.ini", "w") as configfile:
         config_parser.write(configfile)
 
 
-def open_file():
+async def open_file():
     """
     Prompt user for a path and attempt to load it.
     This intentionally loops until a valid file is entered.
     """
     global file_name, status
     while True:
-        path = input("Enter file path: ")
+        path = await asyncio.to_thread(input, "Enter file path: ")
         try:
             with open(path, "r"):
                 pass
@@ -201,162 +511,430 @@ def open_file():
         except OSError:
             print("File not found or cannot be opened. Try again.")
 
-    file_name = path
-    buffer_op.load_file(file_name)
-    status = "SAVED"
+    # A save still writing the previous document finishes first.
+    async with save_lock:
+        leave_document()
+        recovered = workspace.open_document(path)
+        file_name = workspace.current_path()
+    if recovered:
+        status = "RECOVERED %d EDITS" % recovered
+    else:
+        status = statuses.pop(file_name, "SAVED")
     save_config()
 
 
-def save_file():
+def leave_document():
+    """Park the current document's UI state before another becomes current."""
+    global search_mode
+    if search is not None:
+        search.cancel()
+    search_mode = False
+    if file_name is not None:
+        statuses[file_name] = status
+
+
+async def switch_dialogue():
+    """List the open documents (most recent first) and switch to one."""
+    global file_name, status
+    choices = workspace.paths()
+    for i, path in enumerate(choices, 1):
+        marks = []
+        if path == file_name:
+            marks.append("current")
+        if workspace.is_spilled(path):
+            marks.append("on disk")
+        print("%d. %s%s" % (i, path, " (%s)" % ", ".join(marks) if marks else ""))
+
+    answer = await asyncio.to_thread(input, "Switch to buffer number: ")
+    try:
+        path = choices[int(answer) - 1]
+    except (ValueError, IndexError):
+        return
+    if path == file_name:
+        return
+
+    async with save_lock:
+        leave_document()
+        workspace.switch(path)
+        file_name = path
+        status = statuses.pop(path, "SAVED")
+    save_config()
+
+
+def write_file(path):
+    """
+    Worker thread half of save_file().
+
+    In-memory buffers are snapshotted under the buffer lock (copy on
+    write, see Document.snapshot()) and written without it, so typing goes
+    on during the write; edits made meanwhile are carried over into the
+    new journal. A memory-mapped buffer is
+    re-mapped onto the new file and keeps the lock for the whole save.
+    Either way the file is streamed into a temp file and renamed over the
+    original, so a crash mid-save never leaves a half-written document.
+    """
+    doc = buffer_op.current
+    with buffer_op.lock:
+        chunks = doc.snapshot()
+        if chunks is None:
+            save_buffer(buffer_op.buffer, path)
+            journal.restart(path)
+            swap_file.restart(path)
+            return
+        saved = journal.mark()
+        swap_file.pause()
+
+    try:
+        atomic_write(path, chunks)
+    except OSError:
+        with buffer_op.lock:
+            swap_file.resume()
+        raise
+    finally:
+        doc.release_snapshot()
+    with buffer_op.lock:
+        journal.restart(path, keep_after=saved)
+        swap_file.restart(path)
+
+
+async def save_file():
     """
     Save the current buffer back to disk.
     If the user hasn't chosen a name yet, prompt for one.
+    Returns False if the file could not be written.
     """
     global file_name, status
 
     if file_name is None:
-        clear_screen()
-        file_name = input("Enter filename: ")
-
-    lines = ["".join(l) + "\n" for l in buffer_op.buffer]
-    with open(file_name, "w") as f:
-        f.writelines(lines)
-
-    status = "SAVED"
+        file_name = await ask("Enter filename: ")
 
-
-def fix_ui():
+    async with save_lock:
+        before = edits
+        status = "SAVING"
+        request_render()
+        try:
+            await asyncio.to_thread(write_file, file_name)
+        except OSError as e:
+            status = "SAVE FAILED: %s" % e.strerror
+            request_render()
+            return False
+        else:
+            status = "SAVED" if edits == before else "UNSAVED"
+            if workspace.current_path() is None:
+                # A new document got its name: it joins the buffer list,
+                # highlighted by its extension from now on.
+                buffer_op.current.syntax = syntax.for_path(file_name)
+                workspace.add(os.path.abspath(file_name), buffer_op.current)
+                file_name = workspace.current_path()
+        request_render()
+    return True
+
+
+async def fix_ui():
     """
     Small hack: after reading a key event, the terminal can
     get out of sync visually. Sending ESC cleans up the state.
     """
-    time.sleep(1)
+    capture_keys.clear()
+    await asyncio.sleep(1)
     keyboard.send("esc")
 
 
-def search_dialogue():
+async def search_dialogue():
     """
     Ask user for a search string, switch into search mode, and highlight
-    all matches immediately.
+    all matches immediately. A typed \\n searches across a line break.
     """
-    global search_mode
-    search_string = input("Enter search criteria: ")
+    global search_mode, search
+    typed = await asyncio.to_thread(input, "Enter search criteria (\\n for a line break): ")
+    search_string = decode_pattern(typed)
     search_mode = True
-    buffer_op.search_all(search_string)
+    search = start_search(search_string, search_progress)
+
 
+async def grep_dialogue():
+    """Ask for a folder and a search string and search every file under it."""
+    global grep
+    folder = await asyncio.to_thread(input, "Search in folder (Enter for current): ")
+    pattern = await asyncio.to_thread(input, "Search files for: ")
+    if grep is not None:
+        grep.cancel()
+    grep = start_project_search(folder or os.getcwd(), pattern, grep_progress)
 
-def replace_all_dialogue():
+
+async def open_result(result):
+    """Open the file of a project search result, with the cursor on the match."""
+    global file_name, status
+    if result is None:
+        return
+    path, row, start, end = result
+    async with save_lock:
+        leave_document()
+        recovered = workspace.open_document(path)
+        file_name = workspace.current_path()
+    if recovered:
+        status = "RECOVERED %d EDITS" % recovered
+    else:
+        status = statuses.pop(file_name, "SAVED")
+    buffer_op.goto_match((row, start, end))
+    save_config()
+
+
+async def replace_all_dialogue():
     """
     Full replace-all flow: prompt for search and replace terms,
-    apply the operation (with undo support), and refresh highlights.
+    apply the operation (with undo support), report how many
+    replacements were made, and refresh highlights.
     """
-    global search_mode
+    global search_mode, search, status
 
-    search_string = input("Find: ")
-    replace_string = input("Replace with: ")
+    search_string = await asyncio.to_thread(input, "Find: ")
+    replace_string = await asyncio.to_thread(input, "Replace with: ")
 
     op = {
         "kind": "replace",
         "search": search_string,
         "replace": replace_string,
     }
-    buffer_op.apply_op(op, record_history=True)
+    # A huge buffer takes a while, so it runs on a worker thread. It holds
+    # the buffer lock throughout, which keeps the edit atomic; render()
+    # skips frames rather than wait for it.
+    await asyncio.to_thread(buffer_op.apply_op, op, True)
+    if op.get("count"):
+        mark_unsaved()
+    status = "REPLACED %d" % op.get("count", 0)
 
     # Optionally highlight the new text
-    buffer_op.search_all(replace_string)
     search_mode = True
+    search = start_search(replace_string, search_progress)
 
 
-def main():
-    """
-    Core event loop of the editor.
-    Reads keyboard events, handles hotkeys, and delegates
-    all buffer modifications to buffer_op.
-    """
-    load_config()
-    render()
+def is_typing(key):
+    """True for a key that main() can hand straight to buffer_op."""
+    if key.name in {"ctrl", "shift"} or key.name == "esc":
+        return False
+    if key.name == "f3" and search_mode:
+        return False
+    if key.name == "f4" and grep is not None:
+        return False
+    return not keyboard.is_pressed("ctrl")
 
-    global status, search_mode
 
+async def handle_key(key):
+    """
+    Handle one key that may be a hotkey (ESC, F3, Ctrl+...); anything
+    else goes to buffer_op. Returns False when the editor should quit.
+    """
+    global search_mode, file_name
+
+    # ESC first stops a running search, keeping what it found
+    if key.name == "esc" and search is not None and search.running:
+        search.cancel()
+        await asyncio.to_thread(search.wait)
+        return True
+
+    # Exit search mode with ESC
+    if key.name == "esc" and search_mode:
+        buffer_op.matches.clear()
+        search_mode = False
+        return True
+
+    # F4 / Shift+F4 walk through the project search results
+    if key.name == "f4" and grep is not None:
+        if keyboard.is_pressed("shift"):
+            await open_result(grep.prev_result())
+        else:
+            await open_result(grep.next_result())
+        return True
+
+    # F3 / Shift+F3 walk through the matches
+    if key.name == "f3" and search_mode:
+        if keyboard.is_pressed("shift"):
+            buffer_op.prev_match()
+        else:
+            buffer_op.next_match()
+        return True
+
+    # Handle Ctrl hotkeys
+    if keyboard.is_pressed("ctrl"):
+        if key.name == "o":
+            prompt_screen()
+            await fix_ui()
+            await open_file()
+            return True
+
+        elif key.name == "s":
+            if file_name is None:
+                prompt_screen()
+                await fix_ui()
+                file_name = await ask("Enter filename: ")
+            # Typing goes on while the file is written.
+            background(save_file())
+            return True
+
+        elif key.name == "q":
+            prompt_screen()
+            await fix_ui()
+            if not await save_file():
+                # Keep editing: the journal and swap file still hold the
+                # unsaved edits, and the status bar says why.
+                return True
+            save_config()
+            journal.stop(discard=True)
+            swap_file.stop(discard=True)
+            return False
+
+        elif key.name == "z":
+            await edit(buffer_op.undo)
+            return True
+
+        elif key.name == "y":
+            await edit(buffer_op.redo)
+            return True
+
+        elif key.name == "/":
+            prompt_screen()
+            await fix_ui()
+            await search_dialogue()
+            return True
+
+        elif key.name == "r":
+            prompt_screen()
+            await fix_ui()
+            await replace_all_dialogue()
+            return True
+
+        elif key.name == "n":
+            prompt_screen()
+            await fix_ui()
+            async with save_lock:
+                leave_document()
+                file_name = None
+                buffer_op.use(buffer_op.Document())
+            await save_file()
+            save_config()
+            return True
+
+        elif key.name == "b":
+            prompt_screen()
+            await fix_ui()
+            await switch_dialogue()
+            return True
+
+        elif key.name == "w":
+            buffer_op.set_wrap(not buffer_op.WRAP)
+            return True
+
+        elif key.name == "g":
+            prompt_screen()
+            await fix_ui()
+            await grep_dialogue()
+            return True
+
+    if key.name in {"ctrl", "shift"}:
+        return True
+
+    # Everything else (Ctrl+arrows, ...) is an edit
+    await edit(buffer_op.record_key, key)
+    mark_unsaved()
+    return True
+
+
+async def read_input():
+    """
+    Input task: read batches of keyboard events, handle hotkeys, and
+    delegate all buffer modifications to buffer_op. Returns on Ctrl+Q.
+    """
     while True:
-        try:
-            render()
-            key = keyboard.read_event()
-
+        typed = []
+        running = True
+        batch = await read_batch()
+        if latency.ENABLED:
+            # Time the oldest event spent waiting to be handled.
+            latency.sample("input", max(time.time() - batch[0].time, 0.0))
+        for key in batch:
             # Ignore key releases for cleaner input handling
             if key.event_type == keyboard.KEY_UP:
                 continue
-
-            # Exit search mode with ESC
-            if key.name == "esc" and search_mode:
-                buffer_op.matches.clear()
-                search_mode = False
-                render()
+            if is_typing(key):
+                typed.append(key)
                 continue
 
-            # Handle Ctrl hotkeys
-            if keyboard.is_pressed("ctrl"):
-                if key.name == "o":
-                    clear_screen()
-                    fix_ui()
-                    open_file()
-                    continue
-
-                elif key.name == "s":
-                    save_file()
-                    fix_ui()
-                    continue
-
-                elif key.name == "q":
-                    clear_screen()
-                    fix_ui()
-                    save_file()
-                    save_config()
-                    return
-
-                elif key.name == "z":
-                    buffer_op.undo()
-                    continue
-
-                elif key.name == "y":
-                    buffer_op.redo()
-                    continue
-
-                elif key.name == "/":
-                    clear_screen()
-                    fix_ui()
-                    search_dialogue()
-                    continue
-
-                elif key.name == "r":
-                    clear_screen()
-                    fix_ui()
-                    replace_all_dialogue()
-                    continue
-                elif key.name == "n":
-                    global file_name
-                    clear_screen()
-                    file_name = None
-                    fix_ui()
-                    buffer_op.clear_buffer()
-                    save_file()
-                    save_config()
-                    load_config()
-                    continue
-
-            if key.name in {"ctrl", "shift"}:
-                continue
+            # Keep the order: edits typed before a hotkey land first.
+            if typed:
+                await edit(buffer_op.record_keys, typed)
+                mark_unsaved()
+                typed = []
+            running = await handle_key(key)
+            if not running or not capture_keys.is_set():
+                # Quitting, or a dialog took over: keys queued behind
+                # the hotkey are dropped like those typed into it.
+                break
+
+        # Normal typing → send to buffer_op
+        if typed:
+            await edit(buffer_op.record_keys, typed)
+            mark_unsaved()
+        if not running:
+            return
+        request_render()
+
+
+async def run_editor():
+    """Start the render task and the keyboard hook, then process input."""
+    global loop, frame_wanted, key_events, save_lock
+
+    loop = asyncio.get_running_loop()
+    frame_wanted = asyncio.Event()
+    key_events = asyncio.Queue()
+    save_lock = asyncio.Lock()
+
+    renderer = asyncio.create_task(render_frames())
+    autosaver = asyncio.create_task(autosave_documents())
+    keyboard.hook(queue_key)
+    resume_keys()
+    try:
+        await read_input()
+        # Let saves started with Ctrl+S finish before exiting.
+        await asyncio.gather(*jobs)
+    finally:
+        keyboard.unhook(queue_key)
+        renderer.cancel()
+        autosaver.cancel()
+        loop = None
 
-            # Normal typing → send to buffer_op
-            buffer_op.record_key(key)
-            status = "UNSAVED"
 
-        except KeyboardInterrupt:
-            print("history", buffer_op.history)
-            print("buffer", buffer_op.buffer)
-            break
+def main():
+    """
+    Core entry point of the editor: restore the last session, then run
+    the asyncio loop until Ctrl+Q.
+    """
+    load_config()
+    try:
+        asyncio.run(run_editor())
+    except KeyboardInterrupt:
+        # Unsaved edits stay in the journal and swap file for the next start.
+        journal.stop()
+        swap_file.stop()
+        print("history", buffer_op.history)
+        print("buffer", buffer_op.buffer)
+    finally:
+        if grep is not None:
+            grep.cancel()
+        export_latency()
+        workspace.close_all()
+
+
+def export_latency():
+    """Write the latency histograms to latency_file from editor.ini, if set."""
+    path = config_parser.get("editor", "latency_file", fallback=None)
+    if latency.ENABLED and path:
+        latency.export(path)
 
 
 if __name__ == "__main__":
+    if os.name == "nt":
+        # Turns on ANSI escape processing in the Windows console.
+        os.system("")
     clear_screen()
     main()
@@ -0,0 +1,311 @@
+# mapped_file.py
+# Lazy, memory-mapped storage for huge files.
+#
+# Opening a file only maps it; a background thread then scans the mapping
+# and records the byte offset where every line starts. Rows are decoded on
+# demand when something (usually print_buffer) asks for them, and a row is
+# only turned into an editable list of chars once it is actually edited.
+#
+# Rows are described by a list of segments. A segment is either a tuple
+# (first, last) naming a run of untouched file lines, or a plain list of
+# materialized rows (each a list of chars). The very last file segment may
+# have last=None, meaning "up to wherever the index has got to".
+
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_right
+
+from atomic_save import atomic_write
+
+# How much of the mapping the indexer scans between GIL hand-offs.
+INDEX_BLOCK = 4 * 1024 * 1024
+
+# Largest slice of the mapping copied at once when saving.
+COPY_BLOCK = 1024 * 1024
+
+ENCODING = "utf-8"
+
+
+class MappedLines:
+    """
+    Line-addressable view of a file that is decoded and materialized lazily.
+
+    Implements the same row/col primitives as PieceTable, so buffer_op can
+    use it as a drop-in storage engine.
+    """
+
+    def __init__(self, path):
+        self._file = None
+        self._mm = None
+        self._open(path, None)
+
+    # ---- mapping and line index ----
+
+    def _open(self, path, starts):
+        self.path = path
+        self._file = open(path, "rb")
+        self._size = os.fstat(self._file.fileno()).st_size
+        # mmap refuses empty files; an empty file is simply one empty row.
+        self._mm = None
+        if self._size:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._segs = [(0, None)]
+        self._prefix = None
+        self._indexed = threading.Event()
+        self._progress = threading.Condition()
+
+        if starts is not None or not self._size:
+            self._starts = starts if starts is not None else array("q", [0])
+            self._indexed.set()
+        else:
+            self._starts = array("q", [0])
+            self._indexer = threading.Thread(target=self._build_index, daemon=True)
+            self._indexer.start()
+
+    def _build_index(self):
+        """Background thread: record the start offset of every line."""
+        mm = self._mm
+        starts = self._starts
+        pos = 0
+        try:
+            while pos < self._size and self._mm is mm:
+                end = min(pos + INDEX_BLOCK, self._size)
+                found = []
+                i = mm.find(b"\n", pos, end)
+                while i != -1:
+                    found.append(i + 1)
+                    i = mm.find(b"\n", i + 1, end)
+                with self._progress:
+                    starts.extend(found)
+                    self._progress.notify_all()
+                pos = end
+        except ValueError:
+            # The mapping was closed under us (file reloaded or saved).
+            return
+        with self._progress:
+            self._indexed.set()
+            self._progress.notify_all()
+
+    def wait_until_indexed(self, timeout=None):
+        """Block until the background line index is complete."""
+        return self._indexed.wait(timeout)
+
+    def wait_for_rows(self, count):
+        """Block until the first count file lines are indexed (or all are)."""
+        with self._progress:
+            self._progress.wait_for(
+                lambda: self._indexed.is_set() or self._file_lines() >= count)
+
+    def _file_lines(self):
+        """Number of file lines whose extent is known so far."""
+        n = len(self._starts)
+        if not self._indexed.is_set():
+            return n - 1
+        # A trailing newline ends the last line rather than starting one.
+        if self._size and self._starts[-1] == self._size:
+            return n - 1
+        return n
+
+    def _decode(self, i):
+        """Decode untouched file line i."""
+        start = self._starts[i]
+        end = self._starts[i + 1] - 1 if i + 1 < len(self._starts) else self._size
+        raw = self._mm[start:end] if self._mm is not None else b""
+        if raw.endswith(b"\r"):
+            raw = raw[:-1]
+        return raw.decode(ENCODING, errors="replace")
+
+    def close(self):
+        """Release the mapping and the file handle."""
+        mm, self._mm = self._mm, None
+        if mm is not None:
+            mm.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ---- segment bookkeeping ----
+
+    @staticmethod
+    def _seg_len(seg, open_end):
+        if isinstance(seg, list):
+            return len(seg)
+        first, last = seg
+        return (open_end if last is None else last) - first
+
+    def _starts_of_segments(self):
+        """Row number where each segment begins (cached until rows move)."""
+        if self._prefix is None:
+            prefix = []
+            total = 0
+            for seg in self._segs:
+                prefix.append(total)
+                if not (isinstance(seg, tuple) and seg[1] is None):
+                    total += self._seg_len(seg, 0)
+            self._prefix = prefix
+        return self._prefix
+
+    def _locate(self, r):
+        """Map a row to (segment index, offset inside segment)."""
+        if r < 0:
+            r += len(self)
+        prefix = self._starts_of_segments()
+        i = bisect_right(prefix, r) - 1
+        off = r - prefix[i]
+        if i < 0 or off >= self._seg_len(self._segs[i], self._file_lines()):
+            raise IndexError("line index out of range")
+        return i, off
+
+    def _materialize(self, r):
+        """Return the editable char list for row r, decoding it if needed."""
+        i, off = self._locate(r)
+        seg = self._segs[i]
+        if isinstance(seg, list):
+            return seg[off]
+
+        first, last = seg
+        line = list(self._decode(first + off))
+
+        replacement = []
+        if off:
+            replacement.append((first, first + off))
+        if off == 0 and i > 0 and isinstance(self._segs[i - 1], list):
+            # Editing row after row: keep growing the same materialized run.
+            self._segs[i - 1].append(line)
+        else:
+            replacement.append([line])
+        if last is None or first + off + 1 < last:
+            replacement.append((first + off + 1, last))
+
+        self._segs[i:i + 1] = replacement
+        self._prefix = None
+        return line
+
+    # ---- row/col API used by buffer_op ----
+
+    def __len__(self):
+        return sum(self._seg_len(seg, self._file_lines()) for seg in self._segs)
+
+    def __getitem__(self, r):
+        i, off = self._locate(r)
+        seg = self._segs[i]
+        if isinstance(seg, list):
+            return "".join(seg[off])
+        return self._decode(seg[0] + off)
+
+    def __iter__(self):
+        self.wait_until_indexed()
+        for seg in list(self._segs):
+            if isinstance(seg, list):
+                for chars in seg:
+                    yield "".join(chars)
+            else:
+                first, last = seg
+                for i in range(first, self._file_lines() if last is None else last):
+                    yield self._decode(i)
+
+    def line_length(self, r):
+        i, off = self._locate(r)
+        seg = self._segs[i]
+        if isinstance(seg, list):
+            return len(seg[off])
+        return len(self._decode(seg[0] + off))
+
+    def insert(self, r, c, text):
+        self._materialize(r)[c:c] = text
+
+    def delete(self, r, c, length=1):
+        del self._materialize(r)[c:c + length]
+
+    def split_line(self, r, c):
+        line = self._materialize(r)
+        right = line[c:]
+        del line[c:]
+        i, off = self._locate(r)
+        self._segs[i].insert(off + 1, right)
+        self._prefix = None
+
+    def join_line(self, r):
+        line = self._materialize(r)
+        below = self._materialize(r + 1)
+        line.extend(below)
+        i, off = self._locate(r + 1)
+        del self._segs[i][off]
+        if not self._segs[i]:
+            del self._segs[i]
+        self._prefix = None
+
+    def set_line(self, r, text):
+        self._materialize(r)[:] = text
+
+    # ---- saving ----
+
+    def is_clean(self):
+        """True while no row has been edited since the file was mapped."""
+        return self._segs == [(0, None)]
+
+    def _newline(self):
+        """Line ending used by the file itself, for rows written fresh."""
+        if len(self._starts) > 1 and self._mm is not None:
+            end = self._starts[1] - 1
+            if end > 0 and self._mm[end - 1:end] == b"\r":
+                return b"\r\n"
+        return b"\n"
+
+    def _byte_chunks(self, new_starts):
+        """
+        Stream the rows as bytes. Runs of untouched lines are copied
+        straight from the mapping; only edited rows are encoded.
+        new_starts receives the start offset of every written row.
+        """
+        self.wait_until_indexed()
+        newline = self._newline()
+        old_starts = self._starts
+        pos = 0
+        for seg in list(self._segs):
+            if isinstance(seg, list):
+                for chars in seg:
+                    data = "".join(chars).encode(ENCODING) + newline
+                    yield data
+                    pos += len(data)
+                    new_starts.append(pos)
+                continue
+
+            first, last = seg
+            if last is None:
+                last = self._file_lines()
+            if first >= last:
+                continue
+
+            a = old_starts[first]
+            missing_newline = last >= len(old_starts)
+            b = self._size if missing_newline else old_starts[last]
+            for off in range(a, b, COPY_BLOCK):
+                yield self._mm[off:min(off + COPY_BLOCK, b)]
+            if missing_newline:
+                yield newline
+
+            # Row starts inside the run keep their distance from each other.
+            shift = pos - a
+            new_starts.extend(map(shift.__add__, old_starts[first + 1:last]))
+            pos += b - a + (len(newline) if missing_newline else 0)
+            new_starts.append(pos)
+
+    def save(self, path):
+        """
+        Write all rows to path atomically, then re-map onto the new file.
+
+        Saving an unedited buffer to its own file does nothing. Afterwards
+        every row is an untouched line of the new file again, and the line
+        index is the one recorded while writing, so nothing is re-scanned.
+        """
+        if self.is_clean() and os.path.abspath(path) == os.path.abspath(self.path):
+            return
+
+        starts = array("q", [0])
+        atomic_write(path, self._byte_chunks(starts), binary=True,
+                     before_replace=self.close)
+        self._open(path, starts)
@@ -0,0 +1,193 @@
+# match_index.py
+# Search results that stay correct while the buffer is edited.
+#
+# Matches are (row, start, end) tuples kept in sorted order, split into
+# blocks of a few hundred entries. Each block stores its rows relative to a
+# per-block `shift`, so when a line is split or joined every later match can
+# be moved by one row just by bumping the shift of the blocks after the
+# edit, instead of rewriting every tuple.
+#
+# buffer_op rescans only the rows an edit touched and hands the fresh
+# matches to replace_rows(); everything else is left alone.
+#
+# Lookups bisect first over the block start rows and then inside a block,
+# so the renderer's viewport query and next/previous match navigation cost
+# O(log M + k) no matter how many matches there are.
+
+from bisect import bisect_left, bisect_right
+
+# Target number of matches per block.
+BLOCK_SIZE = 512
+
+
+class _Block:
+    __slots__ = ("shift", "items")
+
+    def __init__(self, items):
+        self.shift = 0
+        self.items = items
+
+
+class MatchIndex:
+    """Sorted, incrementally maintained (row, start, end) search matches."""
+
+    def __init__(self):
+        self.pattern = ""
+        self._blocks = []
+        self._firsts = None
+        self._count = 0
+
+    # ---- whole-index operations ----
+
+    def reset(self, pattern, items):
+        """Replace the contents with a fresh search for pattern."""
+        self.pattern = pattern
+        self._blocks = self._chunk(sorted(items))
+        self._firsts = None
+        self._count = len(items)
+
+    def clear(self):
+        """Drop all matches and stop tracking the pattern."""
+        self.reset("", [])
+
+    @staticmethod
+    def _chunk(items):
+        return [_Block(items[i:i + BLOCK_SIZE])
+                for i in range(0, len(items), BLOCK_SIZE)]
+
+    def _first_rows(self):
+        """Actual first row of every block, for bisecting."""
+        if self._firsts is None:
+            self._firsts = [b.items[0][0] + b.shift for b in self._blocks]
+        return self._firsts
+
+    # ---- incremental update ----
+
+    def replace_rows(self, first, last, items, delta=0):
+        """
+        Apply an edit that rewrote rows [first, last].
+
+        Old matches on those rows are dropped, matches on later rows move
+        by delta rows, and items (sorted, already using post-edit row
+        numbers) take the place of the dropped ones.
+        """
+        firsts = self._first_rows()
+        blocks = self._blocks
+
+        # blocks[lo:hi] may hold rows in [first, last]; blocks[hi:] are all later.
+        lo = max(bisect_left(firsts, first) - 1, 0)
+        hi = bisect_right(firsts, last)
+
+        merged = []
+        tail = []
+        removed = 0
+        for block in blocks[lo:hi]:
+            shift = block.shift
+            for r, s, e in block.items:
+                r += shift
+                if r < first:
+                    merged.append((r, s, e))
+                elif r > last:
+                    tail.append((r + delta, s, e))
+                else:
+                    removed += 1
+        merged.extend(items)
+        merged.extend(tail)
+
+        if delta:
+            for block in blocks[hi:]:
+                block.shift += delta
+
+        blocks[lo:hi] = self._chunk(merged)
+        self._firsts = None
+        self._count += len(items) - removed
+
+    # ---- queries ----
+
+    def in_rows(self, lo, hi):
+        """Yield the matches on rows lo <= row < hi, in order."""
+        firsts = self._first_rows()
+        blocks = self._blocks
+        b = max(bisect_left(firsts, lo) - 1, 0)
+        while b < len(blocks):
+            block = blocks[b]
+            shift = block.shift
+            items = block.items
+            i = bisect_left(items, (lo - shift,))
+            for j in range(i, len(items)):
+                r, s, e = items[j]
+                r += shift
+                if r >= hi:
+                    return
+                yield (r, s, e)
+            b += 1
+
+    def by_row(self, lo, hi):
+        """Matches on rows lo <= row < hi grouped as {row: [(start, end), ...]}."""
+        out = {}
+        for r, s, e in self.in_rows(lo, hi):
+            spans = out.get(r)
+            if spans is None:
+                out[r] = [(s, e)]
+            else:
+                spans.append((s, e))
+        return out
+
+    def next_after(self, row, col):
+        """First match starting after (row, col), wrapping to the top."""
+        firsts = self._first_rows()
+        blocks = self._blocks
+        b = max(bisect_left(firsts, row) - 1, 0)
+        while b < len(blocks):
+            block = blocks[b]
+            items = block.items
+            i = bisect_right(items, (row - block.shift, col, float("inf")))
+            if i < len(items):
+                r, s, e = items[i]
+                return (r + block.shift, s, e)
+            b += 1
+        return self._edge(0, 0)
+
+    def prev_before(self, row, col):
+        """Last match starting before (row, col), wrapping to the bottom."""
+        firsts = self._first_rows()
+        blocks = self._blocks
+        b = bisect_right(firsts, row) - 1
+        while b >= 0:
+            block = blocks[b]
+            items = block.items
+            i = bisect_left(items, (row - block.shift, col)) - 1
+            if i >= 0:
+                r, s, e = items[i]
+                return (r + block.shift, s, e)
+            b -= 1
+        return self._edge(-1, -1)
+
+    def _edge(self, b, i):
+        if not self._blocks:
+            return None
+        block = self._blocks[b]
+        r, s, e = block.items[i]
+        return (r + block.shift, s, e)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for block in self._blocks:
+            shift = block.shift
+            if shift:
+                for r, s, e in block.items:
+                    yield (r + shift, s, e)
+            else:
+                yield from block.items
+
+    def __contains__(self, match):
+        row = match[0]
+        return any(m == match for m in self.in_rows(row, row + 1))
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return "MatchIndex(%r, %r)" % (self.pattern, list(self))
@@ -0,0 +1,194 @@
+# op_log.py
+# Compact edit operations and the undo/redo log that stores them.
+#
+# An edit is an Op: a slotted record with an integer kind code, so
+# apply_op()/undo() dispatch on small ints and read attributes instead of
+# looking up string keys. The dict schema ({"kind": "insert_char", "row":
+# ..., ...}) is still what the journal and op scripts contain; Op.from_dict
+# and Op.as_dict convert at those edges, and op["key"] reads an Op the way
+# it reads such a dict.
+#
+# OpLog keeps a history as parallel arrays: the kind code, row and column
+# of every op are packed machine ints, and its text (or other payload) sits
+# in one list. An entry costs ~25 bytes plus its text, against ~300 for a
+# dict with its key table and int objects. Typed single characters cost
+# nothing extra, since CPython shares one-character strings.
+
+from array import array
+
+INSERT_CHAR, INSERT_TEXT, DELETE_CHAR, DELETE_TEXT, SPLIT_LINE, JOIN_LINE, REPLACE = range(7)
+
+KINDS = ("insert_char", "insert_text", "delete_char", "delete_text",
+         "split_line", "join_line", "replace")
+KIND_CODES = {name: code for code, name in enumerate(KINDS)}
+
+# Bytes one log entry takes besides its payload: three array slots and one
+# list slot.
+ENTRY_BYTES = 1 + 8 + 8 + 8
+
+
+class Op:
+    """
+    One edit.
+
+    code:    kind, one of the constants above
+    row/col: position the edit applies to
+    text:    inserted/deleted text (one char for *_char), search for replace
+    aux:     prev_len for join_line; [replace, rows] for replace, where rows
+             is None until the first run records [(row, old_text), ...]
+    """
+
+    __slots__ = ("code", "row", "col", "text", "aux")
+
+    def __init__(self, code, row=0, col=0, text="", aux=None):
+        self.code = code
+        self.row = row
+        self.col = col
+        self.text = text
+        self.aux = aux
+
+    @classmethod
+    def from_dict(cls, d):
+        """Build an Op from the dict schema used by the journal and scripts."""
+        code = KIND_CODES[d["kind"]]
+        if code == JOIN_LINE:
+            aux = d.get("prev_len", d.get("col", 0))
+        elif code == REPLACE:
+            return cls(code, 0, 0, d["search"], [d["replace"], d.get("rows")])
+        else:
+            aux = None
+        text = d.get("ch") if code in (INSERT_CHAR, DELETE_CHAR) else d.get("text", "")
+        return cls(code, d.get("row", 0), d.get("col", 0), text or "", aux)
+
+    def as_dict(self):
+        return {key: self[key] for key in self.keys()}
+
+    def keys(self):
+        code = self.code
+        if code in (INSERT_CHAR, DELETE_CHAR):
+            return ("kind", "row", "col", "ch")
+        if code in (INSERT_TEXT, DELETE_TEXT):
+            return ("kind", "row", "col", "text")
+        if code == SPLIT_LINE:
+            return ("kind", "row", "col")
+        if code == JOIN_LINE:
+            return ("kind", "row", "col", "prev_len")
+        if self.aux[1] is None:
+            return ("kind", "search", "replace")
+        return ("kind", "search", "replace", "rows")
+
+    def __getitem__(self, key):
+        if key == "kind":
+            return KINDS[self.code]
+        if key in ("row", "col"):
+            return getattr(self, key)
+        if key in ("ch", "text", "search"):
+            return self.text
+        if key == "prev_len":
+            return self.aux
+        if key == "replace":
+            return self.aux[0]
+        if key == "rows":
+            return self.aux[1]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except (KeyError, TypeError):
+            return default
+        return default if value is None else value
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return self.as_dict() == other
+        if isinstance(other, Op):
+            return (self.code, self.row, self.col, self.text, self.aux) == \
+                   (other.code, other.row, other.col, other.text, other.aux)
+        return NotImplemented
+
+    def __repr__(self):
+        return "Op(%r)" % self.as_dict()
+
+
+def as_op(op):
+    """Accept an Op or an op dict."""
+    return op if type(op) is Op else Op.from_dict(op)
+
+
+class OpLog:
+    """
+    A stack of ops packed into parallel arrays.
+
+    Behaves like the list it replaces: append/pop/clear, len, indexing
+    (yielding Op records) and assignment to log[-1].
+    """
+
+    __slots__ = ("codes", "rows", "cols", "payloads")
+
+    def __init__(self):
+        self.codes = array("B")
+        self.rows = array("q")
+        self.cols = array("q")
+        self.payloads = []
+
+    def append(self, op):
+        if type(op) is not Op:
+            op = Op.from_dict(op)
+        self.codes.append(op.code)
+        self.rows.append(op.row)
+        self.cols.append(op.col)
+        self.payloads.append(op.text if op.aux is None else (op.text, op.aux))
+
+    def _op(self, i):
+        payload = self.payloads[i]
+        if type(payload) is tuple:
+            return Op(self.codes[i], self.rows[i], self.cols[i], payload[0], payload[1])
+        return Op(self.codes[i], self.rows[i], self.cols[i], payload)
+
+    def pop(self):
+        op = self._op(-1)
+        self.codes.pop()
+        self.rows.pop()
+        self.cols.pop()
+        self.payloads.pop()
+        return op
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._op(j) for j in range(*i.indices(len(self.codes)))]
+        return self._op(i)
+
+    def __setitem__(self, i, op):
+        op = as_op(op)
+        self.codes[i] = op.code
+        self.rows[i] = op.row
+        self.cols[i] = op.col
+        self.payloads[i] = op.text if op.aux is None else (op.text, op.aux)
+
+    def drop_oldest(self, n):
+        """Forget the first n ops."""
+        del self.codes[:n]
+        del self.rows[:n]
+        del self.cols[:n]
+        del self.payloads[:n]
+
+    def clear(self):
+        if self.codes:
+            self.drop_oldest(len(self.codes))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __bool__(self):
+        return bool(self.codes)
+
+    def __iter__(self):
+        for i in range(len(self.codes)):
+            yield self._op(i)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return "OpLog(%r)" % list(self)
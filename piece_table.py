@@ -0,0 +1,348 @@
+# piece_table.py
+# A piece table text engine for large documents.
+#
+# The document is never stored as one big mutable string. Instead it is
+# described by a sequence of "pieces", each pointing at a slice of either
+# the original file contents (read-only) or an append-only buffer holding
+# everything the user has typed. Pieces live in a treap (a randomized
+# balanced binary tree) keyed by document offset, and every node caches the
+# size and newline count of its subtree, so finding a line, inserting and
+# deleting all cost O(log n) in the number of pieces.
+#
+# buffer_op.py talks to this class through the same small set of row/col
+# primitives it uses for the plain list-of-lines buffer.
+
+import io
+import random
+from array import array
+from bisect import bisect_left
+
+ORIGINAL = 0
+ADDED = 1
+
+# Largest slice handed out at once when streaming the whole document.
+READ_BLOCK = 1 << 20
+
+
+class _Piece:
+    """One node of the piece tree."""
+
+    __slots__ = ("buf", "start", "length", "lf", "prio",
+                 "left", "right", "size", "lfs")
+
+    def __init__(self, buf, start, length, lf, prio):
+        self.buf = buf
+        self.start = start
+        self.length = length
+        self.lf = lf
+        self.prio = prio
+        self.left = None
+        self.right = None
+        self.size = length
+        self.lfs = lf
+
+
+def _update(node):
+    """Recompute the cached subtree totals of a node."""
+    size = node.length
+    lfs = node.lf
+    if node.left is not None:
+        size += node.left.size
+        lfs += node.left.lfs
+    if node.right is not None:
+        size += node.right.size
+        lfs += node.right.lfs
+    node.size = size
+    node.lfs = lfs
+
+
+def _merge(a, b):
+    """Concatenate two treaps (every offset in a comes before b)."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prio > b.prio:
+        a.right = _merge(a.right, b)
+        _update(a)
+        return a
+    b.left = _merge(a, b.left)
+    _update(b)
+    return b
+
+
+def _newlines(text, base=0):
+    """Offsets (shifted by base) of every '\\n' in text."""
+    out = []
+    i = text.find("\n")
+    while i != -1:
+        out.append(base + i)
+        i = text.find("\n", i + 1)
+    return out
+
+
+class PieceTable:
+    """
+    Line-addressable text storage backed by a piece tree.
+
+    Indexing returns whole lines as strings, len() is the number of lines,
+    so read-only code written for the list-of-char-lists buffer keeps
+    working unchanged.
+    """
+
+    def __init__(self, text=""):
+        self._original = text
+        self._add = io.StringIO()
+        self._add_len = 0
+        # Sorted offsets of '\n' inside each buffer: the line-start index.
+        self._nl = (array("q", _newlines(text)), array("q"))
+        self._root = None
+        if text:
+            self._root = self._new_piece(ORIGINAL, 0, len(text))
+
+    # ---- buffer bookkeeping ----
+
+    def _count_lf(self, buf, start, length):
+        nl = self._nl[buf]
+        return bisect_left(nl, start + length) - bisect_left(nl, start)
+
+    def _new_piece(self, buf, start, length, prio=None):
+        if prio is None:
+            prio = random.random()
+        return _Piece(buf, start, length, self._count_lf(buf, start, length), prio)
+
+    def _read(self, buf, start, length):
+        if buf == ORIGINAL:
+            return self._original[start:start + length]
+        self._add.seek(start)
+        return self._add.read(length)
+
+    def _append(self, text):
+        """Store text at the end of the append buffer, return its offset."""
+        start = self._add_len
+        self._add.seek(start)
+        self._add.write(text)
+        self._add_len += len(text)
+        self._nl[ADDED].extend(_newlines(text, start))
+        return start
+
+    # ---- tree primitives ----
+
+    def _split(self, node, pos):
+        """Split a treap into (first pos chars, the rest)."""
+        if node is None:
+            return None, None
+
+        left_size = node.left.size if node.left is not None else 0
+
+        if pos <= left_size:
+            l, r = self._split(node.left, pos)
+            node.left = r
+            _update(node)
+            return l, node
+
+        if pos >= left_size + node.length:
+            l, r = self._split(node.right, pos - left_size - node.length)
+            node.right = l
+            _update(node)
+            return node, r
+
+        # The split point falls inside this piece: cut it in two.
+        # The tail keeps the same priority so both halves remain valid heaps.
+        off = pos - left_size
+        tail = self._new_piece(node.buf, node.start + off, node.length - off, node.prio)
+        tail.right = node.right
+        node.right = None
+        node.length = off
+        node.lf -= tail.lf
+        _update(node)
+        _update(tail)
+        return node, tail
+
+    def _extend_last(self, node, length, lf):
+        """Grow the right-most piece of a treap in place."""
+        if node.right is not None:
+            self._extend_last(node.right, length, lf)
+        else:
+            node.length += length
+            node.lf += lf
+        _update(node)
+
+    @staticmethod
+    def _last(node):
+        while node.right is not None:
+            node = node.right
+        return node
+
+    def _nth_newline(self, k):
+        """Document offset of the k-th (0-based) newline."""
+        node = self._root
+        base = 0
+        while node is not None:
+            left = node.left
+            left_lfs = left.lfs if left is not None else 0
+            left_size = left.size if left is not None else 0
+            if k < left_lfs:
+                node = left
+                continue
+            k -= left_lfs
+            if k < node.lf:
+                nl = self._nl[node.buf]
+                pos = nl[bisect_left(nl, node.start) + k]
+                return base + left_size + pos - node.start
+            k -= node.lf
+            base += left_size + node.length
+            node = node.right
+        raise IndexError("newline index out of range")
+
+    def _collect(self, node, base, a, b, out):
+        """Append the text of document range [a, b) under node to out."""
+        if node is None or b <= base or a >= base + node.size:
+            return
+        left_size = node.left.size if node.left is not None else 0
+        if a < base + left_size:
+            self._collect(node.left, base, a, b, out)
+        start = base + left_size
+        end = start + node.length
+        if a < end and b > start:
+            lo = max(a, start) - start
+            hi = min(b, end) - start
+            out.append(self._read(node.buf, node.start + lo, hi - lo))
+        if b > end:
+            self._collect(node.right, end, a, b, out)
+
+    def _pieces(self):
+        """In-order iterator over all pieces."""
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node
+            node = node.right
+
+    # ---- offset level API ----
+
+    def size(self):
+        """Total number of characters, newlines included."""
+        return self._root.size if self._root is not None else 0
+
+    def text_range(self, a, b):
+        out = []
+        self._collect(self._root, 0, a, b, out)
+        return "".join(out)
+
+    def text(self):
+        return self.text_range(0, self.size())
+
+    def insert_at(self, pos, text):
+        if not text:
+            return
+        start = self._append(text)
+        lf = self._count_lf(ADDED, start, len(text))
+
+        left, right = self._split(self._root, pos)
+
+        # Typing usually continues the previous insert; extend that piece
+        # instead of creating a new node for every keystroke.
+        if left is not None:
+            last = self._last(left)
+            if last.buf == ADDED and last.start + last.length == start:
+                self._extend_last(left, len(text), lf)
+                self._root = _merge(left, right)
+                return
+
+        piece = _Piece(ADDED, start, len(text), lf, random.random())
+        self._root = _merge(_merge(left, piece), right)
+
+    def delete_at(self, pos, length):
+        if length <= 0:
+            return
+        left, rest = self._split(self._root, pos)
+        _, right = self._split(rest, length)
+        self._root = _merge(left, right)
+
+    # ---- row/col API used by buffer_op ----
+
+    def line_start(self, r):
+        return 0 if r == 0 else self._nth_newline(r - 1) + 1
+
+    def line_end(self, r):
+        """Offset just past the last character of row r (before its '\\n')."""
+        if self._root is not None and r < self._root.lfs:
+            return self._nth_newline(r)
+        return self.size()
+
+    def line_length(self, r):
+        return self.line_end(r) - self.line_start(r)
+
+    def offset(self, r, c):
+        return self.line_start(r) + c
+
+    def insert(self, r, c, text):
+        self.insert_at(self.offset(r, c), text)
+
+    def delete(self, r, c, length=1):
+        self.delete_at(self.offset(r, c), length)
+
+    def split_line(self, r, c):
+        self.insert_at(self.offset(r, c), "\n")
+
+    def join_line(self, r):
+        self.delete_at(self.line_end(r), 1)
+
+    def set_line(self, r, text):
+        start = self.line_start(r)
+        self.delete_at(start, self.line_end(r) - start)
+        self.insert_at(start, text)
+
+    def __len__(self):
+        return (self._root.lfs if self._root is not None else 0) + 1
+
+    def __getitem__(self, r):
+        if r < 0:
+            r += len(self)
+        if not 0 <= r < len(self):
+            raise IndexError("line index out of range")
+        return self.text_range(self.line_start(r), self.line_end(r))
+
+    def chunks(self, block=READ_BLOCK):
+        """Yield the document text in order, in pieces of at most block chars."""
+        for piece in self._pieces():
+            for off in range(0, piece.length, block):
+                yield self._read(piece.buf, piece.start + off,
+                                 min(block, piece.length - off))
+
+    def snapshot(self, lock, block=READ_BLOCK):
+        """
+        The text as it is now, in chunks like chunks(), still valid after
+        later edits: only the piece list is copied, since the buffers it
+        points into are append-only. Blocks are read holding lock, the one
+        guarding edits, as reading the append buffer moves its position.
+        """
+        pieces = [(p.buf, p.start, p.length) for p in self._pieces()]
+        return self._read_pieces(pieces, lock, block)
+
+    def _read_pieces(self, pieces, lock, block):
+        for buf, start, length in pieces:
+            for off in range(0, length, block):
+                with lock:
+                    text = self._read(buf, start + off, min(block, length - off))
+                yield text
+
+    def __iter__(self):
+        """Yield every line in order, streaming piece by piece."""
+        pending = []
+        for chunk in self.chunks():
+            parts = chunk.split("\n")
+            if len(parts) == 1:
+                pending.append(chunk)
+                continue
+            pending.append(parts[0])
+            yield "".join(pending)
+            for line in parts[1:-1]:
+                yield line
+            pending = [parts[-1]]
+        yield "".join(pending)
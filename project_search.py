@@ -0,0 +1,229 @@
+# project_search.py
+# Project-wide search: every text file under a folder, in parallel.
+#
+# A coordinator thread walks the tree with os.scandir, leaving out the
+# usual tool folders (SKIP_DIRS) and whatever the root .gitignore lists,
+# and hands the files out in batches to a process pool, one worker per
+# core by default, so the search scales past what one interpreter can
+# do. A worker skips binary files (a NUL byte in the first block) and
+# streams each text file through text_search.search_chunks in blocks, so
+# a huge file is never read into memory at once and matches come out
+# exactly as the editor's own search reports them.
+#
+# Finished batches are appended to `results` as (path, row, start, end)
+# while the walk is still going, and on_progress is called so the UI can
+# show them. Results come in the order batches finish; next_result() and
+# prev_result() walk them.
+#
+# This module is imported by the worker processes, so it deliberately
+# does not import the editor (buffer_op, keyboard, ...).
+
+import fnmatch
+import io
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from text_search import search_chunks
+
+# Folders never searched.
+SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules",
+             ".venv", "venv", ".tox", ".mypy_cache", ".pytest_cache"}
+
+# Files handed to a worker at a time, and batches in flight at most.
+BATCH_FILES = 64
+MAX_PENDING = 64
+
+# Bytes looked at to tell binary files apart, and characters per read.
+SNIFF_BYTES = 8192
+READ_CHARS = 1024 * 1024
+
+# Minimum time between two on_progress calls, in seconds.
+PROGRESS_INTERVAL = 0.1
+
+
+# ---- walking the tree ----
+
+def read_ignore(root):
+    """Patterns from root/.gitignore (negations are not supported)."""
+    try:
+        with open(os.path.join(root, ".gitignore"), encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+    except OSError:
+        return []
+    return [line for line in lines if line and not line.startswith(("#", "!"))]
+
+
+def is_ignored(rel_path, name, is_dir, patterns):
+    for pattern in patterns:
+        if pattern.endswith("/"):
+            if not is_dir:
+                continue
+            pattern = pattern[:-1]
+        if "/" in pattern:
+            if fnmatch.fnmatch(rel_path, pattern.lstrip("/")):
+                return True
+        elif fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+
+
+def walk(root, patterns=None):
+    """Yield every file under root that is not skipped or ignored."""
+    if patterns is None:
+        patterns = read_ignore(root)
+    stack = [(root, "")]
+    while stack:
+        folder, rel = stack.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            continue
+        entries.sort(key=lambda e: e.name)
+        subfolders = []
+        for entry in entries:
+            rel_path = rel + entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if entry.name not in SKIP_DIRS and not is_ignored(rel_path, entry.name, True, patterns):
+                    subfolders.append((entry.path, rel_path + "/"))
+            elif entry.is_file() and not is_ignored(rel_path, entry.name, False, patterns):
+                yield entry.path
+        # Popped in order, so the walk is depth-first and sorted.
+        stack.extend(reversed(subfolders))
+
+
+# ---- worker side ----
+
+def search_file(path, pattern):
+    """
+    (row, start, end) of every match in a text file, or None for binary
+    and unreadable files.
+    """
+    try:
+        with open(path, "rb") as raw:
+            if b"\0" in raw.read(SNIFF_BYTES):
+                return None
+            raw.seek(0)
+            text = io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+            return list(search_chunks(iter(lambda: text.read(READ_CHARS), ""), pattern))
+    except OSError:
+        return None
+
+
+def search_files(paths, pattern):
+    """Worker task: [(path, matches), ...] for the files of a batch that match."""
+    out = []
+    for path in paths:
+        found = search_file(path, pattern)
+        if found:
+            out.append((path, found))
+    return out, len(paths)
+
+
+# ---- coordinator ----
+
+class ProjectSearch:
+    """A cancellable search of every file under root, streaming its results."""
+
+    def __init__(self, root, pattern, on_progress=None, workers=None):
+        self.root = os.path.abspath(root)
+        self.pattern = pattern
+        self.on_progress = on_progress
+        self.workers = workers or os.cpu_count() or 1
+        self.results = []
+        self.files = 0
+        self.position = -1
+        self.lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+        self._last_progress = 0.0
+
+    # ---- control ----
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Stop handing out files; results found so far are kept."""
+        self._cancelled.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    @property
+    def running(self):
+        return not self._done.is_set()
+
+    # ---- results ----
+
+    def next_result(self):
+        """The result after the last one visited (wrapping), or None."""
+        with self.lock:
+            if not self.results:
+                return None
+            self.position = (self.position + 1) % len(self.results)
+            return self.results[self.position]
+
+    def prev_result(self):
+        """The result before the last one visited (wrapping), or None."""
+        with self.lock:
+            if not self.results:
+                return None
+            self.position = (self.position - 1) % len(self.results)
+            return self.results[self.position]
+
+    # ---- worker ----
+
+    def _collect(self, futures):
+        for future in futures:
+            found, searched = future.result()
+            with self.lock:
+                self.files += searched
+                for path, matches in found:
+                    self.results.extend((path, r, s, e) for r, s, e in matches)
+        now = time.monotonic()
+        if self.on_progress is not None and now - self._last_progress >= PROGRESS_INTERVAL:
+            self._last_progress = now
+            self.on_progress(self)
+
+    def _run(self):
+        pool = ProcessPoolExecutor(self.workers)
+        try:
+            pending = set()
+            batch = []
+            for path in walk(self.root):
+                if self._cancelled.is_set():
+                    break
+                batch.append(path)
+                if len(batch) < BATCH_FILES:
+                    continue
+                pending.add(pool.submit(search_files, batch, self.pattern))
+                batch = []
+                if len(pending) >= MAX_PENDING:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect(done)
+            if batch and not self._cancelled.is_set():
+                pending.add(pool.submit(search_files, batch, self.pattern))
+            while pending and not self._cancelled.is_set():
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                self._collect(done)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self._done.set()
+            if self.on_progress is not None:
+                self.on_progress(self)
+
+
+def start_project_search(root, pattern, on_progress=None, workers=None):
+    """Start a ProjectSearch of root for pattern (None for an empty pattern)."""
+    if not pattern:
+        return None
+    return ProjectSearch(root, pattern, on_progress, workers).start()
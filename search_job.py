@@ -0,0 +1,166 @@
+# search_job.py
+# Runs a search on a worker thread so the editor stays responsive.
+#
+# The buffer is scanned in chunks of rows, starting with the rows on screen
+# so their highlights show up first, then the rest of the file below and
+# finally above the viewport. Every finished chunk is merged straight into the
+# document's matches, so results stream in while the search runs. Edits made
+# in the meantime keep working as usual: the document tells the job about
+# rows that moved, and each chunk is scanned while holding its lock.
+# A memory-mapped buffer may still be indexing its lines when the search
+# starts; the rows the index adds later are searched as they appear.
+
+import threading
+import time
+
+import buffer_op
+from mapped_file import MappedLines
+
+# Rows scanned per chunk (the buffer lock is held for one chunk at a time).
+CHUNK_ROWS = 2000
+
+# Minimum time between two on_progress calls, in seconds.
+PROGRESS_INTERVAL = 0.1
+
+
+class BackgroundSearch:
+    """A cancellable search filling a document's matches chunk by chunk."""
+
+    def __init__(self, pattern, on_progress=None, doc=None):
+        # The job stays with its document even if another becomes current.
+        self.doc = doc = doc if doc is not None else buffer_op.current
+        self.pattern = pattern
+        self.on_progress = on_progress
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+
+        with doc.lock:
+            total = len(doc.buffer)
+            top = min(doc.top_line, total)
+            bottom = min(top + buffer_op.MAX_LINE, total)
+            # Pending [lo, hi) row ranges, viewport first.
+            self._pending = [r for r in ((top, bottom), (bottom, total), (0, top))
+                             if r[0] < r[1]]
+            # Rows from here on are still to be indexed (MappedLines).
+            self._end = total
+            doc.matches.reset(pattern, [])
+
+    # ---- control ----
+
+    def start(self):
+        with self.doc.lock:
+            self.doc.search_job = self
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Stop after the current chunk; matches found so far are kept."""
+        self._cancelled.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    @property
+    def running(self):
+        return not self._done.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def found(self):
+        """Number of matches found so far."""
+        return len(self.doc.matches)
+
+    # ---- buffer notifications ----
+
+    def rows_moved(self, first, last, delta):
+        """
+        Rows [first, last] were rewritten and later rows moved by delta.
+        Called by the document with its lock held.
+        """
+        if not delta:
+            return
+        if self._end > last:
+            self._end += delta
+        moved = []
+        for lo, hi in self._pending:
+            if lo > last:
+                lo += delta
+            if hi > last:
+                hi += delta
+            if lo < hi:
+                moved.append((lo, hi))
+        self._pending = moved
+
+    # ---- worker ----
+
+    def _grow(self):
+        """
+        Queue the rows a line index still running (MappedLines) added
+        since the search started. False once there are none to wait for.
+        """
+        buffer = self.doc.buffer
+        if not isinstance(buffer, MappedLines):
+            return False
+        while not self._cancelled.is_set():
+            indexed = buffer.wait_until_indexed(PROGRESS_INTERVAL)
+            with self.doc.lock:
+                total = len(self.doc.buffer)
+                if total > self._end:
+                    self._pending.append((self._end, total))
+                    self._end = total
+                    return True
+            if indexed:
+                return False
+        return False
+
+    def _run(self):
+        doc = self.doc
+        last_progress = 0.0
+        try:
+            while not self._cancelled.is_set():
+                if not self._pending and not self._grow():
+                    break
+                with doc.lock:
+                    if doc.search_job is not self or not self._pending:
+                        break
+                    lo, hi = self._pending[0]
+                    stop = min(hi, lo + CHUNK_ROWS, len(doc.buffer))
+                    if stop <= lo:
+                        # The rows were deleted while waiting.
+                        del self._pending[0]
+                        continue
+                    found = doc.scan_rows(lo, stop, self.pattern)
+                    doc.matches.replace_rows(lo, stop - 1, found)
+                    if stop < hi:
+                        self._pending[0] = (stop, hi)
+                    else:
+                        del self._pending[0]
+
+                now = time.monotonic()
+                if self.on_progress is not None and now - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = now
+                    self.on_progress(self)
+        finally:
+            with doc.lock:
+                if doc.search_job is self:
+                    doc.search_job = None
+            self._done.set()
+            if self.on_progress is not None:
+                self.on_progress(self)
+
+
+def start_search(pattern, on_progress=None, doc=None):
+    """Cancel any running search of doc (default: current) and start one for pattern."""
+    doc = doc if doc is not None else buffer_op.current
+    previous = doc.search_job
+    if previous is not None:
+        previous.cancel()
+        previous.wait()
+    if not pattern:
+        doc.matches.clear()
+        return None
+    return BackgroundSearch(pattern, on_progress, doc).start()
@@ -0,0 +1,373 @@
+# swap_file.py
+# Background autosave of unsaved edits into a swap file.
+#
+# Every AUTOSAVE_SECONDS, or after AUTOSAVE_OPS edits, main.py asks a
+# worker thread to autosave the document. Only what changed since the
+# previous autosave is written: edits report the rows they rewrote (through
+# Document.refresh_matches), and the swap file keeps the changed rows as a
+# sorted list of disjoint spans, each with the number of rows it replaced.
+# An autosave copies just those rows under the buffer lock, which is quick
+# however far apart the edits are, and appends them to the swap file as one
+# JSON line of hunks after releasing the lock, so typing never waits for
+# the disk.
+#
+# The first line of a swap file records the size and mtime of the document
+# it starts from, like the journal does; the text is that document with
+# every recorded hunk applied in order. When the hunks add up to more than
+# COMPACT_BYTES the worker rewrites the file as one full copy of the text,
+# rebuilt from the document on disk and the swap file itself, so the buffer
+# is never copied whole. Saving the document starts a fresh swap file
+# against the new version.
+#
+# The journal (journal.py) replays single edits and is preferred when both
+# are usable; the swap file covers what the journal cannot: new documents
+# without a name, and a journal that was lost or belongs to another
+# version of the file. On startup, main.py offers to recover from a swap
+# file newer than its document.
+
+import json
+import os
+import threading
+import time
+
+import buffer_op
+import journal
+from atomic_save import atomic_write
+from journal import read_entries
+
+# Autosave after this many seconds, or this many edits, since the last one.
+AUTOSAVE_SECONDS = 30.0
+AUTOSAVE_OPS = 200
+
+# Rewrite the swap file as a full copy once the hunks exceed this size.
+COMPACT_BYTES = 4 * 1024 * 1024
+
+# Swap file of a document that has no name yet (in the working folder).
+UNTITLED = ".untitled.swp"
+
+
+def swap_path(doc_path):
+    """Swap file for a document: a hidden sibling file."""
+    if doc_path is None:
+        return os.path.abspath(UNTITLED)
+    folder, name = os.path.split(os.path.abspath(doc_path))
+    return os.path.join(folder, ".%s.swp" % name)
+
+
+def _base(doc_path):
+    if doc_path is None:
+        return {"kind": "base"}
+    st = os.stat(doc_path)
+    return {"kind": "base", "size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+def _line(entry):
+    return json.dumps(entry, separators=(",", ":")) + "\n"
+
+
+class SwapFile:
+    """Swap file of one document; the file is only created by autosave()."""
+
+    def __init__(self, doc_path):
+        self.doc_path = doc_path
+        self.path = swap_path(doc_path)
+        self.base = _base(doc_path)
+        # Changed rows since the last autosave: sorted, disjoint (start, end,
+        # old) spans, where rows [start, end) replace `old` rows of the text
+        # last written (None: every row from start on).
+        self.spans = []
+        # Edits since the last autosave, counted by apply_op() and undo().
+        self.ops = 0
+        self.due_at = time.monotonic() + AUTOSAVE_SECONDS
+        # Wall clock time of the last autosave, for the status bar.
+        self.saved_at = None
+        # Bytes of hunks written since the last full copy.
+        self.written = 0
+        # Bumped by restart(), so an autosave copied before a save is dropped.
+        self.generation = 0
+        # Set while a save is writing: changes since it copied the text pile
+        # up until restart().
+        self.paused = False
+        # True once the swap file holds this document's base line.
+        self.created = False
+        self._file = None
+        self._lock = threading.Lock()
+
+    # ---- change tracking (called with the buffer lock held) ----
+
+    def rows_changed(self, first, last, delta):
+        """
+        Rows [first, last] were rewritten and every later row moved by
+        delta (the same contract as Document.refresh_matches). The spans
+        it overlaps or touches are merged with it.
+        """
+        before, after = [], []
+        start, end = first, last + 1
+        covered = old = 0
+        for span in self.spans:
+            s, e, n = span
+            if e < first:
+                before.append(span)
+            elif s > last + 1:
+                after.append((s + delta, e + delta, n))
+            else:
+                start, end = min(start, s), max(end, e)
+                covered += e - s
+                old = None if old is None or n is None else old + n
+        if old is not None:
+            # Rows of the merged span outside every old span were unchanged.
+            old += end - start - covered
+        before.append((start, end + delta, old))
+        self.spans = before + after
+
+    def touch_all(self, rows):
+        """Treat all rows as changed (the text no longer matches the file)."""
+        self.spans = [(0, rows, None)]
+
+    def due(self, now=None):
+        """True when there are changes and an autosave is due."""
+        if not self.spans:
+            return False
+        now = time.monotonic() if now is None else now
+        return self.ops >= AUTOSAVE_OPS or now >= self.due_at
+
+    def take(self, doc):
+        """
+        Copy what changed since the last autosave and start tracking anew.
+        Returns (generation, entry) for write(), or None if nothing changed.
+        """
+        if self.paused:
+            return None
+        self.due_at = time.monotonic() + AUTOSAVE_SECONDS
+        self.ops = 0
+        if not self.spans:
+            return None
+        line_text = doc.line_text
+        hunks = [[start, old, [line_text(r) for r in range(start, end)]]
+                 for start, end, old in self.spans]
+        self.spans = []
+        return self.generation, {"kind": "hunks", "hunks": hunks}
+
+    # ---- file side (worker thread, without the buffer lock) ----
+
+    def write(self, taken):
+        """Append an entry from take(). False if a save made it obsolete."""
+        generation, entry = taken
+        data = _line(entry)
+        with self._lock:
+            if generation != self.generation:
+                return False
+            try:
+                if not self.created:
+                    # The first write: replace the whole file.
+                    self._close()
+                    atomic_write(self.path, [_line(self.base), data])
+                    self.created = True
+                    self.written = len(data)
+                else:
+                    if self._file is None:
+                        self._file = open(self.path, "a", encoding="utf-8")
+                    self._file.write(data)
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self.written += len(data)
+                if self.written >= COMPACT_BYTES:
+                    self._compact()
+            except OSError:
+                # Part of the line may have landed: start the file over.
+                self.created = False
+                raise
+            self.saved_at = time.time()
+        return True
+
+    def _compact(self):
+        """Rewrite the swap file as one full copy of the text."""
+        if self.doc_path is not None and _base(self.doc_path) != self.base:
+            # The document changed on disk; the hunks no longer apply to it.
+            return
+        self._close()
+        rows = _replay(_rows_of(self.doc_path), read_entries(self.path)[0][1:])
+        atomic_write(self.path, [_line(self.base), _line({"kind": "text", "rows": rows})])
+        self.written = 0
+
+    def adopt(self):
+        """Keep appending to the swap file already on disk (after recovery)."""
+        with self._lock:
+            self.created = True
+            self.written = os.path.getsize(self.path)
+        return self
+
+    def restart(self, doc_path):
+        """
+        The document was saved as doc_path: later hunks apply to that file.
+        Changes made since pause() (when the saved text was copied) are
+        kept; without a pause, the file holds every change.
+        Call with the buffer lock held.
+        """
+        if not self.paused:
+            self.spans = []
+        with self._lock:
+            self.generation += 1
+            self._discard()
+            self.doc_path = doc_path
+            self.path = swap_path(doc_path)
+            self.base = _base(doc_path)
+            self.written = 0
+            self.paused = False
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _discard(self):
+        self._close()
+        self.created = False
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        """Stop writing; the swap file stays for the next start."""
+        with self._lock:
+            self._close()
+
+    def discard(self):
+        """Close and delete the swap file (the document is saved)."""
+        with self._lock:
+            self._discard()
+
+
+def autosave(doc=None):
+    """
+    Write what changed in doc (default: the current document) to its swap
+    file. Runs on a worker thread; the buffer lock is only held while the
+    changed rows are copied. Returns True if something was written.
+    """
+    doc = doc or buffer_op.current
+    swap = doc.swap
+    if swap is None:
+        return False
+    with doc.lock:
+        taken = swap.take(doc)
+    if taken is None:
+        return False
+    try:
+        return swap.write(taken)
+    except OSError:
+        # The hunks taken are lost: the next autosave writes everything.
+        with doc.lock:
+            swap.touch_all(len(doc.buffer))
+        raise
+
+
+# ---- recovery ----
+
+def _rows_of(doc_path):
+    """Rows of a document as load_file() splits them."""
+    if doc_path is None:
+        return [""]
+    with open(doc_path, "r") as f:
+        text = f.read()
+    if text.endswith("\n"):
+        text = text[:-1]
+    return text.split("\n")
+
+
+def pending(doc_path):
+    """
+    True if doc_path (None: the untitled document) has a swap file that is
+    newer than the document and was written against its current version.
+    """
+    path = swap_path(doc_path)
+    try:
+        mtime = os.path.getmtime(path)
+        if doc_path is not None and mtime <= os.path.getmtime(doc_path):
+            return False
+        entries = read_entries(path)[0]
+        return len(entries) > 1 and entries[0] == _base(doc_path)
+    except OSError:
+        return False
+
+
+def _replay(rows, entries):
+    """Apply swap file entries (base line excluded) to the rows of a document."""
+    for entry in entries:
+        if entry["kind"] == "text":
+            rows = entry["rows"]
+            continue
+        for start, old, new in entry["hunks"]:
+            rows[start:len(rows) if old is None else start + old] = new
+    return rows
+
+
+def recovered_text(doc_path):
+    """The text saved in the swap file of doc_path."""
+    entries = read_entries(swap_path(doc_path))[0]
+    return "\n".join(_replay(_rows_of(doc_path), entries[1:]))
+
+
+def recover(doc_path):
+    """
+    Load the swap file of doc_path into the current document and keep
+    autosaving into it. Returns the number of rows recovered.
+    The journal is dropped: its edits apply to the file, not to this text.
+    """
+    text = recovered_text(doc_path)
+    journal.stop(discard=True)
+    buffer_op.load_text(text)
+    buffer_op.swap = SwapFile(doc_path).adopt()
+    return len(buffer_op.buffer)
+
+
+def start(doc_path, dirty=False):
+    """
+    Attach a swap file to the current document. dirty=True when its text
+    already differs from the file (edits replayed from the journal).
+    """
+    stop()
+    buffer_op.swap = SwapFile(doc_path)
+    if dirty:
+        buffer_op.swap.touch_all(len(buffer_op.buffer))
+
+
+def pause():
+    """
+    A save copied the text: hold autosaves back until restart() (or
+    resume() if the save failed), so none lands on the old swap file.
+    Changes are tracked from here on against the saved text.
+    Call with the buffer lock held.
+    """
+    if buffer_op.swap is not None:
+        buffer_op.swap.paused = True
+        buffer_op.swap.spans = []
+
+
+def resume():
+    """
+    The save failed: autosave into the old swap file again. Changes from
+    before the pause were dropped, so the next autosave writes every row.
+    Call with the buffer lock held.
+    """
+    if buffer_op.swap is not None:
+        buffer_op.swap.paused = False
+        buffer_op.swap.touch_all(len(buffer_op.buffer))
+
+
+def restart(doc_path):
+    """Begin a fresh swap file for doc_path (after saving it)."""
+    if buffer_op.swap is None:
+        start(doc_path)
+    else:
+        buffer_op.swap.restart(doc_path)
+
+
+def stop(discard=False):
+    """Stop autosaving; discard=True also deletes the swap file."""
+    current, buffer_op.swap = buffer_op.swap, None
+    if current is not None:
+        if discard:
+            current.discard()
+        else:
+            current.close()
@@ -0,0 +1,331 @@
+# syntax.py
+# Syntax highlighting with a per-line tokenizer state cache.
+#
+# A language is a lexer function lex(line, state) -> (spans, end_state):
+# spans are (start, end, kind) column ranges of one row, in order, and the
+# state is whatever must carry over to the next row (for Python, the
+# delimiter of an unclosed triple-quoted string; None when nothing is
+# open). States must compare with ==.
+#
+# A Highlighter remembers the state each row starts in. An edit only
+# invalidates the states after the rows it rewrote; they are lexed again
+# lazily, when the renderer asks for rows below the edit, and only until
+# the freshly computed state matches the one cached for an untouched row.
+# From there on the old states are correct again and are reused as they
+# are, so typing costs a row or two of lexing no matter how long the file.
+#
+# The renderer only asks for the visible rows. When they are far past the
+# last known state (a jump to the end of a big file), the cache catches up
+# by at most CATCH_UP_ROWS per frame and, meanwhile, the viewport is lexed
+# from SYNC_ROWS above it as if nothing were open there.
+#
+# New languages are added with register(".ext", lexer).
+
+import keyword
+import os
+import re
+
+# Off via `syntax = off` in editor.ini.
+ENABLED = True
+
+# Rows lexed per frame to extend the state cache towards the viewport.
+CATCH_UP_ROWS = 2000
+
+# Rows above a viewport beyond the cache that are lexed to guess its state.
+SYNC_ROWS = 200
+
+# ANSI foreground color per token kind.
+THEME = {
+    "keyword": "\033[35m",    # magenta
+    "builtin": "\033[36m",    # cyan
+    "string": "\033[32m",     # green
+    "number": "\033[33m",     # yellow
+    "comment": "\033[90m",    # grey
+    "decorator": "\033[36m",
+    "definition": "\033[34m",  # blue
+    "section": "\033[34m",
+    "key": "\033[36m",
+    "punctuation": "\033[90m",
+}
+DEFAULT_FG = "\033[39m"
+DEFAULT_BG = "\033[49m"
+
+
+# ---- Python ----
+
+_PY_KEYWORDS = frozenset(keyword.kwlist)
+_PY_BUILTINS = frozenset(("self", "cls", "print", "len", "range", "isinstance",
+                          "super", "open", "str", "int", "list", "dict", "set",
+                          "tuple", "object", "Exception"))
+_PY_TOKEN = re.compile(r"""
+    (?P<comment>\#.*)
+  | (?P<string>[rRbBuUfF]{0,2}(?:\"\"\"|'''|"(?:[^"\\]|\\.)*"?|'(?:[^'\\]|\\.)*'?))
+  | (?P<number>\b(?:0[xXoObB][0-9a-fA-F_]+|\d[\d_]*\.?\d*(?:[eE][+-]?\d+)?j?))
+  | (?P<decorator>^\s*@[\w.]+)
+  | (?P<name>[A-Za-z_]\w*)
+""", re.X)
+_PY_DEFINES = ("def", "class")
+
+
+def _close_triple(line, pos, quote, spans, start):
+    """Find the end of a triple-quoted string; returns (next pos, state)."""
+    i = pos
+    while True:
+        end = line.find(quote, i)
+        if end < 0:
+            spans.append((start, len(line), "string"))
+            return len(line), quote
+        # A backslash escapes the first quote of the delimiter.
+        backslashes = len(line[:end]) - len(line[:end].rstrip("\\"))
+        if backslashes % 2 == 0:
+            spans.append((start, end + 3, "string"))
+            return end + 3, None
+        i = end + 1
+
+
+def lex_python(line, state):
+    spans = []
+    pos = 0
+    if state is not None:
+        pos, state = _close_triple(line, 0, state, spans, 0)
+        if state is not None:
+            return spans, state
+
+    search = _PY_TOKEN.search
+    define = False
+    while True:
+        m = search(line, pos)
+        if m is None:
+            break
+        kind = m.lastgroup
+        start, pos = m.span()
+        if kind == "name":
+            word = m.group()
+            if define:
+                spans.append((start, pos, "definition"))
+            elif word in _PY_KEYWORDS:
+                spans.append((start, pos, "keyword"))
+            elif word in _PY_BUILTINS:
+                spans.append((start, pos, "builtin"))
+            define = word in _PY_DEFINES
+            continue
+        define = False
+        if kind == "string":
+            text = m.group()
+            if text[-3:] in ('"""', "'''") and len(text.lstrip("rRbBuUfF")) == 3:
+                pos, state = _close_triple(line, pos, text[-3:], spans, start)
+                if state is not None:
+                    break
+                continue
+        elif kind == "decorator":
+            start = line.index("@", start)
+        spans.append((start, pos, kind))
+    return spans, state
+
+
+# ---- INI ----
+
+_INI_KEY = re.compile(r"\s*([^=:\s][^=:]*?)\s*[=:]")
+
+
+def lex_ini(line, state):
+    stripped = line.lstrip()
+    if not stripped:
+        return [], None
+    start = len(line) - len(stripped)
+    if stripped[0] in ";#":
+        return [(start, len(line), "comment")], None
+    if stripped[0] == "[":
+        end = line.find("]", start)
+        return [(start, len(line) if end < 0 else end + 1, "section")], None
+    m = _INI_KEY.match(line)
+    if m is None:
+        return [], None
+    return [(m.start(1), m.end(1), "key"), (m.end() - 1, m.end(), "punctuation")], None
+
+
+# ---- JSON ----
+
+_JSON_TOKEN = re.compile(r"""
+    (?P<string>"(?:[^"\\]|\\.)*"?)
+  | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<keyword>\b(?:true|false|null)\b)
+  | (?P<punctuation>[{}\[\],:])
+""", re.X)
+_JSON_COLON = re.compile(r"\s*:")
+
+
+def lex_json(line, state):
+    spans = []
+    for m in _JSON_TOKEN.finditer(line):
+        kind = m.lastgroup
+        if kind == "string" and _JSON_COLON.match(line, m.end()):
+            kind = "key"
+        spans.append((m.start(), m.end(), kind))
+    return spans, None
+
+
+LANGUAGES = {
+    ".py": lex_python,
+    ".pyw": lex_python,
+    ".ini": lex_ini,
+    ".cfg": lex_ini,
+    ".json": lex_json,
+}
+
+
+def register(extension, lexer):
+    """Highlight files ending in extension with lexer."""
+    LANGUAGES[extension.lower()] = lexer
+
+
+def for_path(path):
+    """A Highlighter for path's language, or None."""
+    if not ENABLED or not path:
+        return None
+    lexer = LANGUAGES.get(os.path.splitext(path)[1].lower())
+    return Highlighter(lexer) if lexer is not None else None
+
+
+class Highlighter:
+    """
+    Token spans for the rows of one document, with cached line states.
+
+    states[r] is the state row r starts in. states[:valid] are known to be
+    correct. From `dirty` on, states[dirty:known] still follow one from
+    the other through rows whose text has not changed since, though maybe
+    from a stale start; lexing forward stops as soon as it agrees with one
+    of them, after which they are all correct again.
+    """
+
+    __slots__ = ("lexer", "states", "valid", "known", "dirty")
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.reset()
+
+    def reset(self):
+        """Forget every cached state (the whole buffer was replaced)."""
+        self.states = [None]
+        self.valid = 1
+        self.known = 1
+        self.dirty = 0
+
+    def rows_changed(self, first, last, delta=0):
+        """
+        Rows [first, last] were rewritten and every later row moved by
+        delta (the same contract as Document.refresh_matches).
+        """
+        states = self.states
+        if first + 1 < len(states):
+            if delta > 0:
+                states[first + 1:first + 1] = [None] * delta
+            elif delta < 0:
+                del states[first + 1:first + 1 - delta]
+
+        # Cached states chain together only from `dirty` on, and not across
+        # `valid` either: lexing stopped there, so the state cached at
+        # valid may not follow from the row above it. Both breaks (and the
+        # rows this edit rewrote) end up below the new dirty row.
+        dirty = self.dirty
+        if self.valid < self.known:
+            dirty = max(dirty, self.valid)
+        if dirty > last + 1:
+            dirty += delta
+        self.dirty = max(dirty, last + delta + 1)
+
+        if self.known > last + 1:
+            self.known += delta
+        else:
+            self.known = min(self.known, first + 1)
+        self.valid = max(1, min(self.valid, first + 1))
+
+    def advance(self, line_text, upto, limit=None):
+        """
+        Extend the valid states to cover rows < upto, lexing at most limit
+        rows. Returns True when they are covered.
+        """
+        states = self.states
+        lex = self.lexer
+        valid = self.valid
+        budget = limit if limit is not None else upto
+        while valid < upto and budget > 0:
+            row = valid - 1
+            end = lex(line_text(row), states[row])[1]
+            budget -= 1
+            if self.dirty <= valid < self.known and states[valid] == end:
+                # Converged: the cached states after this row still hold.
+                valid = self.known
+                continue
+            if valid < len(states):
+                states[valid] = end
+            else:
+                states.append(end)
+            valid += 1
+            if valid > self.known:
+                self.known = valid
+        self.valid = valid
+        if valid >= self.known:
+            self.dirty = 0
+        return valid >= upto
+
+    def spans(self, line_text, first, last):
+        """Token spans of rows first <= row < last, one list per row."""
+        if first >= last:
+            return []
+        lex = self.lexer
+        self.advance(line_text, last, CATCH_UP_ROWS)
+        if first < self.valid:
+            state = self.states[first]
+        else:
+            # Still catching up: guess from a few hundred rows above.
+            start = max(first - SYNC_ROWS, self.valid - 1)
+            state = self.states[start] if start == self.valid - 1 else None
+            for row in range(start, first):
+                state = lex(line_text(row), state)[1]
+
+        rows = []
+        for row in range(first, last):
+            spans, state = lex(line_text(row), state)
+            rows.append(spans)
+        return rows
+
+
+def paint(text, from_col, spans, marks=(), mark=None):
+    """Color visible row text from column from_col with spans, then marks on top."""
+    n = len(text)
+    if not n or (not spans and not marks):
+        return text
+
+    cuts = {0, n}
+    for s, e, _ in spans:
+        cuts.add(min(max(s - from_col, 0), n))
+        cuts.add(min(max(e - from_col, 0), n))
+    for s, e in marks:
+        cuts.add(min(max(s - from_col, 0), n))
+        cuts.add(min(max(e - from_col, 0), n))
+    cuts = sorted(cuts)
+
+    out = []
+    fg = bg = None
+    si = mi = 0
+    for a, b in zip(cuts, cuts[1:]):
+        col = a + from_col
+        while si < len(spans) and spans[si][1] <= col:
+            si += 1
+        while mi < len(marks) and marks[mi][1] <= col:
+            mi += 1
+        want_fg = THEME.get(spans[si][2]) if si < len(spans) and spans[si][0] <= col else None
+        want_bg = mark if mi < len(marks) and marks[mi][0] <= col else None
+        if want_fg != fg:
+            out.append(want_fg or DEFAULT_FG)
+            fg = want_fg
+        if want_bg != bg:
+            out.append(want_bg or DEFAULT_BG)
+            bg = want_bg
+        out.append("".join(text[a:b]))
+    if fg:
+        out.append(DEFAULT_FG)
+    if bg:
+        out.append(DEFAULT_BG)
+    return "".join(out)
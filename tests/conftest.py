@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+import buffer_op
+import cell_width
+import journal
+import latency
+import swap_file
+import syntax
+import workspace
+
+# Module-level settings the tests may change, as they were on import.
+SETTINGS = [(module, name, getattr(module, name)) for module, name in (
+    (buffer_op, "WRAP"), (buffer_op, "ENGINE"), (buffer_op, "MAX_LINE"),
+    (buffer_op, "MAX_COL"), (cell_width, "TAB_SIZE"), (syntax, "ENABLED"),
+    (latency, "ENABLED"))]
+
+
+def reset_editor():
+    """Put every piece of module-level editor state back to a fresh start."""
+    buffer_op.cancel_search()
+    journal.stop()
+    swap_file.stop()
+    workspace.close_all()
+    buffer_op.use(buffer_op.Document())
+    for module, name, value in SETTINGS:
+        setattr(module, name, value)
+    latency.reset()
+
+
+@pytest.fixture
+def make_doc(tmp_path):
+    """
+    Returns make(text, name="doc.txt", mtime=None): write a document into
+    the test's temp folder and return its path. mtime (seconds) backdates it.
+    """
+    def make(text, name="doc.txt", mtime=None):
+        path = tmp_path / name
+        path.write_text(text)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return str(path)
+    return make
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    """
+    Every test starts (and leaves) the editor fresh. Tests that simulate a
+    restart call the returned function themselves.
+    """
+    reset_editor()
+    yield reset_editor
+    reset_editor()
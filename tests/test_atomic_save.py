@@ -0,0 +1,116 @@
+import os
+import tempfile
+
+import pytest
+
+import atomic_save
+from atomic_save import atomic_write, save_buffer
+from mapped_file import MappedLines
+from piece_table import PieceTable
+
+
+def write_temp(data):
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_list_and_piece_table_buffers_stream_the_same_text(monkeypatch):
+    monkeypatch.setattr(atomic_save, "ROWS_PER_WRITE", 2)
+    path = write_temp(b"old")
+    try:
+        save_buffer([list("a"), list("bc"), [], list("d")], path)
+        assert read(path) == b"a\nbc\n\nd\n"
+
+        save_buffer(PieceTable("a\nbc\n\nd"), path)
+        assert read(path) == b"a\nbc\n\nd\n"
+
+        save_buffer([], path)
+        assert read(path) == b""
+    finally:
+        os.remove(path)
+
+
+def test_failed_write_keeps_original_and_removes_temp():
+    path = write_temp(b"keep me\n")
+    folder = os.path.dirname(path)
+    before = set(os.listdir(folder))
+
+    def chunks():
+        yield "partial"
+        raise RuntimeError("disk full")
+
+    try:
+        with pytest.raises(RuntimeError):
+            atomic_write(path, chunks())
+        assert read(path) == b"keep me\n"
+        assert set(os.listdir(folder)) == before
+    finally:
+        os.remove(path)
+
+
+def test_mapped_save_copies_untouched_lines_verbatim():
+    path = write_temp(b"one\r\ntwo\r\nthree\r\nfour")
+    lines = MappedLines(path)
+    try:
+        lines.wait_until_indexed()
+        lines.insert(1, 3, "!")
+        save_buffer(lines, path)
+
+        # Untouched CRLF lines are copied as-is; the edited row keeps the
+        # file's line ending and the last line gains one.
+        assert read(path) == b"one\r\ntwo!\r\nthree\r\nfour\r\n"
+        assert list(lines) == ["one", "two!", "three", "four"]
+        assert lines.is_clean()
+    finally:
+        lines.close()
+        os.remove(path)
+
+
+def test_mapped_save_of_clean_buffer_leaves_file_alone():
+    path = write_temp(b"a\nb")
+    lines = MappedLines(path)
+    try:
+        lines.wait_until_indexed()
+        mtime = os.stat(path).st_mtime_ns
+        save_buffer(lines, path)
+        assert os.stat(path).st_mtime_ns == mtime
+        assert read(path) == b"a\nb"
+    finally:
+        lines.close()
+        os.remove(path)
+
+
+def test_snapshot_keeps_the_text_it_was_taken_from():
+    import buffer_op
+
+    for buffer in ([list("ab"), list("cd")], PieceTable("ab\ncd")):
+        buffer_op.use(buffer_op.Document())
+        buffer_op.buffer = buffer
+        chunks = buffer_op.snapshot()
+        for op in ({"kind": "insert_text", "row": 0, "col": 0, "text": "x"},
+                   {"kind": "split_line", "row": 0, "col": 1},
+                   {"kind": "join_line", "row": 1, "col": 2, "prev_len": 2},
+                   {"kind": "delete_text", "row": 0, "col": 0, "text": "x"}):
+            buffer_op.apply_op(op)
+        assert "".join(chunks) == "ab\ncd\n"
+        buffer_op.release_snapshot()
+        assert buffer_op.own_rows is None
+        assert [buffer_op.line_text(r) for r in range(len(buffer_op.buffer))] == ["", "abcd"]
+
+
+def test_new_file_gets_the_umask_mode(tmp_path):
+    path = str(tmp_path / "new.txt")
+    umask = os.umask(0o022)
+    try:
+        atomic_write(path, ["x"])
+    finally:
+        os.umask(umask)
+    assert os.stat(path).st_mode & 0o777 == 0o644
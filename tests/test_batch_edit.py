@@ -0,0 +1,38 @@
+import io
+import json
+
+import pytest
+
+import batch_edit
+
+
+def script(*ops):
+    return io.StringIO("".join(json.dumps(op) + "\n" for op in ops) + "\n")
+
+
+def test_script_ops_are_applied_and_saved(make_doc):
+    path = make_doc("foo bar\nbaz\n")
+    out = path + ".out"
+
+    applied, seconds = batch_edit.run(path, script(
+        {"kind": "insert_text", "row": 0, "col": 0, "text": ">> "},
+        {"kind": "split_line", "row": 1, "col": 1},
+        {"kind": "replace", "search": "foo", "replace": "qux"},
+        {"kind": "undo"},
+    ), out=out, history=True)
+
+    assert applied == 4
+    assert seconds >= 0
+    with open(out) as f:
+        assert f.read() == ">> foo bar\nb\naz\n"
+    with open(path) as f:
+        assert f.read() == "foo bar\nbaz\n"
+
+
+def test_bad_lines_are_reported_with_their_number(make_doc):
+    path = make_doc("abc\n")
+
+    with pytest.raises(batch_edit.ScriptError, match="line 2"):
+        batch_edit.run(path, io.StringIO('{"kind": "insert_char", "row": 0, "col": 0, "ch": "x"}\n{oops\n'))
+    with pytest.raises(batch_edit.ScriptError, match="needs --history"):
+        batch_edit.run(path, script({"kind": "undo"}))
@@ -5,21 +5,7 @@ import tempfile
 import buffer_op
 
 
-def reset_state():
-    """Reset global editor state on buffer_op before each test."""
-    buffer_op.buffer = [[]]
-    buffer_op.row = 0
-    buffer_op.col = 0
-    buffer_op.top_line = 0
-    buffer_op.left_col = 0
-    buffer_op.undo_stack.clear()
-    buffer_op.redo_stack.clear()
-    buffer_op.matches.clear()
-    buffer_op.history.clear()
-
-
 def test_insert_char_and_undo_redo():
-    reset_state()
 
     op = {"kind": "insert_char", "row": 0, "col": 0, "ch": "a"}
     buffer_op.apply_op(op, record_history=True)
@@ -43,7 +29,6 @@ def test_insert_char_and_undo_redo():
 
 
 def test_delete_char_and_undo():
-    reset_state()
 
     buffer_op.buffer = [list("ab")]
     buffer_op.row = 0
@@ -64,7 +49,6 @@ def test_delete_char_and_undo():
 
 
 def test_split_line_and_undo_join_line():
-    reset_state()
 
     buffer_op.buffer = [list("hello world")]
     buffer_op.row = 0
@@ -88,7 +72,6 @@ def test_split_line_and_undo_join_line():
 
 
 def test_join_line_and_undo_split():
-    reset_state()
 
     buffer_op.buffer = [list("abc"), list("def")]
     buffer_op.row = 1
@@ -119,7 +102,6 @@ def test_join_line_and_undo_split():
 
 
 def test_search_all_finds_all_matches():
-    reset_state()
 
     buffer_op.buffer = [list("hello world"), list("world hello")]
     buffer_op.search_all("world")
@@ -136,7 +118,6 @@ def test_search_all_finds_all_matches():
 
 
 def test_replace_all_replaces_pattern_everywhere():
-    reset_state()
 
     buffer_op.buffer = [list("foo bar foo"), list("foo")]
     buffer_op.replace_all("foo", "x")
@@ -146,7 +127,6 @@ def test_replace_all_replaces_pattern_everywhere():
 
 
 def test_go_line_home_and_end():
-    reset_state()
 
     buffer_op.buffer = [list("abcdef")]
     buffer_op.row = 0
@@ -160,7 +140,6 @@ def test_go_line_home_and_end():
 
 
 def test_move_word_left_basic():
-    reset_state()
 
     buffer_op.buffer = [list("hello  world")]
     buffer_op.row = 0
@@ -175,7 +154,6 @@ def test_move_word_left_basic():
 
 
 def test_move_word_right_basic():
-    reset_state()
 
     buffer_op.buffer = [list("hello  world")]
     buffer_op.row = 0
@@ -188,7 +166,6 @@ def test_move_word_right_basic():
 
 
 def test_page_up_and_down():
-    reset_state()
 
     # create more lines than a single page
     buffer_op.buffer = [list(str(i)) for i in range(50)]
@@ -205,7 +182,6 @@ def test_page_up_and_down():
 
 
 def test_clear_buffer_resets_state():
-    reset_state()
 
     buffer_op.buffer = [list("abc"), list("def")]
     buffer_op.row = 1
@@ -223,7 +199,6 @@ def test_clear_buffer_resets_state():
 
 
 def test_load_file_populates_buffer_and_resets_cursors():
-    reset_state()
 
     fd, path = tempfile.mkstemp()
     os.close(fd)
@@ -244,3 +219,115 @@ def test_load_file_populates_buffer_and_resets_cursors():
         assert buffer_op.redo_stack == []
     finally:
         os.remove(path)
+
+
+def test_replace_undo_restores_only_changed_rows():
+
+    # "bar" already exists before the replace; undo must not touch it.
+    buffer_op.buffer = [list("foo x foo"), list("bar"), list("nothing")]
+    op = {"kind": "replace", "search": "foo", "replace": "bar"}
+    buffer_op.apply_op(op, record_history=True)
+
+    assert buffer_op.buffer[0] == list("bar x bar")
+    assert op["rows"] == [(0, "foo x foo")]
+
+    buffer_op.undo()
+    assert buffer_op.buffer == [list("foo x foo"), list("bar"), list("nothing")]
+
+    buffer_op.redo()
+    assert buffer_op.buffer == [list("bar x bar"), list("bar"), list("nothing")]
+
+
+def test_typing_and_backspace_coalesce_into_word_ops():
+
+    for i, ch in enumerate("hi there"):
+        op = {"kind": "insert_char", "row": 0, "col": i, "ch": ch}
+        buffer_op.apply_op(op, record_history=True)
+
+    # "hi" and " there" are separate undo steps
+    assert len(buffer_op.undo_stack) == 2
+    buffer_op.undo()
+    assert buffer_op.buffer == [list("hi")]
+    buffer_op.redo()
+    assert buffer_op.buffer == [list("hi there")]
+
+    for c in range(8, 5, -1):
+        ch = buffer_op.buffer[0][c - 1]
+        op = {"kind": "delete_char", "row": 0, "col": c - 1, "ch": ch}
+        buffer_op.apply_op(op, record_history=True)
+    assert buffer_op.buffer == [list("hi th")]
+    assert buffer_op.undo_stack[-1]["text"] == "ere"
+
+    buffer_op.undo()
+    assert buffer_op.buffer == [list("hi there")]
+    assert buffer_op.col == 8
+
+
+def test_undo_history_evicts_oldest_ops(monkeypatch):
+    monkeypatch.setattr(buffer_op, "UNDO_LIMIT_OPS", 10)
+
+    buffer_op.buffer = [[] for _ in range(30)]
+    for r in range(30):
+        op = {"kind": "insert_char", "row": r, "col": 0, "ch": "x"}
+        buffer_op.apply_op(op, record_history=True)
+
+    assert len(buffer_op.undo_stack) <= 10
+    # the newest edits are the ones kept
+    assert buffer_op.undo_stack[-1]["row"] == 29
+    ops, size = buffer_op.history_usage()
+    assert ops == len(buffer_op.undo_stack)
+    assert size == sum(buffer_op.op_size(op) for op in buffer_op.undo_stack)
+
+
+def test_record_keys_turns_typed_burst_into_one_op():
+    import keyboard
+
+    def down(name):
+        return keyboard.KeyboardEvent(keyboard.KEY_DOWN, 0, name=name)
+
+    keys = [down(c) for c in "hi"] + [down("space"), down("x"), down("enter"), down("y")]
+    buffer_op.record_keys(keys)
+
+    assert buffer_op.buffer == [list("hi x"), ["y"]]
+    assert (buffer_op.row, buffer_op.col) == (1, 1)
+    assert [op["kind"] for op in buffer_op.undo_stack] == ["insert_text", "split_line", "insert_char"]
+
+    buffer_op.undo()
+    buffer_op.undo()
+    buffer_op.undo()
+    assert buffer_op.buffer == [[]]
+
+
+def test_documents_are_independent_and_editable_from_threads():
+    import threading
+
+    docs = [buffer_op.Document() for _ in range(4)]
+
+    def edit(doc, ch):
+        for i in range(200):
+            doc.apply_op({"kind": "insert_char", "row": 0, "col": i, "ch": ch})
+        doc.undo()
+
+    threads = [threading.Thread(target=edit, args=(doc, ch)) for doc, ch in zip(docs, "abcd")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for doc in docs:
+        # The typed run was coalesced into one op, so undo removed all of it.
+        assert doc.buffer == [[]]
+        assert len(doc.redo_stack) == 1
+    # The module-level document was never touched.
+    assert buffer_op.buffer == [[]]
+    assert not buffer_op.undo_stack
+
+    previous = buffer_op.current
+    buffer_op.current = docs[0]
+    try:
+        assert buffer_op.buffer is docs[0].buffer
+        buffer_op.redo()
+        assert docs[0].buffer == [["a"] * 200]
+        assert buffer_op.col == docs[0].col == 200
+    finally:
+        buffer_op.current = previous
@@ -0,0 +1,48 @@
+import bulk_replace
+import buffer_op
+from piece_table import PieceTable
+
+
+def test_chunk_rewrites_only_rows_with_the_pattern():
+    lines = ["foo foo", "bar", "", "xfoo", "foofoo"]
+    changed, count = bulk_replace.replace_chunk(lines, "foo", "q")
+    assert changed == [(0, "q q"), (3, "xq"), (4, "qq")]
+    assert count == 5
+    assert bulk_replace.replace_chunk(lines, "zzz", "q") == ([], 0)
+
+
+def test_runs_group_consecutive_rows():
+    assert list(bulk_replace.runs([1, 2, 3, 7, 9, 10])) == [(1, 3), (7, 7), (9, 10)]
+    assert list(bulk_replace.runs([])) == []
+
+
+def test_parallel_and_inline_results_agree(monkeypatch):
+    monkeypatch.setattr(bulk_replace, "CHUNK_ROWS", 7)
+    lines = ["line %d %s" % (i, "ab" * (i % 3)) for i in range(100)]
+    inline = bulk_replace.replace_lines(lines, "ab", "X", len(lines), workers=1)
+
+    monkeypatch.setattr(bulk_replace, "PARALLEL_MIN_ROWS", 10)
+    parallel = bulk_replace.replace_lines(lines, "ab", "X", len(lines), workers=2)
+
+    assert parallel == inline
+    assert inline[1] == sum(i % 3 for i in range(100))
+    assert [r for r, _, _ in inline[0]] == [i for i in range(100) if i % 3]
+    assert bulk_replace.replace_lines(lines, "b\nl", "X", len(lines)) == ([], 0)
+
+
+def test_replace_op_reports_count_and_undoes_in_one_step(monkeypatch):
+    monkeypatch.setattr(bulk_replace, "CHUNK_ROWS", 2)
+    text = "a foo\nfoo foo\nbar\nfoo\nbaz"
+    buffer_op.buffer = PieceTable(text)
+    buffer_op.search_all("foo")
+
+    op = {"kind": "replace", "search": "foo", "replace": "qux"}
+    buffer_op.apply_op(op, record_history=True)
+    assert op["count"] == 4
+    assert op["rows"] == [(0, "a foo"), (1, "foo foo"), (3, "foo")]
+    assert [buffer_op.line_text(r) for r in range(5)] == ["a qux", "qux qux", "bar", "qux", "baz"]
+    assert list(buffer_op.matches) == []
+
+    buffer_op.undo()
+    assert "\n".join(buffer_op.line_text(r) for r in range(5)) == text
+    assert len(list(buffer_op.matches)) == 4
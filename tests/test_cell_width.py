@@ -0,0 +1,90 @@
+import buffer_op
+import cell_width
+
+
+class Key:
+    def __init__(self, name):
+        self.name = name
+
+
+def test_measure_tabs_wide_and_combining_characters():
+    assert cell_width.measure("plain ascii") is None
+    # a, tab to the next stop (4), b, two wide characters, e + combining acute
+    assert cell_width.measure("a\tb中文é") == [0, 1, 4, 5, 7, 9, 10, 10]
+
+
+def test_cursor_maps_to_screen_cells(monkeypatch):
+    monkeypatch.setattr(buffer_op, "MAX_COL", 10)
+    buffer_op.buffer = [list("a\tb中文c"), list("中文中文中文中文"), list("ab")]
+
+    buffer_op.row, buffer_op.col = 0, 4
+    assert buffer_op.cursor_screen_pos() == (1, 8)
+    assert buffer_op.col_at(0, 6) == 3    # second cell of 中
+    assert buffer_op.line_width(1) == 16
+
+    # Down keeps the screen column rather than the character index.
+    buffer_op.handle_arrow_keys(Key("down"))
+    assert (buffer_op.row, buffer_op.col) == (1, 3)
+
+    # Scrolling right shows the cursor's wide character whole.
+    buffer_op.col = 7
+    buffer_op.adjust_left_col()
+    assert buffer_op.left_col == 6
+    assert buffer_op.cursor_screen_pos() == (2, 9)
+    assert "".join(buffer_op.visible_text(1, 5, 15)[0]) == " 文中文中 "
+    assert "".join(buffer_op.visible_text(0, 0, 10)[0]) == "a   b中文c"
+
+
+def test_edits_reset_only_the_rows_they_touch():
+    buffer_op.buffer = [list("\tx"), list("中"), list("y")]
+    buffer_op.line_width(0)
+    buffer_op.line_width(1)
+    tables = buffer_op.widths.tables
+    row1 = tables[1]
+
+    buffer_op.apply_op({"kind": "insert_text", "row": 0, "col": 0, "text": "ab"})
+    assert tables[1] is row1
+    assert buffer_op.line_width(0) == 5
+
+    buffer_op.apply_op({"kind": "split_line", "row": 0, "col": 1})
+    assert tables[2] is row1
+    assert buffer_op.cell_of(1, 2) == 4
+
+    # Replacing the buffer wholesale drops every table.
+    buffer_op.buffer = [list("\t")]
+    assert buffer_op.line_width(0) == 4
+
+
+def test_plain_rows_stay_plain_without_measuring(monkeypatch):
+    buffer_op.buffer = [list("x" * 5000), list("y")]
+    assert buffer_op.line_width(0) == 5000
+    measured = []
+    real = cell_width.measure
+    monkeypatch.setattr(cell_width, "measure", lambda text: measured.append(text) or real(text))
+
+    for op in ({"kind": "insert_char", "row": 0, "col": 10, "ch": "a"},
+               {"kind": "delete_char", "row": 0, "col": 3, "ch": "x"},
+               {"kind": "split_line", "row": 0, "col": 100},
+               {"kind": "join_line", "row": 0, "col": 100, "prev_len": 100}):
+        buffer_op.apply_op(op)
+        buffer_op.line_width(0)
+    buffer_op.undo()
+    buffer_op.line_width(0)
+    assert measured == []
+
+    # A tab makes the row worth measuring again.
+    buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 0, "ch": "\t"})
+    assert buffer_op.line_width(0) == 4 + 100
+    assert len(measured) == 1
+
+
+def test_wrapped_rows_break_by_cells(monkeypatch):
+    monkeypatch.setattr(buffer_op, "MAX_COL", 4)
+    buffer_op.buffer = [list("中文中文ab")]
+    buffer_op.set_wrap(True)
+    try:
+        assert buffer_op.visible_segments() == [(0, 0, 4), (0, 4, 8), (0, 8, 12)]
+        buffer_op.col = 4
+        assert buffer_op.cursor_screen_pos() == (3, 1)
+    finally:
+        buffer_op.set_wrap(False)
@@ -0,0 +1,43 @@
+import io
+
+from frame_renderer import CLEAR_SCREEN, FrameRenderer, goto
+
+
+def test_first_draw_repaints_every_row():
+    out = io.StringIO()
+    frame = FrameRenderer(out)
+
+    changed = frame.draw(["a", "b", "status"], (1, 2))
+
+    assert changed == 3
+    written = out.getvalue()
+    assert CLEAR_SCREEN in written
+    assert written.endswith(goto(1, 2) + "\033[?25h")
+
+
+def test_only_changed_rows_are_written():
+    out = io.StringIO()
+    frame = FrameRenderer(out)
+    frame.draw(["abc", "def", "status 1"], (1, 1))
+    out.seek(0)
+    out.truncate()
+
+    changed = frame.draw(["abc", "dXf", "status 2"], (2, 3))
+
+    written = out.getvalue()
+    assert changed == 2
+    assert CLEAR_SCREEN not in written
+    assert goto(1, 1) + "abc" not in written
+    assert goto(2, 1) + "dXf" in written
+    assert goto(3, 1) + "status 2" in written
+
+
+def test_invalidate_forces_full_redraw():
+    out = io.StringIO()
+    frame = FrameRenderer(out)
+    frame.draw(["same"], (1, 1))
+
+    frame.invalidate()
+    changed = frame.draw(["same"], (1, 1))
+
+    assert changed == 1
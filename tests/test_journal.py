@@ -0,0 +1,132 @@
+import os
+
+import buffer_op
+import journal
+
+
+def test_journal_replays_unsaved_edits_after_crash(reset_state, make_doc):
+    path = make_doc("hello\nworld\n")
+
+    buffer_op.load_file(path)
+    journal.start(path)
+    for i, ch in enumerate("abc"):
+        buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 5 + i, "ch": ch})
+    buffer_op.apply_op({"kind": "split_line", "row": 1, "col": 2})
+    buffer_op.undo()
+    buffer_op.redo()
+    buffer_op.apply_op({"kind": "replace", "search": "wo", "replace": "WO"})
+    expected = [line[:] for line in buffer_op.buffer]
+
+    # Simulate a crash: nothing saved, journal left behind.
+    journal.stop()
+    reset_state()
+
+    buffer_op.load_file(path)
+    recovered = journal.start(path)
+
+    assert recovered == 7
+    assert buffer_op.buffer == expected
+    journal.stop(discard=True)
+    assert not os.path.exists(journal.journal_path(path))
+
+
+def test_journal_for_changed_document_is_not_replayed(make_doc):
+    path = make_doc("abc\n")
+
+    buffer_op.load_file(path)
+    journal.start(path)
+    buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 0, "ch": "x"})
+    journal.stop()
+
+    with open(path, "w") as f:
+        f.write("changed elsewhere\n")
+
+    buffer_op.load_file(path)
+    assert journal.start(path) == 0
+    assert buffer_op.buffer == [list("changed elsewhere")]
+    assert os.path.exists(journal.journal_path(path) + ".stale")
+    journal.stop(discard=True)
+
+
+def test_torn_last_line_is_ignored(make_doc):
+    path = make_doc("abc\n")
+
+    buffer_op.load_file(path)
+    journal.start(path)
+    buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 3, "ch": "d"})
+    journal.stop()
+    with open(journal.journal_path(path), "a") as f:
+        f.write('{"kind":"insert_ch')
+
+    buffer_op.load_file(path)
+    assert journal.start(path) == 1
+    assert buffer_op.buffer == [list("abcd")]
+
+    # Entries written after recovery are not glued to the torn line.
+    buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 4, "ch": "e"})
+    journal.stop()
+    buffer_op.load_file(path)
+    assert journal.start(path) == 2
+    assert buffer_op.buffer == [list("abcde")]
+    journal.stop(discard=True)
+
+
+def test_edits_made_during_a_save_are_carried_into_new_journal(reset_state, make_doc):
+    from atomic_save import atomic_write
+
+    path = make_doc("abc\n")
+
+    buffer_op.load_file(path)
+    journal.start(path)
+    buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 3, "ch": "d"})
+
+    # Snapshot, keep typing while the file is written, then restart.
+    chunks = buffer_op.snapshot()
+    saved = journal.mark()
+    buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 4, "ch": "e"})
+    atomic_write(path, chunks)
+    buffer_op.release_snapshot()
+    journal.restart(path, keep_after=saved)
+    expected = [line[:] for line in buffer_op.buffer]
+
+    journal.stop()
+    reset_state()
+    buffer_op.load_file(path)
+    assert buffer_op.buffer == [list("abcd")]
+    assert journal.start(path) == 1
+    assert buffer_op.buffer == expected
+    journal.stop(discard=True)
+
+
+def test_undo_across_a_save_is_recovered_as_the_edit_it_made(reset_state, make_doc):
+    from atomic_save import atomic_write
+
+    path = make_doc("")
+
+    buffer_op.load_file(path)
+    journal.start(path)
+    buffer_op.type_text("ab")
+    saved = journal.mark()
+    atomic_write(path, buffer_op.snapshot())
+    buffer_op.release_snapshot()
+    journal.restart(path, keep_after=saved)
+
+    # Coalesced with "ab" typed before the save: undo removes all three.
+    buffer_op.type_text("c")
+    buffer_op.undo()
+    assert buffer_op.buffer == [[]]
+    buffer_op.apply_op({"kind": "replace", "search": "x", "replace": "y"})
+    buffer_op.type_text("x1\nx2")
+    buffer_op.apply_op({"kind": "replace", "search": "x", "replace": "y"})
+    buffer_op.undo()
+    buffer_op.undo()
+    buffer_op.redo()
+    expected = [line[:] for line in buffer_op.buffer]
+
+    journal.stop()
+    reset_state()
+    buffer_op.load_file(path)
+    assert buffer_op.buffer == [list("ab")]
+    journal.start(path)
+    assert buffer_op.buffer == expected
+    journal.stop(discard=True)
@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+
+import buffer_op
+import latency
+
+
+def test_histogram_percentiles_are_within_one_bucket():
+    h = latency.Histogram()
+    for us in range(1, 1001):
+        h.add(us / 1e6)
+
+    assert h.count == 1000
+    assert h.max == 1000 / 1e6
+    # Each bucket spans a quarter of a doubling: at most ~19% too high.
+    assert 500e-6 <= h.percentile(50) <= 500e-6 * 2 ** 0.25
+    assert 990e-6 <= h.percentile(99) <= 1000e-6
+    assert latency.Histogram().percentile(50) == 0.0
+
+
+def test_disabled_instrumentation_records_nothing():
+    latency.ENABLED = False
+    buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 0, "ch": "a"})
+    assert latency.histograms["apply"].count == 0
+    assert latency.histograms["scroll"].count == 0
+
+
+def test_enabled_stages_are_recorded_and_exported():
+    latency.ENABLED = True
+    try:
+        buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 0, "ch": "a"})
+        buffer_op.undo()
+        buffer_op.go_line_end()
+    finally:
+        latency.ENABLED = False
+
+    assert latency.histograms["apply"].count == 2
+    assert latency.histograms["scroll"].count >= 1
+    assert latency.overlay().startswith("-- LATENCY p50/p99 ms: apply ")
+
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        latency.export(path)
+        with open(path) as f:
+            data = json.load(f)
+        assert data["stages"]["apply"]["count"] == 2
+        assert len(data["stages"]["apply"]["buckets"]) == latency.BUCKETS
+    finally:
+        os.remove(path)
@@ -0,0 +1,80 @@
+import os
+import tempfile
+
+import buffer_op
+from mapped_file import MappedLines
+
+
+def write_temp(text):
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    with open(path, "w", newline="") as f:
+        f.write(text)
+    return path
+
+
+def test_rows_decode_lazily_like_line_reader():
+    path = write_temp("alpha\nbeta\r\n\ngamma\n")
+    lines = MappedLines(path)
+    try:
+        lines.wait_until_indexed()
+        assert len(lines) == 4
+        assert lines[1] == "beta"
+        assert lines.line_length(3) == 5
+        assert list(lines) == ["alpha", "beta", "", "gamma"]
+    finally:
+        lines.close()
+        os.remove(path)
+
+
+def test_edits_materialize_only_touched_rows():
+    path = write_temp("one\ntwo\nthree\nfour")
+    lines = MappedLines(path)
+    try:
+        lines.wait_until_indexed()
+        lines.insert(1, 3, "!")
+        lines.split_line(2, 2)
+        lines.join_line(0)
+        lines.delete(3, 0, 2)
+
+        assert list(lines) == ["onetwo!", "th", "ree", "ur"]
+        # The first row was never touched and is still read from the file.
+        lines.set_line(2, "REE")
+        assert lines[2] == "REE"
+    finally:
+        lines.close()
+        os.remove(path)
+
+
+def test_save_remaps_onto_written_file():
+    path = write_temp("a\nb\n")
+    lines = MappedLines(path)
+    try:
+        lines.wait_until_indexed()
+        lines.insert(0, 1, "x")
+        lines.save(path)
+
+        assert list(lines) == ["ax", "b"]
+        with open(path) as f:
+            assert f.read() == "ax\nb\n"
+    finally:
+        lines.close()
+        os.remove(path)
+
+
+def test_load_file_with_mmap_engine_and_undo():
+    path = write_temp("hello\nworld\n")
+    try:
+        buffer_op.load_file(path, engine="mmap")
+        buffer_op.buffer.wait_until_indexed()
+
+        op = {"kind": "split_line", "row": 0, "col": 2, "right": "llo"}
+        buffer_op.apply_op(op, record_history=True)
+        assert list(buffer_op.buffer) == ["he", "llo", "world"]
+
+        buffer_op.undo()
+        assert list(buffer_op.buffer) == ["hello", "world"]
+    finally:
+        buffer_op.release_buffer()
+        buffer_op.buffer = [[]]
+        os.remove(path)
@@ -0,0 +1,103 @@
+import random
+
+import buffer_op
+import match_index
+from match_index import MatchIndex
+
+
+def full_scan(pattern):
+    out = []
+    for r in range(len(buffer_op.buffer)):
+        for i in buffer_op.find_all_in_line(buffer_op.line_text(r), pattern):
+            out.append((r, i, i + len(pattern)))
+    return out
+
+
+def test_replace_rows_shifts_later_matches():
+    index = MatchIndex()
+    index.reset("x", [(0, 0, 1), (2, 1, 2), (5, 0, 1)])
+
+    index.replace_rows(2, 2, [(2, 0, 1), (3, 4, 5)], delta=1)
+
+    assert list(index) == [(0, 0, 1), (2, 0, 1), (3, 4, 5), (6, 0, 1)]
+    assert len(index) == 4
+    assert (6, 0, 1) in index
+    assert list(index.in_rows(2, 4)) == [(2, 0, 1), (3, 4, 5)]
+
+
+def test_matches_follow_edits_without_rescans(monkeypatch):
+    monkeypatch.setattr(match_index, "BLOCK_SIZE", 4)
+    rng = random.Random(99)
+    buffer_op.buffer = [list("ab" * rng.randrange(5)) for _ in range(40)]
+    buffer_op.search_all("ab")
+
+    for _ in range(400):
+        r = rng.randrange(len(buffer_op.buffer))
+        c = rng.randint(0, buffer_op.line_length(r))
+        action = rng.random()
+        if action < 0.4:
+            op = {"kind": "insert_char", "row": r, "col": c, "ch": rng.choice("ab")}
+        elif action < 0.6 and c < buffer_op.line_length(r):
+            op = {"kind": "delete_char", "row": r, "col": c,
+                  "ch": buffer_op.buffer[r][c]}
+        elif action < 0.8:
+            op = {"kind": "split_line", "row": r, "col": c,
+                  "right": buffer_op.buffer[r][c:]}
+        elif r + 1 < len(buffer_op.buffer):
+            n = buffer_op.line_length(r)
+            op = {"kind": "join_line", "row": r, "col": n, "prev_len": n,
+                  "curr": buffer_op.buffer[r + 1][:]}
+        else:
+            continue
+        buffer_op.apply_op(op, record_history=True)
+        if rng.random() < 0.2:
+            buffer_op.undo()
+
+        assert list(buffer_op.matches) == full_scan("ab")
+
+
+def test_replace_keeps_matches_current():
+    buffer_op.buffer = [list("foo bar"), list("bar"), list("baz")]
+    buffer_op.search_all("bar")
+
+    buffer_op.apply_op({"kind": "replace", "search": "baz", "replace": "bar"})
+    assert list(buffer_op.matches) == [(0, 4, 7), (1, 0, 3), (2, 0, 3)]
+
+
+def test_viewport_query_groups_by_row(monkeypatch):
+    monkeypatch.setattr(match_index, "BLOCK_SIZE", 2)
+    index = MatchIndex()
+    index.reset("x", [(1, 0, 1), (1, 4, 5), (1, 8, 9), (3, 2, 3), (9, 0, 1)])
+
+    assert index.by_row(1, 4) == {1: [(0, 1), (4, 5), (8, 9)], 3: [(2, 3)]}
+    assert index.by_row(4, 9) == {}
+
+
+def test_next_and_prev_match_navigation():
+    buffer_op.buffer = [list("ab ab"), list("xx"), list("ab")]
+    buffer_op.search_all("ab")
+
+    buffer_op.next_match()
+    assert (buffer_op.row, buffer_op.col) == (0, 3)
+    buffer_op.next_match()
+    assert (buffer_op.row, buffer_op.col) == (2, 0)
+    # wraps around to the first match
+    buffer_op.next_match()
+    assert (buffer_op.row, buffer_op.col) == (0, 0)
+
+    buffer_op.prev_match()
+    assert (buffer_op.row, buffer_op.col) == (2, 0)
+    buffer_op.prev_match()
+    assert (buffer_op.row, buffer_op.col) == (0, 3)
+
+
+def test_multiline_matches_refresh_locally():
+    buffer_op.buffer = [list("a end"), list("start b"), list("end"), list("start")]
+    buffer_op.search_all("end\nstart")
+    assert len(buffer_op.matches) == 4
+
+    buffer_op.apply_op({"kind": "insert_char", "row": 1, "col": 0, "ch": "x"})
+    assert list(buffer_op.matches) == [(2, 0, 3), (3, 0, 5)]
+
+    buffer_op.undo()
+    assert list(buffer_op.matches) == [(0, 2, 5), (1, 0, 5), (2, 0, 3), (3, 0, 5)]
@@ -0,0 +1,59 @@
+import pickle
+
+import buffer_op
+from op_log import INSERT_CHAR, JOIN_LINE, REPLACE, Op, OpLog
+
+
+def test_op_round_trips_through_dict_schema():
+    ops = [
+        {"kind": "insert_char", "row": 1, "col": 2, "ch": "x"},
+        {"kind": "delete_text", "row": 0, "col": 3, "text": "abc"},
+        {"kind": "split_line", "row": 4, "col": 0},
+        {"kind": "join_line", "row": 2, "col": 5, "prev_len": 5},
+        {"kind": "replace", "search": "a", "replace": "b"},
+        {"kind": "replace", "search": "a", "replace": "b", "rows": [(0, "aa")]},
+    ]
+    for d in ops:
+        op = Op.from_dict(d)
+        assert op.as_dict() == d
+        assert op == d
+        assert op["kind"] == d["kind"]
+
+
+def test_oplog_behaves_like_a_list_of_ops():
+    log = OpLog()
+    assert not log and log == []
+
+    log.append(Op(INSERT_CHAR, 0, 0, "a"))
+    log.append({"kind": "join_line", "row": 3, "col": 4, "prev_len": 4})
+    log.append(Op(REPLACE, text="x", aux=["y", [(1, "x")]]))
+    assert len(log) == 3
+    assert log[1].code == JOIN_LINE and log[1]["prev_len"] == 4
+    assert [op["kind"] for op in log] == ["insert_char", "join_line", "replace"]
+
+    log[0] = Op(INSERT_CHAR, 0, 0, "b")
+    assert log[0]["ch"] == "b"
+
+    log.drop_oldest(1)
+    assert log.pop()["rows"] == [(1, "x")]
+    assert len(log) == 1
+    assert pickle.loads(pickle.dumps(log)) == log
+
+
+def test_history_entries_are_small():
+
+    buffer_op.buffer = [[] for _ in range(1000)]
+    for r in range(1000):
+        buffer_op.apply_op({"kind": "insert_char", "row": r, "col": 0, "ch": "x"})
+
+    ops, size = buffer_op.history_usage()
+    assert ops == 1000
+    # Packed into arrays: far below the ~250 bytes an op dict costs.
+    assert size <= 1000 * 32
+
+    for _ in range(1000):
+        buffer_op.undo()
+    assert all(not line for line in buffer_op.buffer)
+    for _ in range(1000):
+        buffer_op.redo()
+    assert all(line == ["x"] for line in buffer_op.buffer)
@@ -0,0 +1,106 @@
+import os
+import random
+import tempfile
+
+import buffer_op
+from piece_table import PieceTable
+
+
+def test_lines_and_lengths():
+    pt = PieceTable("hello\nworld\n\nend")
+
+    assert len(pt) == 4
+    assert list(pt) == ["hello", "world", "", "end"]
+    assert pt[1] == "world"
+    assert pt.line_length(2) == 0
+    assert pt.line_length(3) == 3
+
+
+def test_empty_table_has_one_empty_line():
+    pt = PieceTable()
+
+    assert len(pt) == 1
+    assert pt[0] == ""
+    assert list(pt) == [""]
+
+
+def test_insert_split_join_delete():
+    pt = PieceTable("abc\ndef")
+
+    pt.insert(0, 1, "XY")
+    assert pt[0] == "aXYbc"
+
+    pt.split_line(0, 3)
+    assert list(pt) == ["aXY", "bc", "def"]
+
+    pt.join_line(1)
+    assert list(pt) == ["aXY", "bcdef"]
+
+    pt.delete(1, 1, 3)
+    assert list(pt) == ["aXY", "bf"]
+
+    pt.set_line(0, "new")
+    assert pt.text() == "new\nbf"
+
+
+def test_random_edits_match_list_buffer():
+    rng = random.Random(1234)
+    lines = [list("line %d" % i) for i in range(20)]
+    pt = PieceTable("\n".join("".join(l) for l in lines))
+
+    for _ in range(2000):
+        r = rng.randrange(len(lines))
+        c = rng.randint(0, len(lines[r]))
+        action = rng.random()
+        if action < 0.5:
+            ch = rng.choice("abc ")
+            lines[r].insert(c, ch)
+            pt.insert(r, c, ch)
+        elif action < 0.7 and c < len(lines[r]):
+            del lines[r][c]
+            pt.delete(r, c)
+        elif action < 0.85:
+            lines.insert(r + 1, lines[r][c:])
+            del lines[r][c:]
+            pt.split_line(r, c)
+        elif r + 1 < len(lines):
+            lines[r].extend(lines.pop(r + 1))
+            pt.join_line(r)
+
+    assert list(pt) == ["".join(l) for l in lines]
+    assert len(pt) == len(lines)
+    for r in range(len(lines)):
+        assert pt.line_length(r) == len(lines[r])
+
+
+def test_apply_op_and_undo_on_piece_table():
+    buffer_op.buffer = PieceTable("hello world")
+
+    buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 5, "ch": ","})
+    buffer_op.apply_op({"kind": "split_line", "row": 0, "col": 6, "right": " world"})
+    assert list(buffer_op.buffer) == ["hello,", " world"]
+    assert (buffer_op.row, buffer_op.col) == (1, 0)
+
+    buffer_op.undo()
+    buffer_op.undo()
+    assert list(buffer_op.buffer) == ["hello world"]
+
+    buffer_op.redo()
+    assert list(buffer_op.buffer) == ["hello, world"]
+
+
+def test_load_file_with_piece_table_engine():
+
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+
+    try:
+        with open(path, "w") as f:
+            f.write("line1\nline2\n")
+
+        buffer_op.load_file(path, engine="piece_table")
+
+        assert isinstance(buffer_op.buffer, PieceTable)
+        assert list(buffer_op.buffer) == ["line1", "line2"]
+    finally:
+        os.remove(path)
@@ -0,0 +1,58 @@
+import os
+
+import buffer_op
+import project_search
+import workspace
+
+
+def make_tree(root):
+    files = {
+        "a.txt": "needle here\nnothing\n  needle\n",
+        "sub/b.py": "x = 'needle'\n",
+        "sub/deep/c.md": "no match\n",
+        "image.bin": b"needle\0\x01\x02",
+        "build/out.txt": "needle\n",
+        "node_modules/lib.js": "needle\n",
+        "skip.log": "needle\n",
+        ".gitignore": "build/\n*.log\n",
+    }
+    for name, content in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content if isinstance(content, bytes) else content.encode())
+
+
+def test_walk_skips_tool_folders_and_ignored_files(tmp_path):
+    make_tree(str(tmp_path))
+    found = sorted(os.path.relpath(p, tmp_path).replace(os.sep, "/")
+                   for p in project_search.walk(str(tmp_path)))
+    assert found == [".gitignore", "a.txt", "image.bin", "sub/b.py", "sub/deep/c.md"]
+
+
+def test_search_streams_results_from_a_process_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(project_search, "BATCH_FILES", 1)
+    monkeypatch.setattr(project_search, "READ_CHARS", 4)
+    make_tree(str(tmp_path))
+
+    calls = []
+    job = project_search.start_project_search(str(tmp_path), "needle", calls.append, workers=2)
+    assert job.wait(60)
+
+    results = sorted((os.path.basename(p), r, s, e) for p, r, s, e in job.results)
+    assert results == [("a.txt", 0, 0, 6), ("a.txt", 2, 2, 8), ("b.py", 0, 5, 11)]
+    assert job.files == 5
+    assert calls and calls[-1] is job
+
+    first = job.next_result()
+    assert job.next_result() != first
+    assert job.prev_result() == first
+
+
+def test_result_opens_its_file_at_the_match(tmp_path):
+    make_tree(str(tmp_path))
+    path = str(tmp_path / "a.txt")
+    workspace.open_document(path)
+    buffer_op.goto_match((2, 2, 8))
+    assert buffer_op.line_text(buffer_op.row) == "  needle"
+    assert (buffer_op.row, buffer_op.col) == (2, 2)
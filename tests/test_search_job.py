@@ -0,0 +1,79 @@
+import buffer_op
+import search_job
+from search_job import BackgroundSearch, start_search
+
+
+def test_background_search_matches_search_all(monkeypatch):
+    monkeypatch.setattr(search_job, "CHUNK_ROWS", 7)
+    buffer_op.buffer = [list("row %d foo foo" % i) for i in range(100)]
+    buffer_op.top_line = 40
+
+    buffer_op.search_all("foo")
+    expected = list(buffer_op.matches)
+
+    progress = []
+    job = start_search("foo", progress.append)
+    assert job.wait(5)
+
+    assert list(buffer_op.matches) == expected
+    assert progress and progress[-1] is job
+    assert not job.running
+    assert buffer_op.search_job is None
+
+
+def test_multiline_pattern_across_chunks(monkeypatch):
+    monkeypatch.setattr(search_job, "CHUNK_ROWS", 2)
+    buffer_op.buffer = [list("end"), list("start end"), list("start")]
+
+    job = start_search("end\nstart")
+    job.wait(5)
+
+    assert list(buffer_op.matches) == [(0, 0, 3), (1, 0, 5), (1, 6, 9), (2, 0, 5)]
+
+
+def test_cancel_keeps_partial_results():
+    buffer_op.buffer = [list("foo")]
+    job = BackgroundSearch("foo")
+    job.cancel()
+    job.start().wait(5)
+
+    assert job.cancelled
+    assert len(buffer_op.matches) == 0
+
+
+def test_pending_ranges_follow_moved_rows():
+    buffer_op.buffer = [list("x") for _ in range(50)]
+    buffer_op.top_line = 10
+    job = BackgroundSearch("x")
+
+    # A line split at row 30 pushes everything after it down by one.
+    job.rows_moved(30, 30, 1)
+
+    assert job._pending == [(10, 35), (35, 51), (0, 10)]
+
+
+def test_rows_indexed_after_the_start_are_searched(monkeypatch, tmp_path):
+    import threading
+
+    import mapped_file
+
+    # Hold the line index back until the search is running.
+    gate = threading.Event()
+    build = mapped_file.MappedLines._build_index
+
+    def slow_build(self):
+        gate.wait()
+        build(self)
+
+    monkeypatch.setattr(mapped_file.MappedLines, "_build_index", slow_build)
+    path = tmp_path / "big.txt"
+    path.write_text("".join("row %d needle\n" % i for i in range(2000)))
+    lines = mapped_file.MappedLines(str(path))
+    try:
+        buffer_op.buffer = lines
+        job = start_search("needle")
+        gate.set()
+        assert job.wait(10)
+        assert len(buffer_op.matches) == 2000
+    finally:
+        lines.close()
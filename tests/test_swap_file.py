@@ -0,0 +1,167 @@
+import json
+import os
+
+import buffer_op
+import journal
+import swap_file
+import syntax
+
+# Document mtime, older than any swap file written by the tests.
+OLD = 1_000_000_000
+
+
+def swap_entries(path):
+    with open(swap_file.swap_path(path)) as f:
+        return [json.loads(line) for line in f]
+
+
+def text():
+    return "\n".join(buffer_op.line_text(r) for r in range(len(buffer_op.buffer)))
+
+
+def test_autosave_writes_only_the_changed_rows(make_doc):
+    path = make_doc("\n".join("row %d" % i for i in range(100)) + "\n", mtime=OLD)
+    buffer_op.load_file(path)
+    swap_file.start(path)
+    try:
+        assert not swap_file.autosave()
+        assert not os.path.exists(swap_file.swap_path(path))
+
+        buffer_op.apply_op({"kind": "insert_text", "row": 10, "col": 0, "text": "a"})
+        buffer_op.apply_op({"kind": "split_line", "row": 12, "col": 2})
+        buffer_op.apply_op({"kind": "insert_text", "row": 90, "col": 0, "text": "b"})
+        assert buffer_op.swap.ops == 3
+        assert swap_file.autosave()
+        base, entry = swap_entries(path)
+        assert base["kind"] == "base"
+        # Row 11 between the edits and the rows after 12 are not copied.
+        assert entry["hunks"] == [[10, 1, ["arow 10"]], [12, 1, ["ro", "w 12"]],
+                                  [90, 1, ["brow 89"]]]
+
+        buffer_op.apply_op({"kind": "join_line", "row": 99, "col": 6})
+        buffer_op.apply_op({"kind": "split_line", "row": 99, "col": 3})
+        assert swap_file.autosave()
+        last = swap_entries(path)[-1]
+        assert last["hunks"] == [[99, 2, ["row", " 98row 99"]]]
+        assert buffer_op.swap.saved_at is not None
+
+        assert swap_file.pending(path)
+        assert swap_file.recovered_text(path) == text()
+    finally:
+        swap_file.stop(discard=True)
+
+
+def test_large_spans_are_compacted_into_a_full_copy(monkeypatch, make_doc):
+    monkeypatch.setattr(swap_file, "COMPACT_BYTES", 10)
+    path = make_doc("one\ntwo\nthree\n", mtime=OLD)
+    buffer_op.load_file(path)
+    swap_file.start(path)
+    try:
+        buffer_op.apply_op({"kind": "insert_text", "row": 0, "col": 3, "text": " 1"})
+        swap_file.autosave()
+        buffer_op.apply_op({"kind": "delete_text", "row": 2, "col": 0, "text": "th"})
+        swap_file.autosave()
+        assert [e["kind"] for e in swap_entries(path)] == ["base", "text"]
+        assert swap_file.recovered_text(path) == "one 1\ntwo\nree"
+    finally:
+        swap_file.stop(discard=True)
+
+
+def test_save_restarts_the_swap_file_and_drops_stale_autosaves(make_doc):
+    path = make_doc("abc\n", mtime=OLD)
+    buffer_op.load_file(path)
+    swap_file.start(path)
+    try:
+        buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 3, "ch": "d"})
+        # Copied by an autosave that only gets to write after the save.
+        stale = buffer_op.swap.take(buffer_op.current)
+
+        # A save copies the text; autosaves wait for it.
+        swap_file.pause()
+        buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 4, "ch": "e"})
+        assert not swap_file.autosave()
+        with open(path, "w") as f:
+            f.write("abcd\n")
+        os.utime(path, (1_000_000_000, 1_000_000_000))
+        swap_file.restart(path)
+
+        assert not os.path.exists(swap_file.swap_path(path))
+        assert not buffer_op.swap.write(stale)
+        assert swap_file.autosave()
+        assert swap_file.recovered_text(path) == "abcde"
+    finally:
+        swap_file.stop(discard=True)
+
+
+def test_changes_are_tracked_against_the_saved_text(make_doc):
+    path = make_doc("a\nb\n", mtime=OLD)
+    buffer_op.load_file(path)
+    swap_file.start(path)
+    try:
+        # Rows added before the save are in the saved file already.
+        buffer_op.apply_op({"kind": "split_line", "row": 0, "col": 0})
+        swap_file.pause()
+        buffer_op.apply_op({"kind": "insert_text", "row": 2, "col": 1, "text": "!"})
+        with open(path, "w") as f:
+            f.write("\na\nb\n")
+        os.utime(path, (1_000_000_000, 1_000_000_000))
+        swap_file.restart(path)
+        assert swap_file.autosave()
+        assert swap_file.recovered_text(path) == "\na\nb!"
+
+        # A failed save goes back to the old swap file with every row.
+        swap_file.pause()
+        buffer_op.apply_op({"kind": "join_line", "row": 0, "col": 0, "prev_len": 0})
+        swap_file.resume()
+        assert swap_file.autosave()
+        assert swap_file.recovered_text(path) == "a\nb!"
+
+        # A replace-all is one edit, however many rows it rewrites.
+        ops = buffer_op.swap.ops
+        buffer_op.apply_op({"kind": "replace", "search": "b", "replace": "c"})
+        buffer_op.apply_op({"kind": "replace", "search": "a", "replace": "d"})
+        assert buffer_op.swap.ops == ops + 2
+    finally:
+        swap_file.stop(discard=True)
+
+
+def test_recover_loads_the_swap_and_keeps_autosaving(reset_state, make_doc):
+    path = make_doc("hello\nworld\n", mtime=OLD)
+    buffer_op.load_file(path)
+    journal.start(path)
+    swap_file.start(path)
+    buffer_op.apply_op({"kind": "insert_text", "row": 1, "col": 5, "text": "!"})
+    swap_file.autosave()
+    # The editor dies, and the journal with it.
+    journal.stop(discard=True)
+    swap_file.stop()
+
+    reset_state()
+    buffer_op.load_file(path)
+    assert swap_file.pending(path)
+    try:
+        assert swap_file.recover(path) == 2
+        assert text() == "hello\nworld!"
+        assert buffer_op.journal is None
+
+        buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 0, "ch": ">"})
+        swap_file.autosave()
+        assert swap_file.recovered_text(path) == ">hello\nworld!"
+        swap_file.stop()
+
+        # A swap file written against another version of the document is ignored.
+        with open(path, "a") as f:
+            f.write("more\n")
+        assert not swap_file.pending(path)
+    finally:
+        swap_file.stop()
+        os.remove(swap_file.swap_path(path))
+
+
+def test_recovered_text_is_highlighted_from_scratch():
+    buffer_op.syntax = syntax.Highlighter(syntax.lex_python)
+    buffer_op.load_text('x = """\ntext')
+    assert buffer_op.syntax.spans(buffer_op.line_text, 1, 2) == [[(0, 4, "string")]]
+
+    buffer_op.load_text("x = 1\ntext")
+    assert buffer_op.syntax.spans(buffer_op.line_text, 1, 2) == [[]]
@@ -0,0 +1,157 @@
+import os
+import random
+import tempfile
+
+import buffer_op
+import syntax
+
+
+def kinds(line, lex, state=None):
+    spans, _ = lex(line, state)
+    return [(line[s:e], kind) for s, e, kind in spans]
+
+
+def test_python_tokens_and_triple_quoted_state():
+    assert kinds("def f(x=1):  # hi", syntax.lex_python) == [
+        ("def", "keyword"), ("f", "definition"), ("1", "number"), ("# hi", "comment")]
+    assert kinds("s = 'a\\'b' if None else \"c\"", syntax.lex_python) == [
+        ("'a\\'b'", "string"), ("if", "keyword"), ("None", "keyword"),
+        ("else", "keyword"), ('"c"', "string")]
+
+    spans, state = syntax.lex_python('x = """doc', None)
+    assert state == '"""' and spans[-1][2] == "string"
+    assert syntax.lex_python("still # text", state) == ([(0, 12, "string")], '"""')
+    assert kinds('end""" + 1', syntax.lex_python, state) == [
+        ('end"""', "string"), ("1", "number")]
+
+
+def test_ini_and_json_tokens():
+    assert kinds("[editor]", syntax.lex_ini) == [("[editor]", "section")]
+    assert kinds("path = new.txt", syntax.lex_ini) == [("path", "key"), ("=", "punctuation")]
+    assert kinds("; note", syntax.lex_ini) == [("; note", "comment")]
+
+    assert kinds('{"a": [1.5, "b", true]}', syntax.lex_json) == [
+        ("{", "punctuation"), ('"a"', "key"), (":", "punctuation"), ("[", "punctuation"),
+        ("1.5", "number"), (",", "punctuation"), ('"b"', "string"), (",", "punctuation"),
+        ("true", "keyword"), ("]", "punctuation"), ("}", "punctuation")]
+
+
+def test_edit_relexes_only_until_states_converge():
+
+    fd, path = tempfile.mkstemp(suffix=".py")
+    os.close(fd)
+    try:
+        with open(path, "w") as f:
+            f.write("\n".join("x = %d" % i for i in range(1000)))
+        buffer_op.load_file(path)
+    finally:
+        os.remove(path)
+
+    lexed = []
+
+    def counting(line, state):
+        lexed.append(line)
+        return syntax.lex_python(line, state)
+
+    highlighter = buffer_op.syntax
+    highlighter.lexer = counting
+    highlighter.spans(buffer_op.line_text, 990, 1000)
+    assert highlighter.valid == 1000
+
+    # An edit that changes no state: one row re-lexed, then the cache holds.
+    del lexed[:]
+    buffer_op.apply_op({"kind": "insert_char", "row": 500, "col": 0, "ch": "y"})
+    highlighter.spans(buffer_op.line_text, 990, 1000)
+    assert len(lexed) == 1 + 10
+
+    # Opening a string changes every later state, closing it restores them.
+    del lexed[:]
+    buffer_op.apply_op({"kind": "insert_text", "row": 500, "col": 0, "text": '"""'})
+    highlighter.spans(buffer_op.line_text, 0, 24)
+    assert len(lexed) == 24
+    assert highlighter.spans(buffer_op.line_text, 501, 502)[0] == [(0, 7, "string")]
+    buffer_op.apply_op({"kind": "insert_text", "row": 510, "col": 0, "text": '"""'})
+    del lexed[:]
+    highlighter.spans(buffer_op.line_text, 990, 1000)
+    assert len(lexed) < 30
+
+
+def test_cached_states_match_a_full_relex_after_random_edits():
+    rng = random.Random(7)
+    words = ['"""', "x", "'''", "#", " ", "'", "1"]
+
+    buffer_op.buffer = [list(rng.choice(words)) for _ in range(300)]
+    highlighter = buffer_op.syntax = syntax.Highlighter(syntax.lex_python)
+
+    for _ in range(400):
+        row = rng.randrange(len(buffer_op.buffer))
+        col = rng.randint(0, buffer_op.line_length(row))
+        choice = rng.random()
+        if choice < 0.5:
+            op = {"kind": "insert_text", "row": row, "col": col, "text": rng.choice(words)}
+        elif choice < 0.7:
+            op = {"kind": "split_line", "row": row, "col": col}
+        elif row + 1 < len(buffer_op.buffer):
+            op = {"kind": "join_line", "row": row, "col": buffer_op.line_length(row),
+                  "prev_len": buffer_op.line_length(row)}
+        else:
+            continue
+        buffer_op.apply_op(op)
+        if rng.random() < 0.2:
+            buffer_op.undo()
+        first = rng.randrange(len(buffer_op.buffer))
+        highlighter.spans(buffer_op.line_text, first, min(first + 24, len(buffer_op.buffer)))
+
+    state = None
+    expected = [None]
+    for row in range(len(buffer_op.buffer)):
+        state = syntax.lex_python(buffer_op.line_text(row), state)[1]
+        expected.append(state)
+    highlighter.spans(buffer_op.line_text, len(buffer_op.buffer) - 1, len(buffer_op.buffer))
+    assert highlighter.states[:highlighter.valid] == expected[:highlighter.valid]
+    assert highlighter.valid >= len(buffer_op.buffer)
+
+
+def test_partial_window_renders_match_a_fresh_highlighter(reset_state):
+    # Only a couple of rows are drawn between edits, so most of the cache
+    # is left half-updated across many edits.
+    words = ['"""', "a ", "b", "'''", "#", " ", '"']
+    for seed in range(200):
+        reset_state()
+        rng = random.Random(seed)
+        buffer_op.buffer = [list(rng.choice(words)) for _ in range(10)]
+        highlighter = buffer_op.syntax = syntax.Highlighter(syntax.lex_python)
+
+        for _ in range(30):
+            row = rng.randrange(len(buffer_op.buffer))
+            col = rng.randint(0, buffer_op.line_length(row))
+            choice = rng.random()
+            if choice < 0.5:
+                op = {"kind": "insert_text", "row": row, "col": col, "text": rng.choice(words)}
+            elif choice < 0.75:
+                op = {"kind": "split_line", "row": row, "col": col}
+            elif row + 1 < len(buffer_op.buffer):
+                op = {"kind": "join_line", "row": row, "col": buffer_op.line_length(row),
+                      "prev_len": buffer_op.line_length(row)}
+            else:
+                continue
+            buffer_op.apply_op(op)
+            if rng.random() < 0.2:
+                buffer_op.undo()
+
+            rows = len(buffer_op.buffer)
+            first = rng.randrange(rows)
+            last = min(first + 2, rows)
+            fresh = syntax.Highlighter(syntax.lex_python)
+            assert (highlighter.spans(buffer_op.line_text, first, last)
+                    == fresh.spans(buffer_op.line_text, first, last)), seed
+
+
+def test_paint_layers_search_marks_over_syntax_colors():
+    text = syntax.paint("if x", 0, [(0, 2, "keyword")], [(1, 3)], "<M>")
+    assert text == (syntax.THEME["keyword"] + "i" + "<M>" + "f" + syntax.DEFAULT_FG
+                    + " " + syntax.DEFAULT_BG + "x")
+    # Spans are in buffer columns; the viewport may start inside one.
+    assert syntax.paint("f x", 1, [(0, 2, "keyword")]) == (
+        syntax.THEME["keyword"] + "f" + syntax.DEFAULT_FG + " x")
+    assert syntax.paint("plain", 0, []) == "plain"
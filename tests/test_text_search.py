@@ -0,0 +1,48 @@
+import random
+
+from text_search import decode_pattern, line_chunks, search_chunks
+
+
+def naive(lines, pattern):
+    out = []
+    for r, line in enumerate(lines):
+        for i in range(len(line) - len(pattern) + 1):
+            if line[i:i + len(pattern)] == pattern:
+                out.append((r, i, i + len(pattern)))
+    return out
+
+
+def test_matches_naive_scan_for_single_line_patterns():
+    rng = random.Random(7)
+    lines = ["".join(rng.choice("ab ") for _ in range(rng.randrange(30)))
+             for _ in range(300)]
+
+    for pattern in ("a", "ab", "aa", "b a", "abab"):
+        assert list(search_chunks(line_chunks(lines), pattern)) == naive(lines, pattern)
+
+
+def test_matches_across_small_chunks():
+    text = "foo bar\nbarfoo\nfo\no foo"
+    chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+
+    assert list(search_chunks(chunks, "foo")) == [(0, 0, 3), (1, 3, 6), (3, 2, 5)]
+
+
+def test_pattern_spanning_line_breaks():
+    lines = ["hello wor", "ld and", "more"]
+
+    found = list(search_chunks(line_chunks(lines), "wor\nld"))
+
+    assert found == [(0, 6, 9), (1, 0, 2)]
+
+
+def test_empty_pattern_finds_nothing():
+    assert list(search_chunks(["abc"], "")) == []
+
+
+def test_typed_escapes_decode_to_line_breaks():
+    assert decode_pattern(r"end\ndef") == "end\ndef"
+    assert decode_pattern(r"a\\nb") == "a\\nb"
+    assert decode_pattern(r"C:\temp") == r"C:\temp"
+    chunks = line_chunks([list("x = 1"), list("def f():")])
+    assert list(search_chunks(chunks, decode_pattern(r"1\ndef"))) == [(0, 4, 5), (1, 0, 3)]
@@ -0,0 +1,51 @@
+import os
+
+import buffer_op
+import workspace
+
+
+def test_switching_keeps_cursor_and_undo_history(make_doc):
+    a = make_doc("alpha\n", "a.txt")
+    b = make_doc("beta\n", "b.txt")
+    workspace.open_document(a)
+    buffer_op.apply_op({"kind": "insert_char", "row": 0, "col": 5, "ch": "!"})
+    doc_a = buffer_op.current
+
+    workspace.open_document(b)
+    assert buffer_op.buffer == [list("beta")]
+    assert workspace.paths() == [os.path.abspath(b), os.path.abspath(a)]
+
+    workspace.switch(a)
+    assert buffer_op.current is doc_a
+    assert (buffer_op.row, buffer_op.col) == (0, 6)
+    buffer_op.undo()
+    assert buffer_op.buffer == [list("alpha")]
+
+
+def test_over_budget_documents_are_spilled_and_restored(monkeypatch, make_doc):
+    monkeypatch.setattr(workspace, "MEMORY_BUDGET", 0)
+    a = make_doc("one\ntwo\nthree\n", "a.txt")
+    b = make_doc("x\n", "b.txt")
+    workspace.open_document(a)
+    buffer_op.apply_op({"kind": "split_line", "row": 1, "col": 1})
+    buffer_op.search_all("o")
+    before = [line[:] for line in buffer_op.buffer]
+    cursor = (buffer_op.row, buffer_op.col)
+    matches = list(buffer_op.matches)
+
+    workspace.open_document(b)
+    # The background document went to disk; the current one never does.
+    assert workspace.is_spilled(a)
+    assert not workspace.is_spilled(b)
+
+    # Changing the original file shows it is not re-read on restore.
+    with open(a, "w") as f:
+        f.write("changed\n")
+    workspace.switch(a)
+    assert workspace.is_spilled(b)
+    assert buffer_op.buffer == before
+    assert (buffer_op.row, buffer_op.col) == cursor
+    assert list(buffer_op.matches) == matches
+
+    buffer_op.undo()
+    assert buffer_op.buffer == [list("one"), list("two"), list("three")]
@@ -0,0 +1,91 @@
+import random
+
+import buffer_op
+import wrap_index
+from wrap_index import WrapIndex
+
+
+class Key:
+    def __init__(self, name):
+        self.name = name
+
+
+def layout(lengths, width):
+    """Brute force (row, part) of every visual line."""
+    return [(r, p) for r, n in enumerate(lengths)
+            for p in range(max(1, -(-n // width)))]
+
+
+def test_index_tracks_edits_like_a_full_rebuild(monkeypatch):
+    monkeypatch.setattr(wrap_index, "BLOCK_SIZE", 4)
+    rng = random.Random(3)
+    lengths = [rng.randrange(40) for _ in range(50)]
+    index = WrapIndex(10, lengths)
+
+    for _ in range(300):
+        first = rng.randrange(len(lengths))
+        last = min(first + rng.randrange(3), len(lengths) - 1)
+        new = [rng.randrange(40) for _ in range(rng.randrange(1, 4))]
+        if len(lengths) - (last - first + 1) + len(new) < 1:
+            continue
+        lengths[first:last + 1] = new
+        delta = len(new) - (last - first + 1)
+        index.rows_changed(first, last, delta, lengths.__getitem__)
+
+        visual = layout(lengths, 10)
+        assert index.total == len(visual)
+        for v in rng.sample(range(len(visual)), min(10, len(visual))):
+            row, part = visual[v]
+            assert index.row_at(v) == (row, part)
+            assert index.visual_of(row) == v - part
+
+
+def test_wrapped_viewport_scrolls_and_pages_by_visual_lines(monkeypatch):
+    monkeypatch.setattr(buffer_op, "MAX_COL", 10)
+    monkeypatch.setattr(buffer_op, "MAX_LINE", 4)
+    buffer_op.buffer = [list("a" * 35), list("bbb"), list("c" * 20), list("d")]
+    buffer_op.set_wrap(True)
+    try:
+        assert [s for s in buffer_op.visible_segments()] == [
+            (0, 0, 10), (0, 10, 20), (0, 20, 30), (0, 30, 40)]
+
+        buffer_op.col = 13
+        buffer_op.handle_arrow_keys(Key("down"))
+        assert (buffer_op.row, buffer_op.col) == (0, 23)
+        assert buffer_op.cursor_screen_pos() == (3, 4)
+
+        buffer_op.page_down()
+        # Four screen lines down: past "bbb" into the second part of row 2.
+        assert (buffer_op.row, buffer_op.col) == (2, 13)
+        assert (buffer_op.top_line, buffer_op.top_wrap) == (0, 3)
+        assert buffer_op.visible_segments()[0] == (0, 30, 40)
+        assert buffer_op.cursor_screen_pos() == (4, 4)
+
+        # An edit re-wraps only its row; the layout follows.
+        buffer_op.type_text("x" * 10)
+        assert buffer_op.wrap.total == 4 + 1 + 3 + 1
+        assert buffer_op.visible_segments()[-1] == (2, 20, 30)
+
+        buffer_op.page_up()
+        assert buffer_op.row == 0
+        assert buffer_op.top_line == 0
+        assert buffer_op.left_col == 0
+    finally:
+        buffer_op.set_wrap(False)
+
+
+def test_home_and_end_scroll_a_long_wrapped_row(monkeypatch):
+    monkeypatch.setattr(buffer_op, "MAX_COL", 10)
+    monkeypatch.setattr(buffer_op, "MAX_LINE", 4)
+    buffer_op.buffer = [list("a" * 95), list("b")]
+    buffer_op.set_wrap(True)
+    try:
+        buffer_op.go_line_end()
+        assert (buffer_op.top_line, buffer_op.top_wrap) == (0, 6)
+        assert buffer_op.cursor_screen_pos() == (4, 6)
+
+        buffer_op.go_line_home()
+        assert (buffer_op.top_line, buffer_op.top_wrap) == (0, 0)
+        assert buffer_op.cursor_screen_pos() == (1, 1)
+    finally:
+        buffer_op.set_wrap(False)
@@ -0,0 +1,108 @@
+# text_search.py
+# Substring search over the editor buffer.
+#
+# The heavy lifting is done by str.find, which CPython implements in C with
+# a Boyer-Moore-Horspool style skip search (two-way for long needles), so a
+# scan costs roughly one pass over the text instead of one slice comparison
+# per index. The buffer is searched as a stream of text chunks with the rows
+# separated by '\n', which lets a pattern containing '\n' match across line
+# breaks. Matches are reported as the usual (row, start, end) tuples.
+# Search prompts are single-line, so decode_pattern() reads a typed \n
+# (backslash, n) there as a line break.
+
+import re
+
+# Rows batched into a single chunk when streaming a list-of-lines buffer.
+ROWS_PER_CHUNK = 4096
+
+
+def find_all(text, pattern, start=0, end=None):
+    """Yield every (possibly overlapping) index of pattern in text[start:end]."""
+    if end is None:
+        end = len(text)
+    i = text.find(pattern, start, end)
+    while i != -1:
+        yield i
+        i = text.find(pattern, i + 1, end)
+
+
+def decode_pattern(typed):
+    """
+    A pattern as typed at a one-line prompt: '\\n' stands for a line
+    break and '\\\\' for a backslash. Other backslashes are kept as they are.
+    """
+    return re.sub(r"\\([n\\])", lambda m: "\n" if m.group(1) == "n" else "\\", typed)
+
+
+def line_chunks(lines):
+    """
+    Turn an iterable of rows (strings or char lists) into '\\n'-joined chunks.
+    """
+    batch = []
+    first = True
+    for line in lines:
+        batch.append(line if isinstance(line, str) else "".join(line))
+        if len(batch) == ROWS_PER_CHUNK:
+            chunk = "\n".join(batch)
+            yield chunk if first else "\n" + chunk
+            first = False
+            batch = []
+    if batch or first:
+        chunk = "\n".join(batch)
+        yield chunk if first else "\n" + chunk
+
+
+def _segments(row, col, parts):
+    """
+    Split one match into per-row (row, start, end) tuples.
+    parts is the pattern split on '\\n'; empty pieces are skipped.
+    """
+    if parts[0]:
+        yield (row, col, col + len(parts[0]))
+    for k in range(1, len(parts)):
+        if parts[k]:
+            yield (row + k, 0, len(parts[k]))
+
+
+def search_chunks(chunks, pattern):
+    """
+    Yield (row, start, end) for every occurrence of pattern in the text
+    formed by concatenating chunks. A match spanning line breaks yields
+    one tuple per row it touches.
+    """
+    if not pattern:
+        return
+
+    plen = len(pattern)
+    keep = plen - 1
+    parts = pattern.split("\n")
+
+    row = 0
+    row_start = 0   # absolute offset where `row` begins
+    counted = 0     # absolute offset up to which newlines have been counted
+    base = 0        # absolute offset of block[0]
+    tail = ""       # last plen-1 chars, so matches across chunks are found
+
+    for chunk in chunks:
+        block = tail + chunk if tail else chunk
+
+        for i in find_all(block, pattern):
+            local = counted - base
+            nl = block.count("\n", local, i)
+            if nl:
+                row += nl
+                row_start = base + block.rfind("\n", local, i) + 1
+            counted = base + i
+            yield from _segments(row, counted - row_start, parts)
+
+        # Everything before `cut` is done; count its newlines and drop it.
+        cut = max(len(block) - keep, 0)
+        local = counted - base
+        if cut > local:
+            nl = block.count("\n", local, cut)
+            if nl:
+                row += nl
+                row_start = base + block.rfind("\n", local, cut) + 1
+            counted = base + cut
+        tail = block[cut:]
+        base += cut
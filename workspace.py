@@ -0,0 +1,250 @@
+# workspace.py
+# The list of open documents.
+#
+# Every open file has its own buffer_op.Document (text, cursor, viewport,
+# undo history, journal, swap file), so switching between files is just making
+# another document current. Documents are kept in least-recently-used
+# order. When the documents in the background take more than
+# MEMORY_BUDGET bytes, the least recently used ones are spilled: their
+# state is pickled, zlib-compressed, written to a temp folder and dropped
+# from memory. Switching back to a spilled document restores it from that
+# snapshot, cursor and undo history included, without reading or parsing
+# the original file again.
+
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+from collections import OrderedDict
+
+import buffer_op
+import journal
+import swap_file
+import syntax
+from mapped_file import MappedLines
+from piece_table import PieceTable
+
+# Memory the background documents may use before the oldest are spilled.
+MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Rough bytes per character of a list-of-chars row, and per row.
+LIST_CHAR_BYTES = 8
+LIST_ROW_BYTES = 64
+
+# Document fields saved in a snapshot as they are.
+SNAPSHOT_FIELDS = ("row", "col", "top_line", "top_wrap", "left_col", "undo_stack",
+                   "redo_stack", "undo_bytes", "history")
+
+
+class _Entry:
+    __slots__ = ("path", "doc", "spill_path")
+
+    def __init__(self, path, doc):
+        self.path = path
+        self.doc = doc
+        self.spill_path = None
+
+
+# path -> _Entry, least recently used first.
+entries = OrderedDict()
+
+# Folder holding spilled snapshots, created on first use.
+_spill_dir = None
+
+
+def document_bytes(doc):
+    """Approximate memory held by a document's buffer and undo history."""
+    buffer = doc.buffer
+    if isinstance(buffer, list):
+        chars = sum(map(len, buffer))
+        size = chars * LIST_CHAR_BYTES + len(buffer) * LIST_ROW_BYTES
+    elif isinstance(buffer, PieceTable):
+        size = buffer.size() * 2
+    else:
+        # Mapped files live in the page cache, not in the process.
+        size = 0
+    return size + doc.undo_bytes
+
+
+# ---- open / switch / close ----
+
+def current_path():
+    """Path of the current document, or None if it is not in the workspace."""
+    for path, entry in entries.items():
+        if entry.doc is buffer_op.current:
+            return path
+    return None
+
+
+def add(path, doc):
+    """Register doc under path and make it current."""
+    entries[path] = _Entry(path, doc)
+    entries.move_to_end(path)
+    buffer_op.use(doc)
+    enforce_budget()
+
+
+def open_document(path):
+    """
+    Make the document for path current, loading it on first use.
+    Returns the number of edits recovered from a crash journal.
+    """
+    path = os.path.abspath(path)
+    if path in entries:
+        switch(path)
+        return 0
+
+    doc = buffer_op.Document()
+    buffer_op.use(doc)
+    doc.load_file(path)
+    recovered = journal.start(path)
+    swap_file.start(path, dirty=bool(recovered))
+    add(path, doc)
+    return recovered
+
+
+def switch(path):
+    """Make an already open document current, restoring it if spilled."""
+    path = os.path.abspath(path)
+    entry = entries[path]
+    if entry.doc is None:
+        entry.doc = _restore(entry)
+    entries.move_to_end(path)
+    buffer_op.use(entry.doc)
+    enforce_budget()
+    return entry.doc
+
+
+def close(path):
+    """Forget a document, deleting its snapshot and stopping its journal and swap file."""
+    path = os.path.abspath(path)
+    entry = entries.pop(path)
+    doc = entry.doc
+    if doc is not None:
+        doc.cancel_search()
+        if doc.journal is not None:
+            doc.journal.close()
+            doc.journal = None
+        if doc.swap is not None:
+            doc.swap.close()
+            doc.swap = None
+        doc.release_buffer()
+    _drop_snapshot(entry)
+
+
+def paths():
+    """Open documents, most recently used first."""
+    return list(reversed(entries))
+
+
+def documents():
+    """Documents held in memory, the current one included."""
+    docs = [e.doc for e in entries.values() if e.doc is not None]
+    if buffer_op.current not in docs:
+        docs.append(buffer_op.current)
+    return docs
+
+
+def is_spilled(path):
+    return entries[os.path.abspath(path)].doc is None
+
+
+# ---- eviction ----
+
+def enforce_budget():
+    """Spill least recently used background documents while over budget."""
+    resident = [e for e in entries.values()
+                if e.doc is not None and e.doc is not buffer_op.current]
+    total = sum(document_bytes(e.doc) for e in resident)
+    for entry in resident:
+        if total <= MEMORY_BUDGET:
+            break
+        size = document_bytes(entry.doc)
+        if size and _spill(entry):
+            total -= size
+
+
+def _spill(entry):
+    """Write a document's state to a snapshot and drop it from memory."""
+    global _spill_dir
+    doc = entry.doc
+    if isinstance(doc.buffer, MappedLines):
+        return False
+
+    with doc.lock:
+        doc.cancel_search()
+        state = {name: getattr(doc, name) for name in SNAPSHOT_FIELDS}
+        state["engine"] = "lines" if isinstance(doc.buffer, list) else "piece_table"
+        if isinstance(doc.buffer, list):
+            state["text"] = "\n".join("".join(line) for line in doc.buffer)
+        else:
+            state["text"] = doc.buffer.text()
+        state["pattern"] = doc.matches.pattern
+        state["matches"] = list(doc.matches)
+        state["journaled"] = doc.journal is not None
+        # Changes not autosaved yet go to the swap file before the
+        # document leaves memory; its tracking does not survive the spill.
+        swap_file.autosave(doc)
+        state["swapped"] = doc.swap is not None and doc.swap.created
+
+        if _spill_dir is None:
+            _spill_dir = tempfile.mkdtemp(prefix="editor-spill-")
+        if entry.spill_path is None:
+            fd, entry.spill_path = tempfile.mkstemp(dir=_spill_dir, suffix=".snap")
+            os.close(fd)
+        with open(entry.spill_path, "wb") as f:
+            f.write(zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1))
+
+        if doc.journal is not None:
+            doc.journal.close()
+            doc.journal = None
+        if doc.swap is not None:
+            doc.swap.close()
+            doc.swap = None
+    entry.doc = None
+    return True
+
+
+def _restore(entry):
+    """Rebuild a spilled document from its snapshot."""
+    with open(entry.spill_path, "rb") as f:
+        state = pickle.loads(zlib.decompress(f.read()))
+    _drop_snapshot(entry)
+
+    doc = buffer_op.Document()
+    text = state.pop("text")
+    if state.pop("engine") == "lines":
+        doc.buffer = [list(line) for line in text.split("\n")]
+    else:
+        doc.buffer = PieceTable(text)
+    doc.matches.reset(state.pop("pattern"), state.pop("matches"))
+    doc.syntax = syntax.for_path(entry.path)
+    if state.pop("journaled"):
+        # Keeps appending to the journal the document had before.
+        doc.journal = journal.Journal(entry.path).open(fresh=False)
+    doc.swap = swap_file.SwapFile(entry.path)
+    if state.pop("swapped"):
+        doc.swap.adopt()
+    for name, value in state.items():
+        setattr(doc, name, value)
+    return doc
+
+
+def _drop_snapshot(entry):
+    if entry.spill_path is not None:
+        try:
+            os.remove(entry.spill_path)
+        except OSError:
+            pass
+        entry.spill_path = None
+
+
+def close_all():
+    """Close every document and remove the spill folder."""
+    global _spill_dir
+    for path in list(entries):
+        close(path)
+    if _spill_dir is not None:
+        shutil.rmtree(_spill_dir, ignore_errors=True)
+        _spill_dir = None
@@ -0,0 +1,161 @@
+# wrap_index.py
+# Soft-wrap layout: which visual (screen) lines each buffer row takes.
+#
+# A row of n characters wrapped at `width` columns takes max(1, ceil(n /
+# width)) visual lines. WrapIndex keeps those counts split into blocks of
+# a few hundred rows, like match_index.py does for matches. Each block
+# knows its total, and two prefix sums are cached and rebuilt only when
+# stale: the first visual line of every block, and the running counts
+# inside a block. Turning a row into its visual line (or back) is then
+# two bisects, O(log n), no matter how long the file is.
+#
+# An edit re-measures only the rows it rewrote. If their line counts did
+# not change (the usual keystroke), no cache is touched at all; otherwise
+# only the edited block's prefix sums and the per-block starts (one entry
+# per block) are rebuilt on the next lookup.
+
+from bisect import bisect_right
+from itertools import accumulate
+
+# Target number of rows per block.
+BLOCK_SIZE = 512
+
+
+class _Block:
+    __slots__ = ("heights", "total", "prefix")
+
+    def __init__(self, heights):
+        self.heights = heights
+        self.total = sum(heights)
+        # Visual lines before each row of the block, built on demand.
+        self.prefix = None
+
+    def running(self):
+        if self.prefix is None:
+            self.prefix = list(accumulate(self.heights, initial=0))
+        return self.prefix
+
+
+class WrapIndex:
+    """Visual line counts of the buffer rows, for one wrap width."""
+
+    def __init__(self, width, lengths):
+        """lengths: the length of every buffer row, in order."""
+        self.width = width
+        heights = [(n - 1) // width + 1 if n else 1 for n in lengths] or [1]
+        self._blocks = [_Block(heights[i:i + BLOCK_SIZE])
+                        for i in range(0, len(heights), BLOCK_SIZE)]
+        self.total = sum(heights)
+        self._starts = None
+        self._first_rows = None
+
+    def height(self, length):
+        """Visual lines taken by a row of the given length."""
+        return (length - 1) // self.width + 1 if length else 1
+
+    # ---- cached prefix sums ----
+
+    def _rebuild(self):
+        blocks = self._blocks
+        self._starts = list(accumulate((b.total for b in blocks), initial=0))
+        self._first_rows = list(accumulate((len(b.heights) for b in blocks), initial=0))
+
+    def _locate(self, row):
+        """(block index, index in block) of a buffer row."""
+        if self._first_rows is None:
+            self._rebuild()
+        b = bisect_right(self._first_rows, row) - 1
+        b = max(0, min(b, len(self._blocks) - 1))
+        return b, row - self._first_rows[b]
+
+    # ---- queries ----
+
+    def visual_of(self, row):
+        """Index of the first visual line of a buffer row."""
+        b, i = self._locate(row)
+        i = min(i, len(self._blocks[b].heights))
+        return self._starts[b] + self._blocks[b].running()[i]
+
+    def row_height(self, row):
+        b, i = self._locate(row)
+        return self._blocks[b].heights[i]
+
+    def row_at(self, visual):
+        """(row, visual line within that row) shown on a visual line."""
+        if self._first_rows is None:
+            self._rebuild()
+        visual = max(0, min(visual, self.total - 1))
+        b = bisect_right(self._starts, visual) - 1
+        b = min(b, len(self._blocks) - 1)
+        running = self._blocks[b].running()
+        offset = visual - self._starts[b]
+        i = bisect_right(running, offset) - 1
+        i = min(i, len(self._blocks[b].heights) - 1)
+        return self._first_rows[b] + i, offset - running[i]
+
+    # ---- incremental update ----
+
+    def rows_changed(self, first, last, delta, line_length):
+        """
+        Rows [first, last] were rewritten and every later row moved by
+        delta; re-measure the rewritten rows with line_length(row).
+        """
+        old = last - first + 1
+        new = old + delta
+        height = self.height
+        heights = [height(line_length(r)) for r in range(first, first + new)]
+
+        if delta == 0:
+            for k, h in enumerate(heights):
+                self._set(first + k, h)
+            return
+
+        keep = min(old, new)
+        for k in range(keep):
+            self._set(first + k, heights[k])
+        if delta > 0:
+            self._insert(first + keep, heights[keep:])
+        else:
+            self._delete(first + keep, -delta)
+
+    def _set(self, row, h):
+        b, i = self._locate(row)
+        block = self._blocks[b]
+        d = h - block.heights[i]
+        if d:
+            block.heights[i] = h
+            block.total += d
+            block.prefix = None
+            self.total += d
+            self._starts = self._first_rows = None
+
+    def _insert(self, row, heights):
+        b, i = self._locate(row)
+        block = self._blocks[b]
+        block.heights[i:i] = heights
+        added = sum(heights)
+        block.total += added
+        block.prefix = None
+        self.total += added
+        if len(block.heights) > 2 * BLOCK_SIZE:
+            hs = block.heights
+            self._blocks[b:b + 1] = [_Block(hs[j:j + BLOCK_SIZE])
+                                     for j in range(0, len(hs), BLOCK_SIZE)]
+        self._starts = self._first_rows = None
+
+    def _delete(self, row, count):
+        while count:
+            b, i = self._locate(row)
+            block = self._blocks[b]
+            gone = block.heights[i:i + count]
+            if not gone:
+                break
+            del block.heights[i:i + count]
+            removed = sum(gone)
+            block.total -= removed
+            block.prefix = None
+            self.total -= removed
+            count -= len(gone)
+            if not block.heights and len(self._blocks) > 1:
+                del self._blocks[b]
+            self._starts = self._first_rows = None